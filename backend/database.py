@@ -1,7 +1,21 @@
 import os
-from supabase import create_client, Client
+import asyncio
+import threading
+import time
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as time_type
+from supabase import create_client, Client, acreate_client, AsyncClient, AsyncClientOptions
 from dotenv import load_dotenv
 
+from metrics import InstrumentedClient, observe_query, record_call, sql_labels
+
+# Optional direct Postgres driver for the hot read paths
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -10,23 +24,264 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
+# Connection pool for the async PostgREST client
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "100"))
+SUPABASE_HTTP_MAX_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", "20"))
+SUPABASE_HTTP_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_HTTP_TIMEOUT_SECONDS", "30"))
+
+# Thread pool for blocking supabase calls (GoTrue auth, sync execute())
+BLOCKING_MAX_WORKERS = int(os.getenv("SUPABASE_BLOCKING_MAX_WORKERS", "16"))
+BLOCKING_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_BLOCKING_TIMEOUT_SECONDS", "30"))
+
+# Data backend for table queries: "supabase" (default) or "local" (SQLite stand-in
+# from services/local_store.py, for offline benchmarks and profiling)
+DATA_BACKEND = os.getenv("DATA_BACKEND", "supabase").lower()
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", ":memory:")
+LOCAL_DB_FIXTURES = os.getenv("LOCAL_DB_FIXTURES")
+
+# Direct Postgres connection (optional). When unset, every query goes through PostgREST.
+# Use statement cache size 0 behind a transaction-mode pooler (pgbouncer / Supavisor :6543).
+DATABASE_URL = os.getenv("SUPABASE_DB_URL") or os.getenv("DATABASE_URL")
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+PG_STATEMENT_CACHE_SIZE = int(os.getenv("PG_STATEMENT_CACHE_SIZE", "100"))
+
+if DATA_BACKEND not in ("supabase", "local"):
+    raise ValueError("DATA_BACKEND must be 'supabase' or 'local'")
+
+if DATA_BACKEND == "supabase" and (not SUPABASE_URL or not SUPABASE_KEY):
     raise ValueError("SUPABASE_URL and SUPABASE_KEY (or SUPABASE_SERVICE_ROLE_KEY) must be set in environment variables")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# With the local backend the Supabase clients are only used for auth, and only if configured
+supabase: Client | None = None
 supabase_admin: Client | None = None
+local_store = None
+
+if SUPABASE_URL and SUPABASE_KEY:
+    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
     supabase_admin = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
+# Async clients are created lazily on the running event loop
+async_supabase: AsyncClient | None = None
+async_supabase_admin: AsyncClient | None = None
+_async_http_client: httpx.AsyncClient | None = None
+_async_client_lock = asyncio.Lock()
+
+_pg_pool = None
+_pg_pool_lock = asyncio.Lock()
+
+_blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_MAX_WORKERS, thread_name_prefix="supabase-blocking")
+_blocking_stats_lock = threading.Lock()
+_blocking_stats = {
+    "queued": 0,
+    "running": 0,
+    "max_queue_depth": 0,
+    "completed": 0,
+    "failed": 0,
+    "timed_out": 0,
+}
+
 
 def get_supabase() -> Client:
     """Get Supabase client instance"""
+    if supabase is None:
+        raise ValueError("SUPABASE_URL and SUPABASE_KEY are required for auth operations")
     return supabase
 
 
+def get_local_store():
+    """Get the SQLite stand-in used when DATA_BACKEND=local."""
+    global local_store
+    if local_store is None:
+        from services.local_store import LocalStore
+
+        store = LocalStore(LOCAL_DB_PATH)
+        if LOCAL_DB_FIXTURES:
+            store.load_fixtures(LOCAL_DB_FIXTURES)
+        local_store = InstrumentedClient(store)
+    return local_store
+
+
 def get_supabase_admin() -> Client:
     """Get Supabase admin client (requires SUPABASE_SERVICE_ROLE_KEY)."""
     if supabase_admin is None:
         raise ValueError("SUPABASE_SERVICE_ROLE_KEY is required for admin auth operations")
     return supabase_admin
+
+
+def _blocking_stat(**changes):
+    with _blocking_stats_lock:
+        for key, delta in changes.items():
+            _blocking_stats[key] += delta
+        _blocking_stats["max_queue_depth"] = max(_blocking_stats["max_queue_depth"], _blocking_stats["queued"])
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking supabase call off the event loop, e.g.
+    `await run_blocking(supabase.auth.get_user, token)`.
+    Calls share a bounded thread pool (SUPABASE_BLOCKING_MAX_WORKERS) and fail
+    with TimeoutError after SUPABASE_BLOCKING_TIMEOUT_SECONDS.
+    """
+    def _call():
+        _blocking_stat(queued=-1, running=1)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _blocking_stat(running=-1)
+
+    _blocking_stat(queued=1)
+    future = _blocking_executor.submit(_call)
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=BLOCKING_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        # A queued call is dropped; a running one finishes in its thread but is ignored.
+        if future.cancel():
+            _blocking_stat(queued=-1)
+        _blocking_stat(timed_out=1)
+        name = getattr(func, "__qualname__", repr(func))
+        raise TimeoutError(f"Supabase call {name} timed out after {BLOCKING_TIMEOUT_SECONDS:g}s")
+    except asyncio.CancelledError:
+        if future.cancel():
+            _blocking_stat(queued=-1)
+        raise
+    except Exception:
+        _blocking_stat(failed=1)
+        raise
+    finally:
+        # Blocking calls are GoTrue auth round trips; count them against the request budget
+        record_call("auth", time.perf_counter() - started)
+    _blocking_stat(completed=1)
+    return result
+
+
+def get_blocking_stats() -> dict:
+    """Queue depth and outcome counters of the blocking-call pool."""
+    with _blocking_stats_lock:
+        return {
+            "max_workers": BLOCKING_MAX_WORKERS,
+            "timeout_seconds": BLOCKING_TIMEOUT_SECONDS,
+            **_blocking_stats,
+        }
+
+
+def _get_async_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive HTTP/2 connection pool for the async clients."""
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            timeout=SUPABASE_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _async_http_client
+
+
+async def _create_async_client(key: str) -> AsyncClient:
+    client = await acreate_client(
+        SUPABASE_URL,
+        key,
+        options=AsyncClientOptions(httpx_client=_get_async_http_client()),
+    )
+    # Time every table query for /api/metrics
+    return InstrumentedClient(client)
+
+
+async def get_async_supabase() -> AsyncClient:
+    """
+    Get the async Supabase client for table queries (`await ....execute()`).
+    Auth (GoTrue) calls stay on the sync client from get_supabase().
+    """
+    global async_supabase
+    if DATA_BACKEND == "local":
+        return get_local_store()
+    if async_supabase is None:
+        async with _async_client_lock:
+            if async_supabase is None:
+                async_supabase = await _create_async_client(SUPABASE_KEY)
+    return async_supabase
+
+
+def supports_rpc() -> bool:
+    """Whether the data backend can call the schema.sql database functions (the local store has none)."""
+    return DATA_BACKEND != "local"
+
+
+async def get_async_supabase_admin() -> AsyncClient:
+    """Get the async Supabase client using the service role key."""
+    global async_supabase_admin
+    if DATA_BACKEND == "local":
+        return get_local_store()
+    if not SUPABASE_SERVICE_ROLE_KEY:
+        raise ValueError("SUPABASE_SERVICE_ROLE_KEY is required for admin auth operations")
+    if async_supabase_admin is None:
+        async with _async_client_lock:
+            if async_supabase_admin is None:
+                async_supabase_admin = await _create_async_client(SUPABASE_SERVICE_ROLE_KEY)
+    return async_supabase_admin
+
+
+async def get_pg_pool():
+    """
+    Get the asyncpg connection pool, or None when no DATABASE_URL is configured
+    (or asyncpg is not installed). Callers fall back to PostgREST on None.
+    """
+    global _pg_pool
+    if DATA_BACKEND == "local" or not DATABASE_URL or asyncpg is None:
+        return None
+    if _pg_pool is None:
+        async with _pg_pool_lock:
+            if _pg_pool is None:
+                _pg_pool = await asyncpg.create_pool(
+                    DATABASE_URL,
+                    min_size=PG_POOL_MIN_SIZE,
+                    max_size=PG_POOL_MAX_SIZE,
+                    statement_cache_size=PG_STATEMENT_CACHE_SIZE,
+                )
+    return _pg_pool
+
+
+def _pg_value(value):
+    # Match the JSON shapes PostgREST returns so callers can use either backend
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (date, time_type)):
+        return value.isoformat()
+    return value
+
+
+async def pg_fetch(query: str, *args) -> list[dict]:
+    """
+    Run a query on the direct Postgres pool and return rows as dicts.
+    asyncpg prepares and caches each statement per connection.
+    """
+    pool = await get_pg_pool()
+    table, operation = sql_labels(query)
+    started = time.perf_counter()
+    try:
+        rows = await pool.fetch(query, *args)
+    except Exception:
+        observe_query(table, operation, "sql", None, time.perf_counter() - started, failed=True)
+        raise
+    observe_query(table, operation, "sql", len(rows), time.perf_counter() - started)
+    return [{key: _pg_value(value) for key, value in row.items()} for row in rows]
+
+
+async def close_async_supabase():
+    """Close the shared async connection pools (called on app shutdown)."""
+    global async_supabase, async_supabase_admin, _async_http_client, _pg_pool
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+    if _pg_pool is not None:
+        await _pg_pool.close()
+    _pg_pool = None
+    async_supabase = None
+    async_supabase_admin = None
+    _async_http_client = None
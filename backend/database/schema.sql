@@ -40,6 +40,8 @@ CREATE TABLE IF NOT EXISTS substitute_requests (
     notes TEXT,
     status VARCHAR(20) DEFAULT 'pending',
     accepted_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    start_time TIME, -- Derived from time/duration by trigger, for indexed overlap checks
+    end_time TIME,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW()),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW())
 );
@@ -161,6 +163,13 @@ BEGIN
         ALTER TABLE teacher_class_schedules ADD COLUMN slot_date DATE;
     END IF;
 
+    -- Add derived time window columns to substitute_requests if they don't exist
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'substitute_requests' AND column_name = 'start_time') THEN
+        ALTER TABLE substitute_requests ADD COLUMN start_time TIME;
+        ALTER TABLE substitute_requests ADD COLUMN end_time TIME;
+    END IF;
+
     -- Backfill slot_date for existing substitute schedule rows where possible.
     IF EXISTS (SELECT 1 FROM information_schema.columns
                WHERE table_name = 'teacher_class_schedules' AND column_name = 'substitute_request_id')
@@ -188,10 +197,13 @@ CREATE INDEX IF NOT EXISTS idx_users_push_token ON users(push_token);
 CREATE INDEX IF NOT EXISTS idx_requests_status ON substitute_requests(status);
 CREATE INDEX IF NOT EXISTS idx_requests_teacher ON substitute_requests(teacher_id);
 CREATE INDEX IF NOT EXISTS idx_requests_date ON substitute_requests(date);
+CREATE INDEX IF NOT EXISTS idx_requests_updated_at ON substitute_requests(updated_at, id);
 CREATE INDEX IF NOT EXISTS idx_teacher_schedule_teacher ON teacher_class_schedules(teacher_id);
 CREATE INDEX IF NOT EXISTS idx_teacher_schedule_day ON teacher_class_schedules(day_of_week);
 CREATE INDEX IF NOT EXISTS idx_teacher_schedule_window ON teacher_class_schedules(start_time, end_time);
 CREATE INDEX IF NOT EXISTS idx_teacher_schedule_slot_date ON teacher_class_schedules(slot_date);
+CREATE INDEX IF NOT EXISTS idx_teacher_schedule_day_window ON teacher_class_schedules(day_of_week, start_time, end_time);
+CREATE INDEX IF NOT EXISTS idx_requests_accepted_window ON substitute_requests(accepted_by, date, start_time, end_time) WHERE status = 'accepted';
 
 -- =============================================
 -- ROW LEVEL SECURITY (RLS)
@@ -240,6 +252,245 @@ CREATE TRIGGER update_teacher_class_schedules_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
+-- =============================================
+-- TRIGGER FOR substitute_requests time window
+-- =============================================
+
+-- Keeps start_time/end_time in step with the free-text time ("10:00 AM") and duration
+CREATE OR REPLACE FUNCTION set_request_time_window()
+RETURNS TRIGGER AS $$
+BEGIN
+    BEGIN
+        NEW.start_time = NEW.time::TIME;
+        NEW.end_time = NEW.start_time + MAKE_INTERVAL(mins => NEW.duration);
+    EXCEPTION
+        WHEN others THEN
+            NEW.start_time = NULL;
+            NEW.end_time = NULL;
+    END;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS set_substitute_requests_time_window ON substitute_requests;
+CREATE TRIGGER set_substitute_requests_time_window
+    BEFORE INSERT OR UPDATE OF time, duration ON substitute_requests
+    FOR EACH ROW
+    EXECUTE FUNCTION set_request_time_window();
+
+-- Backfill rows written before the trigger existed
+UPDATE substitute_requests
+SET time = time
+WHERE start_time IS NULL;
+
+-- =============================================
+-- FREE FACULTY LOOKUP
+-- =============================================
+
+-- Faculty with no class and no accepted substitute duty overlapping
+-- [p_start, p_end) on p_date. Weekly slots match on weekday, one-off slots
+-- (slot_date set) only on their own date. Called by the API through RPC.
+CREATE OR REPLACE FUNCTION get_free_faculty_ids(
+    p_date DATE,
+    p_start TIME,
+    p_end TIME,
+    p_exclude_user_id INTEGER DEFAULT NULL
+)
+RETURNS TABLE (faculty_id INTEGER) AS $$
+    SELECT u.id
+    FROM users u
+    WHERE u.id IS DISTINCT FROM p_exclude_user_id
+      AND NOT EXISTS (
+          SELECT 1 FROM teacher_class_schedules s
+          WHERE s.teacher_id = u.id
+            AND s.day_of_week = EXTRACT(ISODOW FROM p_date)::INTEGER - 1
+            AND (s.slot_date IS NULL OR s.slot_date = p_date)
+            AND s.start_time < p_end
+            AND s.end_time > p_start
+      )
+      AND NOT EXISTS (
+          SELECT 1 FROM substitute_requests r
+          WHERE r.accepted_by = u.id
+            AND r.status = 'accepted'
+            AND r.date = p_date
+            AND r.start_time < p_end
+            AND r.end_time > p_start
+      );
+$$ LANGUAGE sql STABLE;
+
+-- =============================================
+-- ATOMIC ACCEPT
+-- =============================================
+
+-- Accepts a pending request in one transaction: validates conflicts, flips the
+-- status and adds the acceptor's schedule slot. Returns {"outcome": ...} and, on
+-- success, the updated request, acceptor name and schedule row.
+CREATE OR REPLACE FUNCTION accept_substitute_request(p_request_id INTEGER, p_teacher_id INTEGER)
+RETURNS JSONB AS $$
+DECLARE
+    req substitute_requests%ROWTYPE;
+    slot teacher_class_schedules%ROWTYPE;
+    acceptor_name VARCHAR;
+    request_weekday INTEGER;
+BEGIN
+    -- Serialises accepts by the same teacher, so two overlapping requests cannot both pass the checks
+    SELECT name INTO acceptor_name FROM users WHERE id = p_teacher_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('outcome', 'acceptor_not_found');
+    END IF;
+
+    -- Serialises accepts of the same request
+    SELECT * INTO req FROM substitute_requests WHERE id = p_request_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('outcome', 'not_found');
+    END IF;
+    IF req.status IS DISTINCT FROM 'pending' THEN
+        RETURN jsonb_build_object('outcome', 'not_pending');
+    END IF;
+    IF req.start_time IS NULL OR req.end_time IS NULL THEN
+        RETURN jsonb_build_object('outcome', 'invalid_time');
+    END IF;
+
+    request_weekday := EXTRACT(ISODOW FROM req.date)::INTEGER - 1;
+
+    IF EXISTS (
+        SELECT 1 FROM teacher_class_schedules s
+        WHERE s.teacher_id = p_teacher_id
+          AND s.day_of_week = request_weekday
+          AND (s.slot_date IS NULL OR s.slot_date = req.date)
+          AND s.start_time < req.end_time
+          AND s.end_time > req.start_time
+    ) THEN
+        RETURN jsonb_build_object('outcome', 'schedule_conflict');
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM substitute_requests r
+        WHERE r.accepted_by = p_teacher_id
+          AND r.status = 'accepted'
+          AND r.date = req.date
+          AND r.start_time < req.end_time
+          AND r.end_time > req.start_time
+    ) THEN
+        RETURN jsonb_build_object('outcome', 'accepted_conflict');
+    END IF;
+
+    UPDATE substitute_requests
+    SET status = 'accepted', accepted_by = p_teacher_id
+    WHERE id = p_request_id
+    RETURNING * INTO req;
+
+    INSERT INTO teacher_class_schedules
+        (teacher_id, day_of_week, start_time, end_time, slot_date, subject, classroom, substitute_request_id)
+    VALUES (
+        p_teacher_id,
+        request_weekday,
+        req.start_time,
+        req.end_time,
+        req.date,
+        CASE
+            WHEN req.request_type = 'exam' THEN 'Exam Duty - ' || COALESCE(req.campus, 'Campus TBD')
+            ELSE COALESCE(req.subject, 'Substitute - ' || COALESCE(req.campus, 'TBD'))
+        END,
+        req.classroom,
+        p_request_id
+    )
+    RETURNING * INTO slot;
+
+    RETURN jsonb_build_object(
+        'outcome', 'accepted',
+        'request', to_jsonb(req),
+        'acceptor_name', acceptor_name,
+        'schedule', to_jsonb(slot)
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- =============================================
+-- TOMBSTONES FOR DELETED REQUESTS
+-- =============================================
+
+-- Lets GET /api/requests/changes report deletions; filled by trigger so
+-- cascades and dashboard deletes are covered too
+CREATE TABLE IF NOT EXISTS substitute_request_tombstones (
+    request_id INTEGER PRIMARY KEY,
+    teacher_id INTEGER,
+    accepted_by INTEGER,
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW())
+);
+
+CREATE INDEX IF NOT EXISTS idx_request_tombstones_deleted_at ON substitute_request_tombstones(deleted_at, request_id);
+
+CREATE OR REPLACE FUNCTION record_substitute_request_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO substitute_request_tombstones (request_id, teacher_id, accepted_by, deleted_at)
+    VALUES (OLD.id, OLD.teacher_id, OLD.accepted_by, TIMEZONE('utc', NOW()))
+    ON CONFLICT (request_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN OLD;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS record_substitute_request_tombstone ON substitute_requests;
+CREATE TRIGGER record_substitute_request_tombstone
+    AFTER DELETE ON substitute_requests
+    FOR EACH ROW
+    EXECUTE FUNCTION record_substitute_request_tombstone();
+
+ALTER TABLE substitute_request_tombstones ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations on substitute_request_tombstones" ON substitute_request_tombstones;
+CREATE POLICY "Allow all operations on substitute_request_tombstones" ON substitute_request_tombstones
+    FOR ALL USING (true) WITH CHECK (true);
+
+-- =============================================
+-- NOTIFICATION OUTBOX
+-- =============================================
+
+-- Push notifications waiting to be delivered (services/outbox.py).
+-- 'fanout' rows name an audience and are expanded into one 'push' row per device;
+-- failed pushes are retried with backoff and end up 'dead' after too many attempts,
+-- and a newer notification with the same coalesce_key marks waiting ones 'superseded'.
+-- For rows being sent, next_attempt_at holds the end of the worker's lease.
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(10) NOT NULL DEFAULT 'push' CHECK (kind IN ('push', 'fanout')),
+    audience JSONB,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    push_token TEXT,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    data JSONB,
+    -- The fanout a push was expanded from; one push per fanout and user, so re-expanding is a no-op
+    parent_id BIGINT REFERENCES notification_outbox(id) ON DELETE CASCADE,
+    -- Waiting notifications with the same key (e.g. 'request:42') replace each other
+    coalesce_key VARCHAR(100),
+    status VARCHAR(10) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sending', 'sent', 'dead', 'superseded')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW()),
+    last_error TEXT,
+    ticket_id TEXT,
+    -- Expo receipt of a sent push: 'pending' until checked, then 'ok', 'error' or 'expired'
+    receipt_status VARCHAR(10),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW()),
+    sent_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Workers only ever scan the rows that are still due
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox(next_attempt_at)
+    WHERE status IN ('pending', 'sending');
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_coalesce ON notification_outbox(coalesce_key)
+    WHERE status = 'pending';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notification_outbox_parent ON notification_outbox(parent_id, user_id);
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_receipts ON notification_outbox(sent_at)
+    WHERE receipt_status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_dead ON notification_outbox(id)
+    WHERE status = 'dead';
+
+ALTER TABLE notification_outbox ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations on notification_outbox" ON notification_outbox;
+CREATE POLICY "Allow all operations on notification_outbox" ON notification_outbox
+    FOR ALL USING (true) WITH CHECK (true);
+
 -- =============================================
 -- PENDING INVITES TABLE
 -- =============================================
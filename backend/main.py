@@ -1,12 +1,43 @@
-from fastapi import FastAPI
+import os
+import secrets
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+import metrics
+from database import close_async_supabase
 from routes import auth, requests, users, admin
+from services import dispatch, outbox, push_tokens
+from services.push_notifications import close_push_client
+
+# Optional bearer token required to scrape /api/metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    dispatch.notifications.start()
+    outbox.start()
+    if push_tokens.PUSH_TOKEN_DIRECTORY_ENABLED:
+        # Warm the directory in the background so the first fan-out needs no user query
+        dispatch.notifications.submit("push_token_directory", push_tokens.directory.ensure_loaded, push_tokens.load_users)
+    yield
+    await outbox.stop()
+    # Let queued notifications go out before the connections are closed
+    await dispatch.notifications.drain()
+    await close_push_client()
+    # Release the shared async connection pool
+    await close_async_supabase()
+
 
 app = FastAPI(
     title="Faculty Substitute API",
     description="API for managing faculty substitute requests at KIIT",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware configuration
@@ -16,13 +47,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
 # Include routers
-app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
-app.include_router(requests.router, prefix="/api/requests", tags=["Substitute Requests"])
-app.include_router(users.router, prefix="/api/users", tags=["Users"])
-app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
+for router, prefix, tags in (
+    (auth.router, "/api/auth", ["Authentication"]),
+    (requests.router, "/api/requests", ["Substitute Requests"]),
+    (users.router, "/api/users", ["Users"]),
+    (admin.router, "/api/admin", ["Admin"]),
+):
+    app.include_router(router, prefix=prefix, tags=tags)
+    metrics.register_route_templates(router, prefix)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Time each request, count its db/auth/push round trips against the route's
+    query budget and report them in a Server-Timing header.
+    """
+    stats = metrics.RequestStats(request.scope)
+    token = metrics.current_request.set(stats)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        overrun = metrics.check_request_budget(request.method, stats)
+        # A write has already committed by now; failing it would only invite a duplicate retry
+        if overrun and metrics.QUERY_BUDGET_MODE == "raise" and request.method in metrics.SAFE_METHODS:
+            response = JSONResponse(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                content={"detail": f"Query budget exceeded: {overrun}"},
+            )
+        response.headers["Server-Timing"] = stats.server_timing(time.perf_counter() - started)
+        status_code = response.status_code
+        return response
+    finally:
+        metrics.observe_request(request.method, request.scope, status_code, time.perf_counter() - started)
+        metrics.current_request.reset(token)
 
 
 @app.get("/api/health")
@@ -31,7 +94,20 @@ async def health_check():
     return {"status": "OK", "message": "Faculty Substitute API is running"}
 
 
+@app.get("/api/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(request: Request):
+    """Request and query latency histograms in Prometheus text format"""
+    if METRICS_TOKEN:
+        supplied = request.headers.get("Authorization", "").encode()
+        if not secrets.compare_digest(supplied, f"Bearer {METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
     return {"message": "Welcome to Faculty Substitute API", "docs": "/docs"}
+
+
+metrics.register_route_templates(app)
@@ -0,0 +1,303 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# In-process metrics rendered in Prometheus text format on /api/metrics:
+# request latency per route, and latency / row counts of every table query
+# labelled with the route that issued it.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-request round-trip budget. QUERY_BUDGETS overrides the default per route template,
+# e.g. "/api/requests/{request_id}/accept=8,/api/requests/=6".
+# QUERY_BUDGET_MODE: "log" (default), "raise" (fail the request, for tests) or "off".
+# "raise" only fails reads; over-budget writes are logged, as they have already committed.
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "10"))
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "log").lower()
+QUERY_BUDGETS = {
+    route.strip(): int(budget)
+    for route, _, budget in (
+        item.rpartition("=") for item in os.getenv("QUERY_BUDGETS", "").split(",") if "=" in item
+    )
+}
+# Same query shape repeated this many times in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "3"))
+
+CALL_KINDS = ("db", "auth", "push")
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class RequestStats:
+    """Round trips (db/auth/push) made while handling one request."""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.calls = {kind: 0 for kind in CALL_KINDS}
+        self.seconds = {kind: 0.0 for kind in CALL_KINDS}
+        self.query_shapes: dict = {}
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def record(self, kind: str, seconds: float):
+        self.calls[kind] += 1
+        self.seconds[kind] += seconds
+
+    def repeated_queries(self) -> list[tuple[tuple, int]]:
+        return [(shape, count) for shape, count in self.query_shapes.items() if count >= N_PLUS_ONE_THRESHOLD]
+
+    def server_timing(self, total_seconds: float) -> str:
+        parts = [
+            f'{kind};desc="{self.calls[kind]} calls";dur={self.seconds[kind] * 1000:.1f}'
+            for kind in CALL_KINDS
+            if self.calls[kind]
+        ]
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# Stats of the request being handled, set by the HTTP middleware in main.py
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+_route_templates: dict = {}
+_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict = {}
+
+    def inc(self, labels: tuple, amount: float = 1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values: dict = {}
+
+    def observe(self, labels: tuple, value: float):
+        with _lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, series["buckets"]):
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            inf_labels = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series['count']}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "faculty_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+db_query_duration = Histogram(
+    "faculty_db_query_duration_seconds",
+    "Table query latency by issuing route, table, operation and filter shape.",
+    ("route", "table", "operation", "filters"),
+)
+db_query_rows = Counter(
+    "faculty_db_query_rows_total",
+    "Rows returned by table queries.",
+    ("route", "table", "operation", "filters"),
+)
+db_query_errors = Counter(
+    "faculty_db_query_errors_total",
+    "Table queries that raised.",
+    ("route", "table", "operation", "filters"),
+)
+
+_METRICS = [http_request_duration, db_query_duration, db_query_rows, db_query_errors]
+
+
+def register_route_templates(router, prefix: str = ""):
+    """Remember the full path template of each endpoint so metrics are labelled per route."""
+    for route in router.routes:
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is not None:
+            _route_templates[endpoint] = prefix + route.path
+
+
+def route_label(scope: dict | None) -> str:
+    if scope is None:
+        return "background"
+    template = _route_templates.get(scope.get("endpoint"))
+    if template:
+        return template
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def observe_request(method: str, scope: dict, status_code: int, seconds: float):
+    http_request_duration.observe((method, route_label(scope), str(status_code)), seconds)
+
+
+def record_call(kind: str, seconds: float):
+    """Count an auth or push round trip against the current request."""
+    stats = current_request.get()
+    if stats is not None:
+        stats.record(kind, seconds)
+
+
+@contextmanager
+def track_call(kind: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_call(kind, time.perf_counter() - started)
+
+
+def query_budget(route: str) -> int:
+    return QUERY_BUDGETS.get(route, QUERY_BUDGET_DEFAULT)
+
+
+def check_request_budget(method: str, stats: RequestStats) -> str | None:
+    """Log repeated query shapes and budget overruns; returns the overrun message, if any."""
+    if QUERY_BUDGET_MODE == "off":
+        return None
+    route = route_label(stats.scope)
+    for (table, operation, filters), count in stats.repeated_queries():
+        print(f"[QUERY-BUDGET] Possible N+1 on {method} {route}: {operation} {table} ({filters}) ran {count} times")
+    budget = query_budget(route)
+    if stats.total_calls <= budget:
+        return None
+    calls = ", ".join(f"{kind}={count}" for kind, count in stats.calls.items() if count)
+    message = f"{method} {route} made {stats.total_calls} round trips (budget {budget}): {calls}"
+    print(f"[QUERY-BUDGET] {message}")
+    return message
+
+
+def observe_query(table: str, operation: str, filters: str, rows: int | None, seconds: float, failed: bool = False):
+    stats = current_request.get()
+    if stats is not None:
+        stats.record("db", seconds)
+        shape = (table, operation, filters)
+        stats.query_shapes[shape] = stats.query_shapes.get(shape, 0) + 1
+    labels = (route_label(stats.scope if stats is not None else None), table, operation, filters)
+    db_query_duration.observe(labels, seconds)
+    if failed:
+        db_query_errors.inc(labels)
+    elif rows:
+        db_query_rows.inc(labels, rows)
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_QUERY_OPERATIONS = {"select", "insert", "update", "upsert", "delete"}
+_SHAPE_METHODS = {"eq", "neq", "in_", "lt", "gt", "lte", "gte", "like", "ilike", "is_", "or_", "order", "limit", "range"}
+# Methods whose first argument is not a column name (and may carry values)
+_UNLABELLED_METHODS = {"or_", "limit", "range"}
+
+
+class InstrumentedQuery:
+    """Wraps a query builder and times its `execute()` with table/operation/filter-shape labels."""
+
+    def __init__(self, builder, table: str, operation: str = "select", shape: tuple = ()):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+        self._shape = shape
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            operation, shape = self._operation, self._shape
+            if name in _QUERY_OPERATIONS:
+                operation = name
+            elif name in _SHAPE_METHODS:
+                column = args[0] if args and name not in _UNLABELLED_METHODS else ""
+                shape = shape + (f"{name.rstrip('_')}:{column}" if column else name.rstrip("_"),)
+            return InstrumentedQuery(result, self._table, operation, shape)
+
+        return call
+
+    async def execute(self):
+        filters = ",".join(self._shape) or "-"
+        started = time.perf_counter()
+        try:
+            result = await self._builder.execute()
+        except Exception:
+            observe_query(self._table, self._operation, filters, None, time.perf_counter() - started, failed=True)
+            raise
+        data = getattr(result, "data", None)
+        rows = len(data) if isinstance(data, list) else (1 if data else 0)
+        observe_query(self._table, self._operation, filters, rows, time.perf_counter() - started)
+        return result
+
+
+class InstrumentedClient:
+    """Wraps a Supabase (or local stand-in) client so every `.table(...)` query is measured."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str) -> InstrumentedQuery:
+        return InstrumentedQuery(self._client.table(name), name)
+
+    def rpc(self, fn: str, params: dict | None = None) -> InstrumentedQuery:
+        return InstrumentedQuery(self._client.rpc(fn, params or {}), fn, "rpc")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+_SQL_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+
+def sql_labels(query: str) -> tuple[str, str]:
+    """(table, operation) labels for a raw SQL statement run on the direct Postgres pool."""
+    match = _SQL_TABLE.search(query)
+    operation = query.strip().split(None, 1)[0].lower() if query.strip() else "sql"
+    return (match.group(1) if match else "sql"), operation
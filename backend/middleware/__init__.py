@@ -1,2 +1,2 @@
 # Middleware package
-from .auth import get_current_user, get_current_admin, get_super_admin, TokenData, require_user_or_admin
+from .auth import get_current_user, get_current_admin, get_super_admin, TokenData, require_user_or_admin, invalidate_principal, get_auth_cache_stats, revoke_cached_token, revoke_cached_tokens_for_user
@@ -2,11 +2,52 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 import os
-from database import get_supabase
+import time
+import hashlib
+from database import get_supabase, get_async_supabase, run_blocking
+from services.cache import TTLCache, SingleFlight
 
 # JWT settings for admin tokens only
 ADMIN_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "your-super-secret-jwt-key")
 
+# Supabase access token verification.
+# "remote" asks the Supabase auth server on every request (original behaviour),
+# "local" checks signature/exp/aud/sub in-process and only falls back to the
+# auth server for tokens that fail local validation (if the fallback is enabled).
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+TOKEN_VERIFY_MODE = os.getenv("SUPABASE_TOKEN_VERIFY_MODE", "remote").strip().lower()
+TOKEN_REMOTE_FALLBACK = os.getenv("SUPABASE_TOKEN_REMOTE_FALLBACK", "true").strip().lower() in ("1", "true", "yes")
+TOKEN_LEEWAY_SECONDS = int(os.getenv("SUPABASE_TOKEN_LEEWAY_SECONDS", "10"))
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
+_jwks_client: jwt.PyJWKClient | None = None
+# kid -> signing key. A miss fetches the JWKS through run_blocking so the urllib
+# request never runs on the event loop; concurrent misses share one fetch.
+JWKS_CACHE_TTL_SECONDS = int(os.getenv("SUPABASE_JWKS_CACHE_TTL_SECONDS", "3600"))
+_signing_keys = TTLCache(maxsize=16, ttl=JWKS_CACHE_TTL_SECONDS)
+_signing_key_flight = SingleFlight()
+
+# email -> users.id principal cache, so repeat callers skip the users lookup.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "2048"))
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("AUTH_PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+
+_principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+# sha256(bearer token) -> TokenData, kept until the token's exp claim.
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_MAX_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_CACHE_MAX_TTL_SECONDS", "3600"))
+
+_token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_MAX_TTL_SECONDS)
+
+# Concurrent verifications of the same token / lookups of the same email share one call
+_token_flight = SingleFlight()
+_principal_flight = SingleFlight()
+
 security = HTTPBearer()
 
 
@@ -32,13 +73,104 @@ def decode_admin_token(token: str) -> dict:
         return None  # Not an admin token, might be Supabase token
 
 
+def _get_jwks_client() -> jwt.PyJWKClient | None:
+    """Lazily create the JWKS client used for asymmetric Supabase signing keys."""
+    global _jwks_client
+    if _jwks_client is None and SUPABASE_JWKS_URL:
+        _jwks_client = jwt.PyJWKClient(SUPABASE_JWKS_URL, cache_keys=True, lifespan=3600)
+    return _jwks_client
+
+
+async def _get_signing_key(token: str, kid: str | None):
+    """Signing key for an asymmetric token, fetching the JWKS off the event loop on a miss."""
+    jwks_client = _get_jwks_client()
+    if jwks_client is None:
+        return None
+    key = _signing_keys.get(kid)
+    if key is not None:
+        return key
+
+    async def fetch():
+        signing_key = await run_blocking(jwks_client.get_signing_key_from_jwt, token)
+        _signing_keys.set(kid, signing_key.key)
+        return signing_key.key
+
+    try:
+        return await _signing_key_flight.do(kid, fetch)
+    except TimeoutError as e:
+        print(f"[AUTH] JWKS fetch failed: {e}")
+        return None
+
+
+async def decode_supabase_token(token: str) -> dict:
+    """
+    Verify a Supabase access token in-process.
+    Checks the HS256 (project JWT secret) or JWKS signature plus exp, aud and sub.
+    Returns None if the token cannot be validated locally.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+        if algorithm == "HS256":
+            if not SUPABASE_JWT_SECRET:
+                return None
+            key = SUPABASE_JWT_SECRET
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            key = await _get_signing_key(token, header.get("kid"))
+            if key is None:
+                return None
+        else:
+            return None
+
+        payload = jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=SUPABASE_JWT_AUDIENCE,
+            leeway=TOKEN_LEEWAY_SECONDS,
+            options={"require": ["exp", "aud", "sub"]},
+        )
+    except jwt.ExpiredSignatureError:
+        # Signature was valid, so the auth server would reject it as well.
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has expired"
+        )
+    except jwt.PyJWTError as e:
+        print(f"[AUTH] Local token verification failed: {e}")
+        return None
+
+    return {
+        "email": payload.get("email"),
+        "sub": payload.get("sub"),
+        "exp": payload.get("exp"),
+        "type": "supabase"
+    }
+
+
 async def verify_supabase_token(token: str) -> dict:
+    """
+    Verify Supabase token.
+    In local mode the token is checked in-process, with an optional fallback
+    to the Supabase auth server for tokens that fail local validation.
+    """
+    if TOKEN_VERIFY_MODE == "local":
+        payload = await decode_supabase_token(token)
+        if payload:
+            return payload
+        if not TOKEN_REMOTE_FALLBACK:
+            return None
+
+    return await verify_supabase_token_remote(token)
+
+
+async def verify_supabase_token_remote(token: str) -> dict:
     """Verify Supabase token using Supabase auth."""
     supabase = get_supabase()
     
     try:
         # Use Supabase to verify the token and get user
-        user_response = supabase.auth.get_user(token)
+        user_response = await run_blocking(supabase.auth.get_user, token)
         
         if user_response and user_response.user:
             return {
@@ -52,6 +184,126 @@ async def verify_supabase_token(token: str) -> dict:
         return None
 
 
+def _principal_key(email: str) -> str:
+    return (email or "").strip().lower()
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _unverified_claims(token: str) -> dict:
+    try:
+        return jwt.decode(token, options={"verify_signature": False})
+    except jwt.PyJWTError:
+        return {}
+
+
+def _cache_verified_token(token: str, token_data: TokenData, exp: int = None):
+    """Cache a verified user token until its exp claim (capped by the cache TTL)."""
+    if exp is None:
+        # Remote verification does not return exp; the token was already verified,
+        # so the unsigned claims are only used to bound how long we trust it.
+        exp = _unverified_claims(token).get("exp")
+    if not exp:
+        return
+    ttl = min(float(exp) - time.time(), TOKEN_CACHE_MAX_TTL_SECONDS)
+    _token_cache.set(_token_key(token), token_data, ttl=ttl)
+
+
+def revoke_cached_tokens_for_user(email: str) -> int:
+    """Drop every cached token that resolved to this email."""
+    if not email:
+        return 0
+    key = _principal_key(email)
+    return _token_cache.invalidate_where(lambda _, token_data: _principal_key(token_data.email) == key)
+
+
+def revoke_cached_token(token: str):
+    """
+    Drop a bearer token from the verified-token cache.
+    Logout is global, so other cached tokens of the same user are dropped too.
+    """
+    if not token:
+        return
+    token_data = _token_cache.pop(_token_key(token))
+    email = token_data.email if token_data else _unverified_claims(token).get("email")
+    revoke_cached_tokens_for_user(email)
+
+
+def invalidate_principal(email: str):
+    """Drop the cached users.id mapping for an email (user deleted or re-registered)."""
+    if email:
+        _principal_cache.invalidate(_principal_key(email))
+        revoke_cached_tokens_for_user(email)
+
+
+def get_auth_cache_stats() -> dict:
+    """Hit/miss/eviction counters of the auth caches."""
+    return {
+        "principal_cache": _principal_cache.stats(),
+        "token_cache": _token_cache.stats(),
+        "token_single_flight": _token_flight.stats(),
+        "principal_single_flight": _principal_flight.stats(),
+    }
+
+
+async def _fetch_principal(email: str) -> dict:
+    supabase = await get_async_supabase()
+    result = await supabase.table("users").select("id, email").eq("email", email).execute()
+    if not result.data:
+        return None
+
+    user = {"id": result.data[0]["id"], "email": result.data[0]["email"]}
+    _principal_cache.set(_principal_key(email), user)
+    return user
+
+
+async def _resolve_principal(email: str) -> dict:
+    """Map a verified email to our users row (id, email), using the principal cache."""
+    key = _principal_key(email)
+    user = _principal_cache.get(key)
+    if user is not None:
+        return user
+
+    return await _principal_flight.do(key, lambda: _fetch_principal(email))
+
+
+async def _authenticate_user_token(token: str) -> TokenData:
+    """Verify a Supabase user token and resolve it to our user. Raises 401 on failure."""
+    supabase_payload = await verify_supabase_token(token)
+    if not supabase_payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token"
+        )
+
+    email = supabase_payload.get("email")
+    if not email:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token: no email found"
+        )
+
+    # Get user from database (cached per email)
+    user = await _resolve_principal(email)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found"
+        )
+
+    token_data = TokenData(
+        user_id=user["id"],
+        email=user["email"],
+        role="user",
+        token_type="user"
+    )
+    _cache_verified_token(token, token_data, supabase_payload.get("exp"))
+    return token_data
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
     """
     Verify JWT token and return current user.
@@ -59,6 +311,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     """
     token = credentials.credentials
     
+    # Tokens verified earlier are served from the cache until they expire
+    cached = _token_cache.get(_token_key(token))
+    if cached is not None:
+        return cached
+    
     # First, try to decode as admin token
     admin_payload = decode_admin_token(token)
     if admin_payload and admin_payload.get("type") == "admin":
@@ -69,39 +326,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             token_type="admin"
         )
     
-    # Try to verify as Supabase token
-    supabase_payload = await verify_supabase_token(token)
-    if supabase_payload:
-        email = supabase_payload.get("email")
-        if not email:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token: no email found"
-            )
-        
-        # Get user from database
-        supabase = get_supabase()
-        result = supabase.table("users").select("id, email").eq("email", email).execute()
-        
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
-        
-        user = result.data[0]
-        return TokenData(
-            user_id=user["id"],
-            email=user["email"],
-            role="user",
-            token_type="user"
-        )
-    
-    # Token is invalid
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid or expired token"
-    )
+    # Verify as Supabase token; parallel requests with the same token share one verification
+    return await _token_flight.do(_token_key(token), lambda: _authenticate_user_token(token))
 
 
 async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
@@ -140,6 +140,18 @@ class CancelRequest(BaseModel):
     teacher_id: int
 
 
+class RequestTombstone(BaseModel):
+    id: int
+    deleted_at: Optional[datetime] = None
+
+
+class RequestChangesResponse(BaseModel):
+    changes: list[SubstituteRequestResponse]
+    deleted: list[RequestTombstone]
+    cursor: str  # Pass back as ?since= on the next sync
+    has_more: bool
+
+
 # Class Schedule Models
 class ClassScheduleItem(BaseModel):
     id: int
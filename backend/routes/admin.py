@@ -7,9 +7,9 @@ import jwt
 import os
 import secrets
 import re
-from database import get_supabase, get_supabase_admin
-from middleware.auth import get_current_admin, get_super_admin, TokenData
-from services.push_notifications import send_push_notification, send_push_to_multiple
+from database import get_supabase_admin, get_async_supabase, get_async_supabase_admin, run_blocking, get_blocking_stats
+from middleware.auth import get_current_admin, get_super_admin, TokenData, get_auth_cache_stats
+from services import availability, dispatch, live_feed, outbox, pending_feed, push_notifications, push_tokens
 
 router = APIRouter()
 
@@ -75,11 +75,11 @@ async def admin_login(credentials: AdminLogin):
     Admin login endpoint.
     Returns JWT token and admin details.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
         # Find admin by admin_id
-        result = supabase.table("admins")\
+        result = await supabase.table("admins")\
             .select("*")\
             .eq("admin_id", credentials.admin_id)\
             .execute()
@@ -107,7 +107,7 @@ async def admin_login(credentials: AdminLogin):
             )
         
         # Update last login
-        supabase.table("admins")\
+        await supabase.table("admins")\
             .update({"last_login": datetime.utcnow().isoformat()})\
             .eq("id", admin["id"])\
             .execute()
@@ -143,10 +143,10 @@ async def get_all_admins(current_admin: TokenData = Depends(get_super_admin)):
     Get all admins.
     Super admin only.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        result = supabase.table("admins")\
+        result = await supabase.table("admins")\
             .select("id, admin_id, name, role, is_active, created_at, last_login")\
             .order("created_at")\
             .execute()
@@ -166,7 +166,7 @@ async def create_admin(admin: AdminCreate, current_admin: TokenData = Depends(ge
     Create a new admin.
     Super admin only.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     # Validate role
     if admin.role not in ["super_admin", "manager"]:
@@ -177,7 +177,7 @@ async def create_admin(admin: AdminCreate, current_admin: TokenData = Depends(ge
     
     try:
         # Check if admin_id already exists
-        existing = supabase.table("admins")\
+        existing = await supabase.table("admins")\
             .select("id")\
             .eq("admin_id", admin.admin_id)\
             .execute()
@@ -191,7 +191,7 @@ async def create_admin(admin: AdminCreate, current_admin: TokenData = Depends(ge
         # Hash password and create admin
         hashed = hash_password(admin.password)
         
-        result = supabase.table("admins").insert({
+        result = await supabase.table("admins").insert({
             "admin_id": admin.admin_id,
             "password": hashed,
             "name": admin.name,
@@ -225,7 +225,7 @@ async def update_admin(admin_id: int, admin_update: AdminUpdate, current_admin:
     Update an admin.
     Super admin only.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
         update_data = {}
@@ -247,7 +247,7 @@ async def update_admin(admin_id: int, admin_update: AdminUpdate, current_admin:
                 detail="No fields to update"
             )
         
-        result = supabase.table("admins")\
+        result = await supabase.table("admins")\
             .update(update_data)\
             .eq("id", admin_id)\
             .execute()
@@ -284,10 +284,10 @@ async def delete_admin(admin_id: int, current_admin: TokenData = Depends(get_sup
     Delete an admin.
     Super admin only.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        result = supabase.table("admins")\
+        result = await supabase.table("admins")\
             .delete()\
             .eq("id", admin_id)\
             .execute()
@@ -322,7 +322,7 @@ async def change_admin_password(admin_id: int, new_password: str, current_admin:
             detail="You can only change your own password"
         )
     
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     if len(new_password) < 6:
         raise HTTPException(
@@ -333,7 +333,7 @@ async def change_admin_password(admin_id: int, new_password: str, current_admin:
     try:
         hashed = hash_password(new_password)
         
-        result = supabase.table("admins")\
+        result = await supabase.table("admins")\
             .update({"password": hashed})\
             .eq("id", admin_id)\
             .execute()
@@ -413,7 +413,7 @@ async def invite_user(invite: InviteUserRequest, current_admin: TokenData = Depe
     Invite a single user to register.
     Sends invite email via Supabase Auth.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     try:
         supabase_admin = get_supabase_admin()
     except ValueError as e:
@@ -432,7 +432,7 @@ async def invite_user(invite: InviteUserRequest, current_admin: TokenData = Depe
     
     try:
         # Check if user already exists
-        existing_user = supabase.table("users").select("id").eq("email", email).execute()
+        existing_user = await supabase.table("users").select("id").eq("email", email).execute()
         if existing_user.data:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -440,7 +440,7 @@ async def invite_user(invite: InviteUserRequest, current_admin: TokenData = Depe
             )
         
         # Check if invite already pending
-        existing_invite = supabase.table("pending_invites")\
+        existing_invite = await supabase.table("pending_invites")\
             .select("id, status")\
             .eq("email", email)\
             .eq("status", "pending")\
@@ -466,16 +466,16 @@ async def invite_user(invite: InviteUserRequest, current_admin: TokenData = Depe
             "status": "pending"
         }
         
-        supabase.table("pending_invites").insert(invite_data).execute()
+        await supabase.table("pending_invites").insert(invite_data).execute()
         
         # Send invite email via Supabase Auth
         try:
-            supabase_admin.auth.admin.invite_user_by_email(email)
+            await run_blocking(supabase_admin.auth.admin.invite_user_by_email, email)
             print(f"[INVITE] Sent invite to {email}")
         except Exception as email_error:
             print(f"[INVITE] Failed to send email: {email_error}")
             # Roll back pending invite because email was not delivered.
-            supabase.table("pending_invites").delete().eq("invite_token", invite_token).execute()
+            await supabase.table("pending_invites").delete().eq("invite_token", invite_token).execute()
             raise HTTPException(
                 status_code=status.HTTP_502_BAD_GATEWAY,
                 detail=f"Failed to send invite email: {str(email_error)}"
@@ -502,7 +502,7 @@ async def bulk_invite_users(bulk_invite: BulkInviteRequest, current_admin: Token
     """
     Invite multiple users from a list (used for CSV upload).
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     try:
         supabase_admin = get_supabase_admin()
     except ValueError as e:
@@ -526,14 +526,14 @@ async def bulk_invite_users(bulk_invite: BulkInviteRequest, current_admin: Token
                 continue
             
             # Check if user already exists
-            existing_user = supabase.table("users").select("id").eq("email", email).execute()
+            existing_user = await supabase.table("users").select("id").eq("email", email).execute()
             if existing_user.data:
                 errors.append(f"{email}: User already exists")
                 failed += 1
                 continue
             
             # Check if invite already pending
-            existing_invite = supabase.table("pending_invites")\
+            existing_invite = await supabase.table("pending_invites")\
                 .select("id")\
                 .eq("email", email)\
                 .eq("status", "pending")\
@@ -558,14 +558,14 @@ async def bulk_invite_users(bulk_invite: BulkInviteRequest, current_admin: Token
                 "status": "pending"
             }
             
-            supabase.table("pending_invites").insert(invite_data).execute()
+            await supabase.table("pending_invites").insert(invite_data).execute()
             
             # Send invite email
             try:
-                supabase_admin.auth.admin.invite_user_by_email(email)
+                await run_blocking(supabase_admin.auth.admin.invite_user_by_email, email)
             except Exception as email_error:
                 print(f"[BULK-INVITE] Email failed for {email}: {email_error}")
-                supabase.table("pending_invites").delete().eq("invite_token", invite_token).execute()
+                await supabase.table("pending_invites").delete().eq("invite_token", invite_token).execute()
                 errors.append(f"{email}: Failed to send invite email")
                 failed += 1
                 continue
@@ -590,10 +590,10 @@ async def get_pending_invites(current_admin: TokenData = Depends(get_current_adm
     """
     Get all pending invites.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        result = supabase.table("pending_invites")\
+        result = await supabase.table("pending_invites")\
             .select("*")\
             .order("created_at", desc=True)\
             .execute()
@@ -624,10 +624,10 @@ async def cancel_invite(invite_id: int, current_admin: TokenData = Depends(get_c
     """
     Cancel/delete a pending invite.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        result = supabase.table("pending_invites")\
+        result = await supabase.table("pending_invites")\
             .delete()\
             .eq("id", invite_id)\
             .execute()
@@ -654,7 +654,7 @@ async def resend_invite(invite_id: int, current_admin: TokenData = Depends(get_c
     """
     Resend invite email for a pending invite.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     try:
         supabase_admin = get_supabase_admin()
     except ValueError as e:
@@ -665,7 +665,7 @@ async def resend_invite(invite_id: int, current_admin: TokenData = Depends(get_c
     
     try:
         # Get the invite
-        result = supabase.table("pending_invites")\
+        result = await supabase.table("pending_invites")\
             .select("*")\
             .eq("id", invite_id)\
             .eq("status", "pending")\
@@ -681,7 +681,7 @@ async def resend_invite(invite_id: int, current_admin: TokenData = Depends(get_c
         
         # Generate new token and update expiry
         new_token = generate_invite_token()
-        supabase.table("pending_invites")\
+        await supabase.table("pending_invites")\
             .update({
                 "invite_token": new_token,
                 "expires_at": (datetime.utcnow() + timedelta(days=7)).isoformat()
@@ -691,7 +691,7 @@ async def resend_invite(invite_id: int, current_admin: TokenData = Depends(get_c
         
         # Resend email
         try:
-            supabase_admin.auth.admin.invite_user_by_email(invite["email"])
+            await run_blocking(supabase_admin.auth.admin.invite_user_by_email, invite["email"])
         except Exception as email_error:
             print(f"[RESEND-INVITE] Email failed: {email_error}")
             raise HTTPException(
@@ -738,8 +738,6 @@ async def send_notification(notification: NotificationRequest, current_admin: To
     - "specific": Send to specific user IDs (provide user_ids)
     - "department": Send to all users in a department (provide department)
     """
-    supabase = get_supabase()
-    
     if not notification.title or not notification.body:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -747,12 +745,9 @@ async def send_notification(notification: NotificationRequest, current_admin: To
         )
     
     try:
-        # Get users based on target_type
+        # Recipients come from the in-process push token directory, not a users query
         if notification.target_type == "all":
-            result = supabase.table("users")\
-                .select("id, name, email, department, push_token")\
-                .execute()
-            users = result.data
+            audience = {"type": "all"}
             
         elif notification.target_type == "specific":
             if not notification.user_ids or len(notification.user_ids) == 0:
@@ -760,11 +755,7 @@ async def send_notification(notification: NotificationRequest, current_admin: To
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="user_ids required for specific target"
                 )
-            result = supabase.table("users")\
-                .select("id, name, email, department, push_token")\
-                .in_("id", notification.user_ids)\
-                .execute()
-            users = result.data
+            audience = {"type": "users", "user_ids": sorted(set(notification.user_ids))}
             
         elif notification.target_type == "department":
             if not notification.department:
@@ -772,11 +763,7 @@ async def send_notification(notification: NotificationRequest, current_admin: To
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="department required for department target"
                 )
-            result = supabase.table("users")\
-                .select("id, name, email, department, push_token")\
-                .eq("department", notification.department)\
-                .execute()
-            users = result.data
+            audience = {"type": "department", "department": notification.department}
             
         else:
             raise HTTPException(
@@ -784,41 +771,37 @@ async def send_notification(notification: NotificationRequest, current_admin: To
                 detail="Invalid target_type. Use 'all', 'specific', or 'department'"
             )
         
-        # Filter users with valid push tokens
-        valid_tokens = []
-        users_with_tokens = []
-        for user in users:
-            token = user.get("push_token")
-            if token and (token.startswith("ExponentPushToken[") or token.startswith("ExpoPushToken[")):
-                valid_tokens.append(token)
-                users_with_tokens.append(user)
+        recipients = await push_tokens.lookup(
+            user_ids=audience.get("user_ids"),
+            department=audience.get("department"),
+        )
+        # Only a specific target says how many users were asked for; the directory holds just users with tokens
+        failed_count = len(audience["user_ids"]) - len(recipients) if "user_ids" in audience else 0
         
-        if not valid_tokens:
+        if not recipients:
             return NotificationResponse(
                 success=True,
                 sent_count=0,
-                failed_count=len(users),
-                message=f"No users with valid push tokens found ({len(users)} users checked)"
+                failed_count=failed_count,
+                message="No users with valid push tokens found"
             )
         
         # Send notifications
         data_payload = notification.data or {}
         data_payload["type"] = "admin_notification"
         
-        print(f"[ADMIN-NOTIFY] Sending to {len(valid_tokens)} users")
+        print(f"[ADMIN-NOTIFY] Queueing for {len(recipients)} users")
         print(f"[ADMIN-NOTIFY] Title: {notification.title}")
         print(f"[ADMIN-NOTIFY] Body: {notification.body}")
         
-        responses = send_push_to_multiple(valid_tokens, notification.title, notification.body, data_payload)
-        
-        sent_count = len(responses) if responses else 0
-        failed_count = len(users) - sent_count
+        # Delivered (and retried) by the notification outbox workers, which resolve the audience again
+        await outbox.enqueue(audience, notification.title, notification.body, data_payload)
         
         return NotificationResponse(
             success=True,
-            sent_count=sent_count,
+            sent_count=len(recipients),
             failed_count=failed_count,
-            message=f"Notification sent to {sent_count} users"
+            message=f"Notification queued for {len(recipients)} users"
         )
         
     except HTTPException:
@@ -835,10 +818,10 @@ async def get_departments(current_admin: TokenData = Depends(get_current_admin))
     """
     Get list of all unique departments for notification targeting.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        result = supabase.table("users")\
+        result = await supabase.table("users")\
             .select("department")\
             .execute()
         
@@ -859,6 +842,55 @@ async def get_departments(current_admin: TokenData = Depends(get_current_admin))
         )
 
 
+@router.get("/cache/stats")
+async def get_cache_stats(current_admin: TokenData = Depends(get_current_admin)):
+    """
+    Get hit/miss/eviction counters of the in-process auth and pending feed caches,
+    live feed subscriber counts, the availability index and the push token
+    directory. Used to size the caches.
+    """
+    return {
+        **get_auth_cache_stats(),
+        "pending_feed": pending_feed.stats(),
+        "live_feed": live_feed.hub.stats(),
+        "availability_index": availability.index.stats(),
+        "push_token_directory": push_tokens.directory.stats(),
+    }
+
+
+@router.get("/blocking-pool/stats")
+async def get_blocking_pool_stats(current_admin: TokenData = Depends(get_current_admin)):
+    """
+    Get queue depth and outcome counters of the thread pool
+    that runs blocking Supabase auth calls.
+    """
+    return get_blocking_stats()
+
+
+@router.get("/notifications/stats")
+async def get_notification_stats(current_admin: TokenData = Depends(get_current_admin)):
+    """
+    Get queue depth, outcome counters and the most recent jobs of the
+    background notification dispatcher, plus the notification outbox and
+    push token pruning counters.
+    """
+    return {**dispatch.notifications.stats(), "outbox": outbox.stats(), "push": push_notifications.stats()}
+
+
+@router.get("/notifications/dead-letters")
+async def get_dead_letter_notifications(limit: int = 50, current_admin: TokenData = Depends(get_current_admin)):
+    """
+    Get the most recent notifications that were given up on, with their last error.
+    """
+    try:
+        return await outbox.dead_letters(min(max(limit, 1), 500))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch dead-lettered notifications: {str(e)}"
+        )
+
+
 # =============================================
 # ALLOWED EMAILS (REGISTRATION WHITELIST)
 # =============================================
@@ -881,11 +913,11 @@ class AllowedEmailBulk(BaseModel):
 async def get_allowed_emails(current_admin: TokenData = Depends(get_current_admin)):
     """Get all allowed emails."""
     try:
-        supabase = get_supabase_admin()
+        supabase = await get_async_supabase_admin()
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     try:
-        result = supabase.table("allowed_emails")\
+        result = await supabase.table("allowed_emails")\
             .select("*")\
             .order("added_at", desc=True)\
             .execute()
@@ -901,7 +933,7 @@ async def get_allowed_emails(current_admin: TokenData = Depends(get_current_admi
 async def add_allowed_email(entry: AllowedEmailCreate, current_admin: TokenData = Depends(get_current_admin)):
     """Add a single email to the whitelist."""
     try:
-        supabase = get_supabase_admin()
+        supabase = await get_async_supabase_admin()
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     email = entry.email.lower().strip()
@@ -914,11 +946,11 @@ async def add_allowed_email(entry: AllowedEmailCreate, current_admin: TokenData
 
     try:
         # Check duplicate
-        existing = supabase.table("allowed_emails").select("id").eq("email", email).execute()
+        existing = await supabase.table("allowed_emails").select("id").eq("email", email).execute()
         if existing.data:
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already in allowed list")
 
-        result = supabase.table("allowed_emails").insert({
+        result = await supabase.table("allowed_emails").insert({
             "email": email,
             "name": entry.name,
             "department": entry.department,
@@ -939,7 +971,7 @@ async def add_allowed_email(entry: AllowedEmailCreate, current_admin: TokenData
 async def bulk_add_allowed_emails(bulk: AllowedEmailBulk, current_admin: TokenData = Depends(get_current_admin)):
     """Add multiple emails to the whitelist at once."""
     try:
-        supabase = get_supabase_admin()
+        supabase = await get_async_supabase_admin()
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     added = 0
@@ -953,11 +985,11 @@ async def bulk_add_allowed_emails(bulk: AllowedEmailBulk, current_admin: TokenDa
             skipped += 1
             continue
         try:
-            existing = supabase.table("allowed_emails").select("id").eq("email", email).execute()
+            existing = await supabase.table("allowed_emails").select("id").eq("email", email).execute()
             if existing.data:
                 skipped += 1
                 continue
-            supabase.table("allowed_emails").insert({
+            await supabase.table("allowed_emails").insert({
                 "email": email,
                 "name": entry.name,
                 "department": entry.department,
@@ -974,7 +1006,7 @@ async def bulk_add_allowed_emails(bulk: AllowedEmailBulk, current_admin: TokenDa
 async def update_allowed_email(email_id: int, update: AllowedEmailUpdate, current_admin: TokenData = Depends(get_current_admin)):
     """Update an allowed email entry."""
     try:
-        supabase = get_supabase_admin()
+        supabase = await get_async_supabase_admin()
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     update_data = {}
@@ -989,7 +1021,7 @@ async def update_allowed_email(email_id: int, update: AllowedEmailUpdate, curren
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No fields to update")
 
     try:
-        result = supabase.table("allowed_emails").update(update_data).eq("id", email_id).execute()
+        result = await supabase.table("allowed_emails").update(update_data).eq("id", email_id).execute()
         if not result.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Entry not found")
         return result.data[0]
@@ -1006,11 +1038,11 @@ async def update_allowed_email(email_id: int, update: AllowedEmailUpdate, curren
 async def delete_allowed_email(email_id: int, current_admin: TokenData = Depends(get_current_admin)):
     """Remove an email from the whitelist."""
     try:
-        supabase = get_supabase_admin()
+        supabase = await get_async_supabase_admin()
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     try:
-        result = supabase.table("allowed_emails").delete().eq("id", email_id).execute()
+        result = await supabase.table("allowed_emails").delete().eq("id", email_id).execute()
         if not result.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Entry not found")
         return {"message": "Removed from allowed list"}
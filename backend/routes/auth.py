@@ -6,8 +6,10 @@ from typing import Optional
 import os
 from dotenv import load_dotenv
 
-from database import get_supabase
+from database import get_supabase, get_async_supabase, run_blocking
 from models import UserCreate, UserLogin, UserResponse, Token, SignupResponse, VerifyOTPRequest
+from middleware.auth import invalidate_principal, revoke_cached_token, revoke_cached_tokens_for_user
+from services import availability
 
 load_dotenv()
 
@@ -66,13 +68,14 @@ async def signup(user: UserCreate):
 
     Example valid emails: john.fcs@kiit.ac.in, professor@kiit.ac.in
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
+    auth_client = get_supabase()
 
     # ── Whitelist check ──────────────────────────────────────────────────
     # Only emails present in the `allowed_emails` table may self-register.
     try:
         whitelist_result = (
-            supabase.table("allowed_emails")
+            await supabase.table("allowed_emails")
             .select("email")
             .eq("email", user.email.lower())
             .execute()
@@ -92,7 +95,7 @@ async def signup(user: UserCreate):
 
     try:
         # Sign up with Supabase Auth - this sends verification email
-        auth_response = supabase.auth.sign_up({
+        auth_response = await run_blocking(auth_client.auth.sign_up, {
             "email": user.email,
             "password": user.password,
             "options": {
@@ -128,7 +131,10 @@ async def signup(user: UserCreate):
         }
 
         # Insert into users table
-        result = supabase.table("users").insert(user_data).execute()
+        result = await supabase.table("users").insert(user_data).execute()
+        if result.data:
+            availability.index.add_user(result.data[0]["id"])
+            invalidate_principal(user.email)
 
         return SignupResponse(
             message="Verification email sent! Please check your inbox and verify your email before logging in.",
@@ -163,12 +169,13 @@ async def login(credentials: UserLogin):
     User must have verified their email before logging in.
     Returns access token and user information.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
+    auth_client = get_supabase()
 
     try:
         # Sign in with Supabase Auth
         try:
-            auth_response = supabase.auth.sign_in_with_password({
+            auth_response = await run_blocking(auth_client.auth.sign_in_with_password, {
                 "email": credentials.email,
                 "password": credentials.password
             })
@@ -192,7 +199,7 @@ async def login(credentials: UserLogin):
             )
 
         # Get user data from our users table
-        user_result = supabase.table("users").select(
+        user_result = await supabase.table("users").select(
             "*").eq("email", credentials.email).execute()
 
         user_data = None
@@ -210,10 +217,12 @@ async def login(credentials: UserLogin):
                 "email_verified": True
             }
             try:
-                insert_result = supabase.table(
+                insert_result = await supabase.table(
                     "users").insert(new_user_data).execute()
                 if insert_result.data:
                     user_data = insert_result.data[0]
+                    availability.index.add_user(user_data["id"])
+                    invalidate_principal(credentials.email)
             except Exception:
                 # Do not fail login if profile sync fails on older schema.
                 user_data = None
@@ -258,11 +267,11 @@ async def resend_verification(email: str):
     """
     Resend verification email to the user.
     """
-    supabase = get_supabase()
+    auth_client = get_supabase()
 
     try:
         # Resend verification email using Supabase Auth
-        supabase.auth.resend({
+        await run_blocking(auth_client.auth.resend, {
             "type": "signup",
             "email": email
         })
@@ -303,10 +312,11 @@ async def refresh_token(refresh_token: str):
 
 async def _do_refresh_token(refresh_token: str):
     """Internal function to handle token refresh."""
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
+    auth_client = get_supabase()
 
     try:
-        auth_response = supabase.auth.refresh_session(refresh_token)
+        auth_response = await run_blocking(auth_client.auth.refresh_session, refresh_token)
 
         if auth_response.user is None or auth_response.session is None:
             raise HTTPException(
@@ -315,7 +325,7 @@ async def _do_refresh_token(refresh_token: str):
             )
 
         # Get user data from our users table
-        user_result = supabase.table("users").select(
+        user_result = await supabase.table("users").select(
             "*").eq("email", auth_response.user.email).execute()
         user_data = user_result.data[0] if user_result.data else None
 
@@ -369,6 +379,9 @@ async def logout(access_token: Optional[str] = None, authorization: Optional[str
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_KEY")
 
+    # Stop serving this user's tokens from the verified-token cache
+    revoke_cached_token(token)
+
     try:
         async with httpx.AsyncClient() as client:
             response = await client.post(
@@ -415,11 +428,12 @@ async def get_current_user(access_token: str):
     Get current user information from access token.
     Pass token as query parameter: /api/auth/me?access_token=your_token
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
+    auth_client = get_supabase()
 
     try:
         # Get user from Supabase Auth
-        auth_response = supabase.auth.get_user(access_token)
+        auth_response = await run_blocking(auth_client.auth.get_user, access_token)
 
         if auth_response.user is None:
             raise HTTPException(
@@ -428,7 +442,7 @@ async def get_current_user(access_token: str):
             )
 
         # Get user data from our users table
-        user_result = supabase.table("users").select(
+        user_result = await supabase.table("users").select(
             "*").eq("email", auth_response.user.email).execute()
 
         if not user_result.data or len(user_result.data) == 0:
@@ -535,10 +549,10 @@ async def get_invite_details(invite_token: str):
     Get invite details by token.
     Used by the registration page to show pre-filled user data.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        result = supabase.table("pending_invites")\
+        result = await supabase.table("pending_invites")\
             .select("*")\
             .eq("invite_token", invite_token)\
             .eq("status", "pending")\
@@ -556,7 +570,7 @@ async def get_invite_details(invite_token: str):
         expires_at = datetime.fromisoformat(invite["expires_at"].replace("Z", "+00:00"))
         if datetime.now(expires_at.tzinfo) > expires_at:
             # Mark as expired
-            supabase.table("pending_invites")\
+            await supabase.table("pending_invites")\
                 .update({"status": "expired"})\
                 .eq("id", invite["id"])\
                 .execute()
@@ -587,7 +601,8 @@ async def complete_registration(request: CompleteRegistrationRequest):
     Complete registration for an invited user.
     Creates Supabase Auth account and user profile.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
+    auth_client = get_supabase()
     
     if len(request.password) < 6:
         raise HTTPException(
@@ -597,7 +612,7 @@ async def complete_registration(request: CompleteRegistrationRequest):
     
     try:
         # Get pending invite
-        invite_result = supabase.table("pending_invites")\
+        invite_result = await supabase.table("pending_invites")\
             .select("*")\
             .eq("invite_token", request.token)\
             .eq("status", "pending")\
@@ -614,7 +629,7 @@ async def complete_registration(request: CompleteRegistrationRequest):
         # Check if expired
         expires_at = datetime.fromisoformat(invite["expires_at"].replace("Z", "+00:00"))
         if datetime.now(expires_at.tzinfo) > expires_at:
-            supabase.table("pending_invites")\
+            await supabase.table("pending_invites")\
                 .update({"status": "expired"})\
                 .eq("id", invite["id"])\
                 .execute()
@@ -624,10 +639,10 @@ async def complete_registration(request: CompleteRegistrationRequest):
             )
         
         # Check if user already exists in users table
-        existing_user = supabase.table("users").select("id").eq("email", invite["email"]).execute()
+        existing_user = await supabase.table("users").select("id").eq("email", invite["email"]).execute()
         if existing_user.data:
             # Mark invite as accepted
-            supabase.table("pending_invites")\
+            await supabase.table("pending_invites")\
                 .update({"status": "accepted"})\
                 .eq("id", invite["id"])\
                 .execute()
@@ -638,7 +653,7 @@ async def complete_registration(request: CompleteRegistrationRequest):
         
         # Create Supabase Auth user
         try:
-            auth_response = supabase.auth.admin.create_user({
+            auth_response = await run_blocking(auth_client.auth.admin.create_user, {
                 "email": invite["email"],
                 "password": request.password,
                 "email_confirm": True,  # Auto-confirm since they came from invite
@@ -679,16 +694,18 @@ async def complete_registration(request: CompleteRegistrationRequest):
             "email_verified": True
         }
         
-        user_result = supabase.table("users").insert(user_data).execute()
+        user_result = await supabase.table("users").insert(user_data).execute()
         
         if not user_result.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create user profile"
             )
+        availability.index.add_user(user_result.data[0]["id"])
+        invalidate_principal(invite["email"])
         
         # Mark invite as accepted
-        supabase.table("pending_invites")\
+        await supabase.table("pending_invites")\
             .update({"status": "accepted"})\
             .eq("id", invite["id"])\
             .execute()
@@ -722,11 +739,12 @@ async def verify_invite_token(access_token: str):
     Verify Supabase invite token and return user info.
     Used when user clicks invite link from Supabase email.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
+    auth_client = get_supabase()
     
     try:
         # Get user from Supabase using the access token
-        user_response = supabase.auth.get_user(access_token)
+        user_response = await run_blocking(auth_client.auth.get_user, access_token)
         
         if not user_response or not user_response.user:
             raise HTTPException(
@@ -738,7 +756,7 @@ async def verify_invite_token(access_token: str):
         email = user.email
         
         # Check if we have pending invite for this email
-        invite_result = supabase.table("pending_invites")\
+        invite_result = await supabase.table("pending_invites")\
             .select("*")\
             .eq("email", email.lower())\
             .eq("status", "pending")\
@@ -787,7 +805,8 @@ async def complete_supabase_registration(request: CompleteSupabaseRegistrationRe
     """
     import httpx
     
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
+    auth_client = get_supabase()
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_KEY")
     
@@ -799,7 +818,7 @@ async def complete_supabase_registration(request: CompleteSupabaseRegistrationRe
     
     try:
         # Verify the token and get user
-        user_response = supabase.auth.get_user(request.access_token)
+        user_response = await run_blocking(auth_client.auth.get_user, request.access_token)
         
         if not user_response or not user_response.user:
             raise HTTPException(
@@ -829,11 +848,11 @@ async def complete_supabase_registration(request: CompleteSupabaseRegistrationRe
                 )
         
         # Check if user already exists in our users table
-        existing_user = supabase.table("users").select("id").eq("email", email).execute()
+        existing_user = await supabase.table("users").select("id").eq("email", email).execute()
         
         if existing_user.data:
             # User already exists, just update pending invite status
-            supabase.table("pending_invites")\
+            await supabase.table("pending_invites")\
                 .update({"status": "accepted"})\
                 .eq("email", email.lower())\
                 .execute()
@@ -850,7 +869,7 @@ async def complete_supabase_registration(request: CompleteSupabaseRegistrationRe
         phone = request.phone
         
         # Check pending invite for details
-        invite_result = supabase.table("pending_invites")\
+        invite_result = await supabase.table("pending_invites")\
             .select("*")\
             .eq("email", email.lower())\
             .execute()
@@ -862,7 +881,7 @@ async def complete_supabase_registration(request: CompleteSupabaseRegistrationRe
             phone = phone or invite.get("phone")
             
             # Mark invite as accepted
-            supabase.table("pending_invites")\
+            await supabase.table("pending_invites")\
                 .update({"status": "accepted"})\
                 .eq("id", invite["id"])\
                 .execute()
@@ -877,13 +896,15 @@ async def complete_supabase_registration(request: CompleteSupabaseRegistrationRe
             "email_verified": True
         }
         
-        user_result = supabase.table("users").insert(user_data).execute()
+        user_result = await supabase.table("users").insert(user_data).execute()
         
         if not user_result.data:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create user profile"
             )
+        availability.index.add_user(user_result.data[0]["id"])
+        invalidate_principal(email)
         
         return {
             "success": True,
@@ -905,13 +926,14 @@ async def forgot_password(email: str):
     """
     Send password reset email to the user.
     """
-    supabase = get_supabase()
+    auth_client = get_supabase()
 
     try:
         # Use a web redirect that will then redirect to the app
         # This is more reliable than direct app scheme redirects
         redirect_url = os.getenv("RENDER_EXTERNAL_URL", "https://faculty-app-j8ct.onrender.com")
-        supabase.auth.reset_password_email(
+        await run_blocking(
+            auth_client.auth.reset_password_email,
             email,
             options={
                 "redirect_to": f"{redirect_url}/api/auth/redirect"
@@ -1013,9 +1035,9 @@ async def update_password(new_password: str, access_token: str, refresh_token: s
         print(f"[AUTH] Attempting password update with token: {access_token[:30]}...")
         
         # Validate the token first
-        supabase = get_supabase()
+        auth_client = get_supabase()
         try:
-            user_response = supabase.auth.get_user(access_token)
+            user_response = await run_blocking(auth_client.auth.get_user, access_token)
             if user_response.user:
                 print(f"[AUTH] Token valid for user: {user_response.user.email}")
             else:
@@ -1050,6 +1072,10 @@ async def update_password(new_password: str, access_token: str, refresh_token: s
                 result = response.json()
                 print(f"[AUTH] Password updated successfully for user: {result.get('email', 'unknown')}")
                 
+                # Old tokens must not keep working from the verified-token cache
+                revoke_cached_token(access_token)
+                revoke_cached_tokens_for_user(result.get("email") or user_response.user.email)
+                
                 # Sign out all sessions to force re-login with new password
                 try:
                     await client.post(
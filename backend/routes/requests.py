@@ -1,21 +1,54 @@
-from fastapi import APIRouter, HTTPException, Query, status, Depends, Body
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status, Depends, Body
+from fastapi.responses import StreamingResponse
 from typing import List
-from datetime import datetime, date as date_type, time as time_type, timedelta
+from pydantic import TypeAdapter
+from datetime import datetime, date as date_type, time as time_type, timedelta, timezone
+import base64
+import json
+import os
 
-from database import get_supabase
+from database import get_async_supabase, get_pg_pool, pg_fetch, supports_rpc
 from models import (
     SubstituteRequestCreate,
     SubstituteRequestResponse,
+    RequestChangesResponse,
+    RequestTombstone,
     SubstituteRequestUpdate,
     AcceptRequest,
     CancelRequest
 )
-from services.push_notifications import notify_faculty_by_ids, notify_user
+from services import availability, live_feed, outbox, pending_feed
 from middleware.auth import get_current_user, get_current_admin, TokenData
 
 router = APIRouter()
 
 
+# List endpoints return one page at a time; the next page's cursor is sent in X-Next-Cursor
+DEFAULT_PAGE_SIZE = int(os.getenv("REQUESTS_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("REQUESTS_MAX_PAGE_SIZE", "500"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Columns used by _build_response (no select("*"))
+REQUEST_COLUMNS = "id, teacher_id, request_type, subject, date, time, duration, classroom, campus, notes, status, accepted_by, created_at, updated_at"
+
+_response_list_adapter = TypeAdapter(List[SubstituteRequestResponse])
+
+# Keyset orderings as (column, descending)
+SCHEDULE_ORDER = [("date", False), ("time", False), ("id", False)]
+NEWEST_FIRST_ORDER = [("created_at", True), ("id", True)]
+# Delta sync walks rows and tombstones in write order; both positions share one cursor
+CHANGES_ORDER = [("updated_at", False), ("id", False)]
+TOMBSTONE_ORDER = [("deleted_at", False), ("request_id", False)]
+CHANGES_CURSOR_KEYS = CHANGES_ORDER + TOMBSTONE_ORDER
+
+# Rows younger than this are left for the next sync, so a write whose transaction
+# commits after a later one's (updated_at is taken at transaction start) is not skipped
+CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", "2"))
+# Tombstones are pruned after this many days; older cursors must do a full resync
+CHANGES_TOMBSTONE_RETENTION_DAYS = int(os.getenv("CHANGES_TOMBSTONE_RETENTION_DAYS", "30"))
+_TOMBSTONE_PRUNE_INTERVAL_SECONDS = 3600
+_tombstones_pruned_at = 0.0
+
 TIME_PARSE_FORMATS = [
     "%H:%M",
     "%H:%M:%S",
@@ -75,10 +108,49 @@ def _parse_request_date(value) -> date_type:
         )
 
 
-def _get_available_faculty_ids(exclude_user_id: int, request: dict) -> list[int]:
-    supabase = get_supabase()
+# PostgREST caps responses (1000 rows by default), so the index is loaded in pages
+_INDEX_LOAD_PAGE_SIZE = 1000
+
+
+async def _fetch_all_rows(supabase, table: str, columns: str) -> list[dict]:
+    rows, cursor_values = [], None
+    order = [("id", False)]
+    while True:
+        query = supabase.table(table).select(columns)
+        result = await _paginate(query, order, cursor_values, _INDEX_LOAD_PAGE_SIZE).execute()
+        page, next_cursor = _split_page(result.data or [], order, _INDEX_LOAD_PAGE_SIZE)
+        rows.extend(page)
+        if not next_cursor:
+            return rows
+        cursor_values = [page[-1]["id"]]
+
+
+async def _load_availability_index() -> tuple[list[int], list[dict]]:
+    if await get_pg_pool() is not None:
+        users = await pg_fetch("SELECT id FROM users")
+        schedules = await pg_fetch("SELECT * FROM teacher_class_schedules")
+    else:
+        supabase = await get_async_supabase()
+        users = await _fetch_all_rows(supabase, "users", "id")
+        # select("*") keeps working on older databases without substitute_request_id
+        schedules = await _fetch_all_rows(supabase, "teacher_class_schedules", "*")
+    return [user["id"] for user in users], schedules
+
+
+async def _get_available_faculty_ids(exclude_user_id: int, request: dict) -> list[int]:
+    if availability.AVAILABILITY_INDEX_ENABLED:
+        await availability.index.ensure_loaded(_load_availability_index)
+        start_time, end_time = _compute_time_window(request.get("time"), request.get("duration"))
+        return availability.index.free_faculty(_parse_request_date(request.get("date")), start_time, end_time, exclude_user_id)
+
+    free_ids = await _get_free_faculty_ids_rpc(exclude_user_id, request)
+    if free_ids is not None:
+        return free_ids
+
+    # Local store, or a database without the function: one-off slots count as weekly here
+    supabase = await get_async_supabase()
 
-    users_result = supabase.table("users")\
+    users_result = await supabase.table("users")\
         .select("id")\
         .neq("id", exclude_user_id)\
         .execute()
@@ -94,7 +166,7 @@ def _get_available_faculty_ids(exclude_user_id: int, request: dict) -> list[int]
     start_time, end_time = _compute_time_window(request_time, duration)
     weekday = request_date.weekday()  # Monday=0 ... Sunday=6
 
-    conflicts_result = supabase.table("teacher_class_schedules")\
+    conflicts_result = await supabase.table("teacher_class_schedules")\
         .select("teacher_id")\
         .in_("teacher_id", candidate_ids)\
         .eq("day_of_week", weekday)\
@@ -106,6 +178,166 @@ def _get_available_faculty_ids(exclude_user_id: int, request: dict) -> list[int]
     return [user_id for user_id in candidate_ids if user_id not in busy_ids]
 
 
+# Set once the database turns out not to have get_free_faculty_ids (schema.sql not re-run yet)
+_free_faculty_rpc_missing = False
+
+
+async def _get_free_faculty_ids_rpc(exclude_user_id: int, request: dict) -> list[int] | None:
+    """Free faculty from the get_free_faculty_ids database function, or None if it is not installed."""
+    global _free_faculty_rpc_missing
+    if _free_faculty_rpc_missing or not supports_rpc():
+        return None
+
+    request_date = _parse_request_date(request.get("date"))
+    start_time, end_time = _compute_time_window(request.get("time"), request.get("duration"))
+
+    try:
+        if await get_pg_pool() is not None:
+            rows = await pg_fetch(
+                "SELECT faculty_id FROM get_free_faculty_ids($1, $2, $3, $4)",
+                request_date,
+                start_time,
+                end_time,
+                exclude_user_id,
+            )
+        else:
+            supabase = await get_async_supabase()
+            result = await supabase.rpc("get_free_faculty_ids", {
+                "p_date": request_date.isoformat(),
+                "p_start": _time_to_db_string(start_time),
+                "p_end": _time_to_db_string(end_time),
+                "p_exclude_user_id": exclude_user_id,
+            }).execute()
+            rows = result.data or []
+    except Exception as e:
+        error_text = str(e)
+        # PGRST202: PostgREST has no such function
+        if "PGRST202" in error_text or "does not exist" in error_text:
+            print("[AVAILABILITY] get_free_faculty_ids not installed, falling back to table queries")
+            _free_faculty_rpc_missing = True
+            return None
+        raise
+
+    return [row["faculty_id"] for row in rows]
+
+
+def _is_missing_column(error: Exception, column: str) -> bool:
+    # Older databases that have not re-run schema.sql
+    error_text = str(error)
+    return column in error_text and ("does not exist" in error_text or "42703" in error_text)
+
+
+async def _has_schedule_conflict(teacher_id: int, on_date: date_type, start_time: time_type, end_time: time_type) -> bool:
+    """Weekly class on that weekday, or one-off slot on that date, overlapping the window."""
+    weekday = on_date.weekday()
+    if await get_pg_pool() is not None:
+        rows = await pg_fetch(
+            """
+            SELECT id FROM teacher_class_schedules
+            WHERE teacher_id = $1 AND day_of_week = $2 AND start_time < $3 AND end_time > $4
+              AND (slot_date IS NULL OR slot_date = $5)
+            LIMIT 1
+            """,
+            teacher_id,
+            weekday,
+            end_time,
+            start_time,
+            on_date,
+        )
+        return bool(rows)
+
+    supabase = await get_async_supabase()
+
+    def overlapping_slots():
+        # Builders are mutable, so each attempt starts from a fresh one
+        return supabase.table("teacher_class_schedules")\
+            .select("id")\
+            .eq("teacher_id", teacher_id)\
+            .eq("day_of_week", weekday)\
+            .lt("start_time", _time_to_db_string(end_time))\
+            .gt("end_time", _time_to_db_string(start_time))\
+            .limit(1)
+
+    try:
+        result = await overlapping_slots()\
+            .or_(f"slot_date.is.null,slot_date.eq.{on_date.isoformat()}")\
+            .execute()
+    except Exception as e:
+        if not _is_missing_column(e, "slot_date"):
+            raise
+        result = await overlapping_slots().execute()
+    return bool(result.data)
+
+
+async def _has_accepted_conflict(teacher_id: int, on_date: date_type, start_time: time_type, end_time: time_type) -> bool:
+    """Another request accepted by the teacher on the same date with an overlapping window."""
+    try:
+        if await get_pg_pool() is not None:
+            rows = await pg_fetch(
+                """
+                SELECT id FROM substitute_requests
+                WHERE accepted_by = $1 AND status = 'accepted' AND date = $2
+                  AND start_time < $3 AND end_time > $4
+                LIMIT 1
+                """,
+                teacher_id,
+                on_date,
+                end_time,
+                start_time,
+            )
+            return bool(rows)
+
+        supabase = await get_async_supabase()
+        result = await supabase.table("substitute_requests")\
+            .select("id")\
+            .eq("accepted_by", teacher_id)\
+            .eq("status", "accepted")\
+            .eq("date", on_date.isoformat())\
+            .lt("start_time", _time_to_db_string(end_time))\
+            .gt("end_time", _time_to_db_string(start_time))\
+            .limit(1)\
+            .execute()
+        return bool(result.data)
+    except Exception as e:
+        if not _is_missing_column(e, "start_time"):
+            raise
+
+    # No derived window columns yet: compare that day's accepted requests here
+    supabase = await get_async_supabase()
+    result = await supabase.table("substitute_requests")\
+        .select("id, time, duration")\
+        .eq("accepted_by", teacher_id)\
+        .eq("status", "accepted")\
+        .eq("date", on_date.isoformat())\
+        .execute()
+    for req in (result.data or []):
+        other_start, other_end = _compute_time_window(req.get("time"), req.get("duration"))
+        if other_start < end_time and start_time < other_end:
+            return True
+    return False
+
+
+def _available_faculty_audience(exclude_user_id: int, request: dict) -> dict:
+    """Outbox audience for the faculty who are free during the requested slot."""
+    return {
+        "type": "available_faculty",
+        "exclude_user_id": exclude_user_id,
+        "request": {key: request.get(key) for key in ("date", "time", "duration")},
+    }
+
+
+def _coalesce_key(request_id: int) -> str:
+    """Outbox coalesce key: a newer notification about a request replaces one still waiting."""
+    return f"request:{request_id}"
+
+
+async def _resolve_available_faculty(audience: dict) -> list[int]:
+    return await _get_available_faculty_ids(audience["exclude_user_id"], audience["request"])
+
+
+outbox.register_audience("available_faculty", _resolve_available_faculty)
+
+
 def _request_title(request: dict) -> str:
     if request.get("request_type") == "exam":
         campus = request.get("campus") or "Campus"
@@ -135,6 +367,125 @@ def _request_summary(request: dict) -> str:
     return f"{_request_title(request)} in {_request_location(request)} on {formatted_date} at {request.get('time')}"
 
 
+def _request_changed(event: str, req: dict, teacher: dict | None = None, acceptor: dict | None = None):
+    """A request row was written: drop the cached pending feed and push the change to live subscribers."""
+    pending_feed.mark_changed()
+    try:
+        payload = _build_response(req, teacher=teacher, acceptor=acceptor).model_dump(mode="json")
+    except Exception as e:
+        print(f"[LIVE] Could not publish {event} for request {req.get('id')}: {e}")
+        return
+    live_feed.hub.publish(event, payload)
+
+
+async def _load_busy_slots(user_id: int) -> list[dict]:
+    supabase = await get_async_supabase()
+    # select("*") keeps working on older databases without slot_date
+    result = await supabase.table("teacher_class_schedules")\
+        .select("*")\
+        .eq("teacher_id", user_id)\
+        .execute()
+    return result.data or []
+
+
+def _viewer_is_free(user_id: int, busy_slots: list[dict], event: str, request: dict) -> bool:
+    """Live feed filter: new/updated requests only reach viewers free for the slot (same rule as the notifications)."""
+    if event not in ("request_created", "request_updated") or request.get("teacher_id") == user_id:
+        return True
+    try:
+        request_date = _parse_request_date(request.get("date"))
+        start_time, end_time = _compute_time_window(request.get("time"), request.get("duration"))
+    except (HTTPException, TypeError, ValueError):
+        return True
+    start, end = _time_to_db_string(start_time), _time_to_db_string(end_time)
+    for slot in busy_slots:
+        slot_date = slot.get("slot_date")
+        if slot_date and str(slot_date)[:10] != request_date.isoformat():
+            continue
+        if slot.get("day_of_week") == request_date.weekday() and str(slot.get("start_time")) < end and str(slot.get("end_time")) > start:
+            return False
+    return True
+
+
+def _encode_cursor(row: dict, keys: list[tuple[str, bool]]) -> str:
+    values = [row.get(column) for column, _ in keys]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def _is_cursor_value(column: str, value) -> bool:
+    """Whether a decoded cursor value has the type of its column (cursors come back from clients)."""
+    try:
+        if column in ("id", "request_id"):
+            return isinstance(value, int) and not isinstance(value, bool)
+        if not isinstance(value, str):
+            return False
+        if column == "date":
+            date_type.fromisoformat(value)
+        elif column in ("created_at", "updated_at", "deleted_at"):
+            datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return True
+    except ValueError:
+        return False
+
+
+def _decode_cursor(cursor: str | None, keys: list[tuple[str, bool]]) -> list | None:
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if (
+        not isinstance(values, list)
+        or len(values) != len(keys)
+        or not all(_is_cursor_value(column, value) for (column, _), value in zip(keys, values))
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
+
+
+def _filter_value(value) -> str:
+    # Double-quote so dates, times ("10:00 AM") and timestamps survive PostgREST's logic-tree syntax
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def _keyset_condition(keys: list[tuple[str, bool]], values: list) -> str:
+    """PostgREST or=() filter selecting rows strictly after `values` in the given ordering."""
+    branches = []
+    for index, (column, desc) in enumerate(keys):
+        terms = [f"{prior}.eq.{_filter_value(values[i])}" for i, (prior, _) in enumerate(keys[:index])]
+        terms.append(f"{column}.{'lt' if desc else 'gt'}.{_filter_value(values[index])}")
+        branches.append(terms[0] if len(terms) == 1 else f"and({','.join(terms)})")
+    return ",".join(branches)
+
+
+def _paginate(query, keys: list[tuple[str, bool]], cursor_values: list | None, limit: int):
+    for column, desc in keys:
+        query = query.order(column, desc=desc)
+    if cursor_values is not None:
+        query = query.or_(_keyset_condition(keys, cursor_values))
+    # One extra row tells us whether there is a next page
+    return query.limit(limit + 1)
+
+
+def _split_page(rows: list[dict], keys: list[tuple[str, bool]], limit: int) -> tuple[list[dict], str | None]:
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, _encode_cursor(rows[-1], keys)
+    return rows, None
+
+
+def _page_rows(rows: list[dict], keys: list[tuple[str, bool]], limit: int, response: Response) -> list[dict]:
+    rows, next_cursor = _split_page(rows, keys, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows
+
+
 def _build_response(req: dict, teacher: dict | None = None, acceptor: dict | None = None):
     return SubstituteRequestResponse(
         id=req["id"],
@@ -203,67 +554,130 @@ def _validate_update_payload(existing_request: dict, update_payload: dict) -> di
     return _sanitize_request_fields(merged)
 
 
+async def _load_pending_page(limit: int, cursor_values: list | None) -> tuple[bytes, str | None]:
+    """Read one page of the pending feed and serialize it (body, next cursor) for the feed cache."""
+    if await get_pg_pool() is not None:
+        columns = ", ".join(f"r.{column.strip()}" for column in REQUEST_COLUMNS.split(","))
+        if cursor_values is None:
+            rows = await pg_fetch(
+                f"""
+                SELECT {columns}, u.name AS teacher_name
+                FROM substitute_requests r
+                LEFT JOIN users u ON u.id = r.teacher_id
+                WHERE r.status = 'pending'
+                ORDER BY r.date, r.time, r.id
+                LIMIT $1
+                """,
+                limit + 1,
+            )
+        else:
+            rows = await pg_fetch(
+                f"""
+                SELECT {columns}, u.name AS teacher_name
+                FROM substitute_requests r
+                LEFT JOIN users u ON u.id = r.teacher_id
+                WHERE r.status = 'pending' AND (r.date, r.time, r.id) > ($1, $2, $3)
+                ORDER BY r.date, r.time, r.id
+                LIMIT $4
+                """,
+                date_type.fromisoformat(cursor_values[0]),
+                cursor_values[1],
+                int(cursor_values[2]),
+                limit + 1,
+            )
+        for row in rows:
+            teacher_name = row.pop("teacher_name")
+            row["users"] = {"name": teacher_name} if teacher_name is not None else None
+    else:
+        supabase = await get_async_supabase()
+
+        # Get pending requests with teacher name
+        query = supabase.table("substitute_requests")\
+            .select(f"{REQUEST_COLUMNS}, users!substitute_requests_teacher_id_fkey(name)")\
+            .eq("status", "pending")
+        result = await _paginate(query, SCHEDULE_ORDER, cursor_values, limit).execute()
+        rows = result.data
+
+    rows, next_cursor = _split_page(rows, SCHEDULE_ORDER, limit)
+    requests_list = []
+    for req in rows:
+        teacher_name = None
+        if req.get("users"):
+            teacher_name = req["users"].get("name")
+        
+        requests_list.append(_build_response(req, teacher={"name": teacher_name} if teacher_name else None))
+    
+    return _response_list_adapter.dump_json(requests_list), next_cursor
+
+
 @router.get("/", response_model=List[SubstituteRequestResponse])
-async def get_pending_requests(current_user: TokenData = Depends(get_current_user)):
+async def get_pending_requests(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: TokenData = Depends(get_current_user),
+):
     """
-    Get all pending substitute requests.
-    Returns requests ordered by date and time.
+    Get pending substitute requests, one page at a time.
+    Returns requests ordered by date and time; pass X-Next-Cursor back as `cursor` for the next page.
+    Supports If-None-Match: unchanged polls get 304 Not Modified without touching the database.
+    Pages are served from a shared in-process cache that request writes invalidate.
     Requires authentication.
     """
-    supabase = get_supabase()
-    
+    cursor_values = _decode_cursor(cursor, SCHEDULE_ORDER)
+
+    etag = pending_feed.etag(limit, cursor)
+    if pending_feed.matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
     try:
-        # Get pending requests with teacher name
-        result = supabase.table("substitute_requests")\
-            .select("*, users!substitute_requests_teacher_id_fkey(name)")\
-            .eq("status", "pending")\
-            .order("date")\
-            .order("time")\
-            .execute()
-        
-        requests_list = []
-        for req in result.data:
-            teacher_name = None
-            if req.get("users"):
-                teacher_name = req["users"].get("name")
-            
-            requests_list.append(_build_response(req, teacher={"name": teacher_name} if teacher_name else None))
-        
-        return requests_list
-        
+        body, next_cursor = await pending_feed.get_page(
+            (limit, cursor),
+            lambda: _load_pending_page(limit, cursor_values),
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch requests: {str(e)}"
         )
 
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
 @router.get("/all", response_model=List[SubstituteRequestResponse])
-async def get_all_requests(current_admin: TokenData = Depends(get_current_admin)):
+async def get_all_requests(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_admin: TokenData = Depends(get_current_admin),
+):
     """
-    Get all substitute requests (pending, accepted, cancelled).
+    Get all substitute requests (pending, accepted, cancelled), newest first, one page at a time.
     For admin panel use. Requires admin authentication.
     """
-    supabase = get_supabase()
+    cursor_values = _decode_cursor(cursor, NEWEST_FIRST_ORDER)
+    supabase = await get_async_supabase()
     
     try:
         # Get all requests with full teacher and acceptor details
-        result = supabase.table("substitute_requests")\
-            .select("*, teacher:users!substitute_requests_teacher_id_fkey(id, name, email, phone, department), acceptor:users!substitute_requests_accepted_by_fkey(id, name, email, phone, department)")\
-            .order("created_at", desc=True)\
-            .execute()
+        query = supabase.table("substitute_requests")\
+            .select(f"{REQUEST_COLUMNS}, teacher:users!substitute_requests_teacher_id_fkey(name, email, phone, department), acceptor:users!substitute_requests_accepted_by_fkey(name, email, phone, department)")
+        result = await _paginate(query, NEWEST_FIRST_ORDER, cursor_values, limit).execute()
         
         requests_list = []
-        for req in result.data:
+        for req in _page_rows(result.data, NEWEST_FIRST_ORDER, limit, response):
             teacher = req.get("teacher") or {}
             acceptor = req.get("acceptor") or {}
             
-            response = _build_response(
+            item = _build_response(
                 req, 
                 teacher=teacher if teacher else None,
                 acceptor=acceptor if acceptor else None
             )
-            requests_list.append(response)
+            requests_list.append(item)
         
         return requests_list
         
@@ -275,9 +689,15 @@ async def get_all_requests(current_admin: TokenData = Depends(get_current_admin)
 
 
 @router.get("/teacher/{teacher_id}", response_model=List[SubstituteRequestResponse])
-async def get_teacher_requests(teacher_id: int, current_user: TokenData = Depends(get_current_user)):
+async def get_teacher_requests(
+    teacher_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: TokenData = Depends(get_current_user),
+):
     """
-    Get all substitute requests created by a specific teacher.
+    Get substitute requests created by a specific teacher, newest first, one page at a time.
     Users can only access their own requests, admins can access any.
     """
     # Users can only view their own requests, admins can view any
@@ -286,18 +706,18 @@ async def get_teacher_requests(teacher_id: int, current_user: TokenData = Depend
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to view this teacher's requests"
         )
-    supabase = get_supabase()
+    cursor_values = _decode_cursor(cursor, NEWEST_FIRST_ORDER)
+    supabase = await get_async_supabase()
     
     try:
         # Get requests with acceptor name and details
-        result = supabase.table("substitute_requests")\
-            .select("*, acceptor:users!substitute_requests_accepted_by_fkey(id, name, email, department, phone)")\
-            .eq("teacher_id", teacher_id)\
-            .order("created_at", desc=True)\
-            .execute()
+        query = supabase.table("substitute_requests")\
+            .select(f"{REQUEST_COLUMNS}, acceptor:users!substitute_requests_accepted_by_fkey(name, email, department, phone)")\
+            .eq("teacher_id", teacher_id)
+        result = await _paginate(query, NEWEST_FIRST_ORDER, cursor_values, limit).execute()
         
         requests_list = []
-        for req in result.data:
+        for req in _page_rows(result.data, NEWEST_FIRST_ORDER, limit, response):
             acceptor_name = None
             acceptor_email = None
             acceptor_department = None
@@ -328,9 +748,15 @@ async def get_teacher_requests(teacher_id: int, current_user: TokenData = Depend
 
 
 @router.get("/accepted-by/{teacher_id}", response_model=List[SubstituteRequestResponse])
-async def get_accepted_requests(teacher_id: int, current_user: TokenData = Depends(get_current_user)):
+async def get_accepted_requests(
+    teacher_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: TokenData = Depends(get_current_user),
+):
     """
-    Get all substitute requests accepted by a specific teacher.
+    Get substitute requests accepted by a specific teacher, ordered by date and time, one page at a time.
     Users can only access their own accepted requests, admins can access any.
     """
     # Users can only view their own accepted requests, admins can view any
@@ -339,19 +765,18 @@ async def get_accepted_requests(teacher_id: int, current_user: TokenData = Depen
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to view this teacher's accepted requests"
         )
-    supabase = get_supabase()
+    cursor_values = _decode_cursor(cursor, SCHEDULE_ORDER)
+    supabase = await get_async_supabase()
     
     try:
         # Get requests accepted by this teacher with original teacher details
-        result = supabase.table("substitute_requests")\
-            .select("*, teacher:users!substitute_requests_teacher_id_fkey(id, name, email, department, phone)")\
-            .eq("accepted_by", teacher_id)\
-            .order("date")\
-            .order("time")\
-            .execute()
+        query = supabase.table("substitute_requests")\
+            .select(f"{REQUEST_COLUMNS}, teacher:users!substitute_requests_teacher_id_fkey(name, email, department, phone)")\
+            .eq("accepted_by", teacher_id)
+        result = await _paginate(query, SCHEDULE_ORDER, cursor_values, limit).execute()
         
         requests_list = []
-        for req in result.data:
+        for req in _page_rows(result.data, SCHEDULE_ORDER, limit, response):
             teacher_name = None
             teacher_email = None
             teacher_department = None
@@ -381,16 +806,143 @@ async def get_accepted_requests(teacher_id: int, current_user: TokenData = Depen
         )
 
 
+@router.get("/stream")
+async def stream_request_changes(
+    only_available: bool = False,
+    current_user: TokenData = Depends(get_current_user),
+):
+    """
+    Live feed of request changes as Server-Sent Events: request_created, request_accepted,
+    request_updated, request_cancelled and request_deleted, each carrying the request.
+    A resync event means the client fell behind and should refetch the feed.
+    With only_available=true, new and updated requests are only sent if the viewer is free for the slot.
+    """
+    accepts = None
+    if only_available and current_user.token_type != "admin" and current_user.user_id is not None:
+        try:
+            busy_slots = await _load_busy_slots(current_user.user_id)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to load class schedule: {str(e)}"
+            )
+        user_id = current_user.user_id
+        accepts = lambda event, request: _viewer_is_free(user_id, busy_slots, event, request)
+
+    if live_feed.hub.is_full():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many live feed connections, fall back to polling"
+        )
+
+    return StreamingResponse(
+        live_feed.hub.stream(current_user.user_id, accepts),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _prune_tombstones(supabase, cutoff: str):
+    global _tombstones_pruned_at
+    now = datetime.now(timezone.utc).timestamp()
+    if now - _tombstones_pruned_at < _TOMBSTONE_PRUNE_INTERVAL_SECONDS:
+        return
+    _tombstones_pruned_at = now
+    try:
+        await supabase.table("substitute_request_tombstones").delete().lt("deleted_at", cutoff).execute()
+    except Exception as e:
+        print(f"[SYNC] Failed to prune request tombstones: {e}")
+
+
+@router.get("/changes", response_model=RequestChangesResponse)
+async def get_request_changes(
+    since: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: TokenData = Depends(get_current_user),
+):
+    """
+    Delta sync: requests created or changed since the `since` cursor, plus the ids of deleted ones.
+    Start without `since` for a full sync, then pass back `cursor`; repeat while `has_more`.
+    Rows can occasionally be sent twice, so apply them by id. A 410 means the cursor is
+    older than the tombstone retention and the client must resync from scratch.
+    """
+    cursor_values = _decode_cursor(since, CHANGES_CURSOR_KEYS)
+    now = datetime.now(timezone.utc)
+    settled_at = (now - timedelta(seconds=CHANGES_SETTLE_SECONDS)).isoformat()
+    retention_cutoff = (now - timedelta(days=CHANGES_TOMBSTONE_RETENTION_DAYS)).isoformat()
+
+    if cursor_values is not None:
+        # Position in the tombstone stream: deletions older than the retention are gone
+        synced_at = datetime.fromisoformat(cursor_values[2].replace("Z", "+00:00"))
+        if synced_at.tzinfo is None:
+            synced_at = synced_at.replace(tzinfo=timezone.utc)
+        if synced_at.isoformat() < retention_cutoff:
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Cursor expired, resync from scratch"
+            )
+
+    supabase = await get_async_supabase()
+
+    try:
+        query = supabase.table("substitute_requests")\
+            .select(f"{REQUEST_COLUMNS}, teacher:users!substitute_requests_teacher_id_fkey(name, email, phone, department), acceptor:users!substitute_requests_accepted_by_fkey(name, email, phone, department)")\
+            .lte("updated_at", settled_at)
+        rows = (await _paginate(query, CHANGES_ORDER, cursor_values[:2] if cursor_values else None, limit).execute()).data
+
+        # A full sync has nothing to delete on the client
+        tombstones = []
+        if cursor_values is not None:
+            query = supabase.table("substitute_request_tombstones")\
+                .select("request_id, deleted_at")\
+                .lte("deleted_at", settled_at)
+            tombstones = (await _paginate(query, TOMBSTONE_ORDER, cursor_values[2:], limit).execute()).data
+            await _prune_tombstones(supabase, retention_cutoff)
+
+        rows, rows_cursor = _split_page(rows, CHANGES_ORDER, limit)
+        tombstones, tombstones_cursor = _split_page(tombstones, TOMBSTONE_ORDER, limit)
+
+        # Once a stream is drained its position jumps to the settle point, so the cursor
+        # reflects when the client last synced even if nothing changed
+        position = {
+            "updated_at": settled_at, "id": 0,
+            "deleted_at": settled_at, "request_id": 0,
+        }
+        if rows_cursor:
+            position.update(updated_at=rows[-1]["updated_at"], id=rows[-1]["id"])
+        if tombstones_cursor:
+            position.update(deleted_at=tombstones[-1]["deleted_at"], request_id=tombstones[-1]["request_id"])
+
+        return RequestChangesResponse(
+            changes=[
+                _build_response(req, teacher=req.get("teacher") or None, acceptor=req.get("acceptor") or None)
+                for req in rows
+            ],
+            deleted=[
+                RequestTombstone(id=tombstone["request_id"], deleted_at=tombstone.get("deleted_at"))
+                for tombstone in tombstones
+            ],
+            cursor=_encode_cursor(position, CHANGES_CURSOR_KEYS),
+            has_more=bool(rows_cursor or tombstones_cursor),
+        )
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch request changes: {str(e)}"
+        )
+
+
 @router.get("/{request_id}", response_model=SubstituteRequestResponse)
 async def get_request(request_id: int, current_user: TokenData = Depends(get_current_user)):
     """
     Get a specific substitute request by ID.
     Requires authentication.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        result = supabase.table("substitute_requests")\
+        result = await supabase.table("substitute_requests")\
             .select("*, teacher:users!substitute_requests_teacher_id_fkey(name), acceptor:users!substitute_requests_accepted_by_fkey(name)")\
             .eq("id", request_id)\
             .execute()
@@ -432,11 +984,11 @@ async def create_request(request: SubstituteRequestCreate, current_user: TokenDa
             detail="You can only create requests for yourself"
         )
     
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
         # Verify teacher exists
-        teacher_result = supabase.table("users").select("id, name").eq("id", request.teacher_id).execute()
+        teacher_result = await supabase.table("users").select("id, name").eq("id", request.teacher_id).execute()
         
         if not teacher_result.data or len(teacher_result.data) == 0:
             raise HTTPException(
@@ -453,7 +1005,7 @@ async def create_request(request: SubstituteRequestCreate, current_user: TokenDa
             "status": "pending"
         }
         
-        result = supabase.table("substitute_requests").insert(new_request).execute()
+        result = await supabase.table("substitute_requests").insert(new_request).execute()
         
         if not result.data or len(result.data) == 0:
             raise HTTPException(
@@ -462,11 +1014,12 @@ async def create_request(request: SubstituteRequestCreate, current_user: TokenDa
             )
         
         req = result.data[0]
+        _request_changed("request_created", req, teacher={"name": teacher_name})
         
-        # Notify only faculty who are free during the requested slot.
-        available_teacher_ids = _get_available_faculty_ids(request.teacher_id, req)
-        await notify_faculty_by_ids(
-            user_ids=available_teacher_ids,
+        # Notify only faculty who are free during the requested slot; the outbox delivers it after responding.
+        await outbox.enqueue(
+            _available_faculty_audience(request.teacher_id, req),
+            coalesce_key=_coalesce_key(req["id"]),
             title="📚 New Substitute Request",
             body=f"{teacher_name} needs a substitute for {_request_summary(new_request)}",
             data={
@@ -488,167 +1041,211 @@ async def create_request(request: SubstituteRequestCreate, current_user: TokenDa
         )
 
 
-@router.put("/{request_id}/accept", response_model=SubstituteRequestResponse)
-async def accept_request(request_id: int, accept_data: AcceptRequest, current_user: TokenData = Depends(get_current_user)):
+# Set once the database turns out not to have accept_substitute_request (schema.sql not re-run yet)
+_accept_rpc_missing = False
+
+# accept_substitute_request outcomes other than "accepted"
+_ACCEPT_OUTCOME_ERRORS = {
+    "not_found": (status.HTTP_404_NOT_FOUND, "Request not found"),
+    "not_pending": (status.HTTP_400_BAD_REQUEST, "Request is not available for acceptance"),
+    "acceptor_not_found": (status.HTTP_404_NOT_FOUND, "Accepting teacher not found"),
+    "invalid_time": (status.HTTP_400_BAD_REQUEST, "Request has an invalid time"),
+    "schedule_conflict": (status.HTTP_409_CONFLICT, "You already have a class scheduled at this time"),
+    "accepted_conflict": (status.HTTP_409_CONFLICT, "You have already accepted another request at this time"),
+}
+
+
+async def _accept_request_rpc(request_id: int, teacher_id: int) -> dict | None:
     """
-    Accept a pending substitute request.
-    Users can only accept requests as themselves.
-    Validation: Teacher cannot have an existing class or accepted request at the same time.
+    Accept in one transaction with the accept_substitute_request database function.
+    Returns {"request", "acceptor_name", "schedule"}, or None if the function is not installed.
     """
-    # Users can only accept requests as themselves
-    if current_user.token_type != "admin" and current_user.user_id != accept_data.teacher_id:
+    global _accept_rpc_missing
+    if _accept_rpc_missing or not supports_rpc():
+        return None
+
+    try:
+        if await get_pg_pool() is not None:
+            rows = await pg_fetch("SELECT accept_substitute_request($1, $2) AS result", request_id, teacher_id)
+            outcome = json.loads(rows[0]["result"])
+        else:
+            supabase = await get_async_supabase()
+            result = await supabase.rpc("accept_substitute_request", {
+                "p_request_id": request_id,
+                "p_teacher_id": teacher_id,
+            }).execute()
+            outcome = result.data
+    except Exception as e:
+        error_text = str(e)
+        if "PGRST202" in error_text or "does not exist" in error_text:
+            print("[ACCEPT] accept_substitute_request not installed, falling back to separate queries")
+            _accept_rpc_missing = True
+            return None
+        raise
+
+    error = _ACCEPT_OUTCOME_ERRORS.get(outcome.get("outcome"))
+    if error:
+        raise HTTPException(status_code=error[0], detail=error[1])
+    return outcome
+
+
+async def _accept_request_steps(request_id: int, teacher_id: int) -> dict:
+    """Same checks and writes as accept_substitute_request, as separate queries."""
+    supabase = await get_async_supabase()
+
+    # Check if request exists and is pending
+    check_result = await supabase.table("substitute_requests")\
+        .select("*")\
+        .eq("id", request_id)\
+        .execute()
+    
+    if not check_result.data or len(check_result.data) == 0:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only accept requests as yourself"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Request not found"
+        )
+    
+    if check_result.data[0]["status"] != "pending":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Request is not available for acceptance"
+        )
+    
+    # Verify acceptor exists and get their name
+    acceptor_result = await supabase.table("users")\
+        .select("id, name")\
+        .eq("id", teacher_id)\
+        .execute()
+    
+    if not acceptor_result.data or len(acceptor_result.data) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Accepting teacher not found"
+        )
+    
+    acceptor_name = acceptor_result.data[0]["name"]
+    original_request = check_result.data[0]
+    
+    # Validation: Check if teacher already has a class at this time
+    request_date = _parse_request_date(original_request.get("date"))
+    request_time = original_request.get("time")
+    duration = original_request.get("duration")
+    start_time, end_time = _compute_time_window(request_time, duration)
+    weekday = request_date.weekday()  # Monday=0 ... Sunday=6
+    
+    # Check for schedule conflict with teacher's regular classes
+    if await _has_schedule_conflict(teacher_id, request_date, start_time, end_time):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="You already have a class scheduled at this time"
+        )
+    
+    # Check for conflict with already accepted requests
+    if await _has_accepted_conflict(teacher_id, request_date, start_time, end_time):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="You have already accepted another request at this time"
+        )
+    
+    # Accept the request, only if it is still pending (compare-and-set against a concurrent accept)
+    result = await supabase.table("substitute_requests")\
+        .update({
+            "status": "accepted",
+            "accepted_by": teacher_id,
+            "updated_at": "now()"
+        })\
+        .eq("id", request_id)\
+        .eq("status", "pending")\
+        .execute()
+    
+    if not result.data or len(result.data) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Request is not available for acceptance"
         )
     
-    supabase = get_supabase()
+    req = result.data[0]
     
+    # Add schedule entry for the acceptor showing the substitute class
+    schedule_subject = req.get("subject") or f"Substitute - {req.get('campus', 'TBD')}"
+    if req.get("request_type") == "exam":
+        schedule_subject = f"Exam Duty - {req.get('campus', 'Campus TBD')}"
+    
+    schedule_entry = {
+        "teacher_id": teacher_id,
+        "day_of_week": weekday,
+        "start_time": _time_to_db_string(start_time),
+        "end_time": _time_to_db_string(end_time),
+        "slot_date": request_date.isoformat(),
+        "subject": schedule_subject,
+        "classroom": req.get("classroom"),
+        "substitute_request_id": request_id,
+    }
+
     try:
-        # Check if request exists and is pending
-        check_result = supabase.table("substitute_requests")\
-            .select("*")\
-            .eq("id", request_id)\
-            .execute()
-        
-        if not check_result.data or len(check_result.data) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Request not found"
-            )
-        
-        if check_result.data[0]["status"] != "pending":
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Request is not available for acceptance"
-            )
-        
-        # Verify acceptor exists and get their name
-        acceptor_result = supabase.table("users")\
-            .select("id, name")\
-            .eq("id", accept_data.teacher_id)\
-            .execute()
-        
-        if not acceptor_result.data or len(acceptor_result.data) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Accepting teacher not found"
-            )
-        
-        acceptor_name = acceptor_result.data[0]["name"]
-        original_request = check_result.data[0]
-        
-        # Validation: Check if teacher already has a class at this time
-        request_date = _parse_request_date(original_request.get("date"))
-        request_time = original_request.get("time")
-        duration = original_request.get("duration")
-        start_time, end_time = _compute_time_window(request_time, duration)
-        weekday = request_date.weekday()  # Monday=0 ... Sunday=6
-        
-        # Check for schedule conflict with teacher's regular classes
-        schedule_conflict = supabase.table("teacher_class_schedules")\
-            .select("id, day_of_week, start_time, end_time")\
-            .eq("teacher_id", accept_data.teacher_id)\
-            .eq("day_of_week", weekday)\
-            .lt("start_time", _time_to_db_string(end_time))\
-            .gt("end_time", _time_to_db_string(start_time))\
-            .execute()
-        
-        if schedule_conflict.data and len(schedule_conflict.data) > 0:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="You already have a class scheduled at this time"
-            )
-        
-        # Check for conflict with already accepted requests
-        accepted_conflict = supabase.table("substitute_requests")\
-            .select("id, date, time, duration")\
-            .eq("accepted_by", accept_data.teacher_id)\
-            .eq("status", "accepted")\
+        schedule_result = await supabase.table("teacher_class_schedules")\
+            .insert(schedule_entry)\
             .execute()
-        
-        for req in (accepted_conflict.data or []):
-            other_date = _parse_request_date(req.get("date"))
-            other_weekday = other_date.weekday()
-            
-            # Only check if on the same day
-            if other_weekday == weekday:
-                other_time = req.get("time")
-                other_duration = req.get("duration")
-                other_start, other_end = _compute_time_window(other_time, other_duration)
-                
-                # Check for time overlap
-                if not (_time_to_db_string(end_time) <= _time_to_db_string(other_start) or 
-                        _time_to_db_string(start_time) >= _time_to_db_string(other_end)):
-                    raise HTTPException(
-                        status_code=status.HTTP_409_CONFLICT,
-                        detail="You have already accepted another request at this time"
-                    )
-        
-        # Accept the request
-        result = supabase.table("substitute_requests")\
-            .update({
-                "status": "accepted",
-                "accepted_by": accept_data.teacher_id,
-                "updated_at": "now()"
-            })\
-            .eq("id", request_id)\
-            .execute()
-        
-        if not result.data or len(result.data) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to accept request"
-            )
-        
-        req = result.data[0]
-        
-        # Add schedule entry for the acceptor showing the substitute class
-        schedule_subject = req.get("subject") or f"Substitute - {req.get('campus', 'TBD')}"
-        if req.get("request_type") == "exam":
-            schedule_subject = f"Exam Duty - {req.get('campus', 'Campus TBD')}"
-        
-        schedule_entry = {
-            "teacher_id": accept_data.teacher_id,
+    except Exception as schedule_error:
+        # Backward compatibility: older DB may miss slot_date/substitute_request_id.
+        legacy_entry = {
+            "teacher_id": teacher_id,
             "day_of_week": weekday,
             "start_time": _time_to_db_string(start_time),
             "end_time": _time_to_db_string(end_time),
-            "slot_date": request_date.isoformat(),
             "subject": schedule_subject,
             "classroom": req.get("classroom"),
-            "substitute_request_id": request_id,
         }
 
-        try:
-            schedule_result = supabase.table("teacher_class_schedules")\
-                .insert(schedule_entry)\
+        error_text = str(schedule_error).lower()
+        if "slot_date" in error_text or "substitute_request_id" in error_text:
+            schedule_result = await supabase.table("teacher_class_schedules")\
+                .insert(legacy_entry)\
                 .execute()
-        except Exception as schedule_error:
-            # Backward compatibility: older DB may miss slot_date/substitute_request_id.
-            legacy_entry = {
-                "teacher_id": accept_data.teacher_id,
-                "day_of_week": weekday,
-                "start_time": _time_to_db_string(start_time),
-                "end_time": _time_to_db_string(end_time),
-                "subject": schedule_subject,
-                "classroom": req.get("classroom"),
-            }
+        else:
+            raise
+    
+    if not schedule_result.data:
+        # Log the error but don't fail the acceptance - the request is already accepted
+        print(f"Warning: Failed to add schedule entry for substitute request {request_id}")
+
+    return {
+        "request": req,
+        "acceptor_name": acceptor_name,
+        "schedule": schedule_result.data[0] if schedule_result.data else None,
+    }
 
-            error_text = str(schedule_error).lower()
-            if "slot_date" in error_text or "substitute_request_id" in error_text:
-                schedule_result = supabase.table("teacher_class_schedules")\
-                    .insert(legacy_entry)\
-                    .execute()
-            else:
-                raise
-        
-        if not schedule_result.data:
-            # Log the error but don't fail the acceptance - the request is already accepted
-            print(f"Warning: Failed to add schedule entry for substitute request {request_id}")
+
+@router.put("/{request_id}/accept", response_model=SubstituteRequestResponse)
+async def accept_request(request_id: int, accept_data: AcceptRequest, current_user: TokenData = Depends(get_current_user)):
+    """
+    Accept a pending substitute request.
+    Users can only accept requests as themselves.
+    Validation: Teacher cannot have an existing class or accepted request at the same time.
+    """
+    # Users can only accept requests as themselves
+    if current_user.token_type != "admin" and current_user.user_id != accept_data.teacher_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only accept requests as yourself"
+        )
+    
+    try:
+        # One transactional round trip where the database has the function
+        accepted = await _accept_request_rpc(request_id, accept_data.teacher_id)
+        if accepted is None:
+            accepted = await _accept_request_steps(request_id, accept_data.teacher_id)
+
+        req = accepted["request"]
+        acceptor_name = accepted["acceptor_name"]
+        _request_changed("request_accepted", req, acceptor={"name": acceptor_name})
+        if accepted.get("schedule"):
+            availability.index.add_slot(accept_data.teacher_id, accepted["schedule"])
         
         # Notify the original requester that their request was accepted
-        await notify_user(
-            user_id=original_request["teacher_id"],
+        await outbox.enqueue(
+            {"type": "user", "user_id": req["teacher_id"]},
+            coalesce_key=_coalesce_key(request_id),
             title="✅ Request Accepted!",
             body=f"{acceptor_name} will cover your {_request_summary(req)}",
             data={
@@ -685,10 +1282,10 @@ async def update_request(
             detail="You can only update your own requests"
         )
     
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
 
     try:
-        check_result = supabase.table("substitute_requests")\
+        check_result = await supabase.table("substitute_requests")\
             .select("*")\
             .eq("id", request_id)\
             .eq("teacher_id", teacher_id)\
@@ -744,7 +1341,7 @@ async def update_request(
 
         final_request_data = _validate_update_payload(original_request, update_data)
 
-        result = supabase.table("substitute_requests")\
+        result = await supabase.table("substitute_requests")\
             .update({
                 **final_request_data,
                 "updated_at": "now()",
@@ -760,15 +1357,18 @@ async def update_request(
 
         req = result.data[0]
 
-        teacher_result = supabase.table("users")\
+        teacher_result = await supabase.table("users")\
             .select("id, name")\
             .eq("id", teacher_id)\
             .execute()
         teacher_name = teacher_result.data[0]["name"] if teacher_result.data else "Faculty Member"
+        _request_changed("request_updated", req, teacher={"name": teacher_name})
 
         if original_request.get("accepted_by"):
-            await notify_user(
-                user_id=original_request["accepted_by"],
+            await outbox.enqueue(
+                {"type": "user", "user_id": original_request["accepted_by"]},
+                coalesce_key=_coalesce_key(request_id),
+                hold=True,
                 title="✏️ Request Updated",
                 body=f"{teacher_name} updated the substitute details for {_request_summary(req)}",
                 data={
@@ -778,9 +1378,10 @@ async def update_request(
                 }
             )
         else:
-            available_teacher_ids = _get_available_faculty_ids(teacher_id, req)
-            await notify_faculty_by_ids(
-                user_ids=available_teacher_ids,
+            await outbox.enqueue(
+                _available_faculty_audience(teacher_id, req),
+                coalesce_key=_coalesce_key(request_id),
+                hold=True,
                 title="✏️ Substitute Request Updated",
                 body=f"{teacher_name} updated a request for {_request_summary(req)}",
                 data={
@@ -813,11 +1414,11 @@ async def cancel_request(request_id: int, cancel_data: CancelRequest, current_us
             detail="You can only cancel your own requests"
         )
     
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
         # Check if request exists and belongs to the teacher
-        check_result = supabase.table("substitute_requests")\
+        check_result = await supabase.table("substitute_requests")\
             .select("*")\
             .eq("id", request_id)\
             .eq("teacher_id", cancel_data.teacher_id)\
@@ -832,7 +1433,7 @@ async def cancel_request(request_id: int, cancel_data: CancelRequest, current_us
         original_request = check_result.data[0]
         
         # Cancel the request
-        result = supabase.table("substitute_requests")\
+        result = await supabase.table("substitute_requests")\
             .update({
                 "status": "cancelled",
                 "updated_at": "now()"
@@ -847,14 +1448,16 @@ async def cancel_request(request_id: int, cancel_data: CancelRequest, current_us
             )
         
         req = result.data[0]
+        _request_changed("request_cancelled", req)
         
         # Remove the schedule entry for the acceptor if request was accepted
         if original_request.get("accepted_by"):
             try:
-                supabase.table("teacher_class_schedules")\
+                await supabase.table("teacher_class_schedules")\
                     .delete()\
                     .eq("substitute_request_id", request_id)\
                     .execute()
+                availability.index.remove_request_slots(request_id)
             except Exception as cleanup_error:
                 if "substitute_request_id" not in str(cleanup_error):
                     raise
@@ -865,18 +1468,22 @@ async def cancel_request(request_id: int, cancel_data: CancelRequest, current_us
                     original_request.get("time"),
                     original_request.get("duration"),
                 )
-                supabase.table("teacher_class_schedules")\
+                await supabase.table("teacher_class_schedules")\
                     .delete()\
                     .eq("teacher_id", original_request["accepted_by"])\
                     .eq("day_of_week", fallback_date.weekday())\
                     .eq("start_time", _time_to_db_string(fallback_start))\
                     .eq("end_time", _time_to_db_string(fallback_end))\
                     .execute()
+                availability.index.remove_slot(
+                    original_request["accepted_by"], fallback_date.weekday(), fallback_start, fallback_end
+                )
         
         # If request was accepted by someone, notify them about cancellation
         if original_request.get("accepted_by"):
-            await notify_user(
-                user_id=original_request["accepted_by"],
+            await outbox.enqueue(
+                {"type": "user", "user_id": original_request["accepted_by"]},
+                coalesce_key=_coalesce_key(request_id),
                 title="❌ Request Cancelled",
                 body=f"The substitute request for {_request_summary(req)} has been cancelled",
                 data={
@@ -905,11 +1512,14 @@ async def delete_request(request_id: int, teacher_id: int = None, current_user:
     """
     # Admins can delete any request
     if current_user.token_type == "admin":
-        supabase = get_supabase()
-        check_result = supabase.table("substitute_requests").select("*").eq("id", request_id).execute()
+        supabase = await get_async_supabase()
+        check_result = await supabase.table("substitute_requests").select("*").eq("id", request_id).execute()
         if not check_result.data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Request not found")
-        supabase.table("substitute_requests").delete().eq("id", request_id).execute()
+        await supabase.table("substitute_requests").delete().eq("id", request_id).execute()
+        # The acceptor's slot for this request is removed by the cascade
+        availability.index.remove_request_slots(request_id)
+        _request_changed("request_deleted", check_result.data[0])
         return {"message": "Request deleted successfully"}
     
     # Users must provide teacher_id and it must match their user_id
@@ -919,11 +1529,11 @@ async def delete_request(request_id: int, teacher_id: int = None, current_user:
     if current_user.user_id != teacher_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You can only delete your own requests")
     
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
         # Check if request exists and belongs to the teacher
-        check_result = supabase.table("substitute_requests")\
+        check_result = await supabase.table("substitute_requests")\
             .select("*")\
             .eq("id", request_id)\
             .eq("teacher_id", teacher_id)\
@@ -936,7 +1546,10 @@ async def delete_request(request_id: int, teacher_id: int = None, current_user:
             )
         
         # Delete the request
-        supabase.table("substitute_requests").delete().eq("id", request_id).execute()
+        await supabase.table("substitute_requests").delete().eq("id", request_id).execute()
+        # The acceptor's slot for this request is removed by the cascade
+        availability.index.remove_request_slots(request_id)
+        _request_changed("request_deleted", check_result.data[0])
         
         return {"message": "Request deleted successfully"}
         
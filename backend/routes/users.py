@@ -5,9 +5,11 @@ import bcrypt
 from datetime import datetime, time, timedelta
 from openpyxl import load_workbook
 
-from database import get_supabase
+from database import get_async_supabase, get_pg_pool, pg_fetch
 from models import UserResponse, UserUpdate, PushTokenUpdate, ClassScheduleItem
-from middleware.auth import get_current_user, get_current_admin, get_super_admin, TokenData
+from middleware.auth import get_current_user, get_current_admin, get_super_admin, TokenData, invalidate_principal
+from services import availability, pending_feed, push_tokens
+from services.push_tokens import _is_valid_expo_push_token
 
 router = APIRouter()
 
@@ -362,22 +364,16 @@ class AdminCreateUser(BaseModel):
     phone: Optional[str] = None
 
 
-def _is_valid_expo_push_token(token: str) -> bool:
-    if not token:
-        return False
-    return token.startswith("ExponentPushToken[") or token.startswith("ExpoPushToken[")
-
-
 @router.get("/", response_model=List[UserResponse])
 async def get_all_users(current_admin: TokenData = Depends(get_current_admin)):
     """
     Get all registered faculty users.
     Admin only.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        result = supabase.table("users")\
+        result = await supabase.table("users")\
             .select("id, name, email, department, phone, email_verified, push_token, created_at")\
             .order("name")\
             .execute()
@@ -409,7 +405,7 @@ async def create_user_by_admin(user_data: AdminCreateUser, current_admin: TokenD
     Create a new user.
     Admin only.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     # Validate email format
     if not user_data.email.endswith("@kiit.ac.in"):
@@ -420,7 +416,7 @@ async def create_user_by_admin(user_data: AdminCreateUser, current_admin: TokenD
     
     try:
         # Check if email already exists
-        existing = supabase.table("users").select("id").eq("email", user_data.email).execute()
+        existing = await supabase.table("users").select("id").eq("email", user_data.email).execute()
         if existing.data:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -431,7 +427,7 @@ async def create_user_by_admin(user_data: AdminCreateUser, current_admin: TokenD
         hashed_password = bcrypt.hashpw(user_data.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         
         # Create user
-        result = supabase.table("users").insert({
+        result = await supabase.table("users").insert({
             "name": user_data.name,
             "email": user_data.email,
             "password": hashed_password,
@@ -447,6 +443,7 @@ async def create_user_by_admin(user_data: AdminCreateUser, current_admin: TokenD
             )
         
         new_user = result.data[0]
+        availability.index.add_user(new_user["id"])
         return UserResponse(
             id=new_user["id"],
             name=new_user["name"],
@@ -477,10 +474,10 @@ async def get_user(user_id: int, current_user: TokenData = Depends(get_current_u
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to view this profile"
         )
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        result = supabase.table("users")\
+        result = await supabase.table("users")\
             .select("id, name, email, department, phone, created_at")\
             .eq("id", user_id)\
             .execute()
@@ -522,7 +519,7 @@ async def update_user(user_id: int, user_update: UserUpdate, current_user: Token
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to update this profile"
         )
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
         # Build update data (only non-None fields)
@@ -540,7 +537,7 @@ async def update_user(user_id: int, user_update: UserUpdate, current_user: Token
                 detail="No fields to update"
             )
         
-        result = supabase.table("users")\
+        result = await supabase.table("users")\
             .update(update_data)\
             .eq("id", user_id)\
             .execute()
@@ -552,6 +549,11 @@ async def update_user(user_id: int, user_update: UserUpdate, current_user: Token
             )
         
         user = result.data[0]
+        if "name" in update_data:
+            # Teacher names are shown in the pending feed
+            pending_feed.mark_changed()
+        if "department" in update_data:
+            push_tokens.directory.set_department(user_id, user.get("department"))
         return UserResponse(
             id=user["id"],
             name=user["name"],
@@ -583,7 +585,7 @@ async def update_push_token(user_id: int, token_update: PushTokenUpdate, current
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to update this push token"
         )
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     token = token_update.push_token
     
@@ -596,7 +598,7 @@ async def update_push_token(user_id: int, token_update: PushTokenUpdate, current
         )
     
     try:
-        result = supabase.table("users")\
+        result = await supabase.table("users")\
             .update({"push_token": token})\
             .eq("id", user_id)\
             .execute()
@@ -607,6 +609,7 @@ async def update_push_token(user_id: int, token_update: PushTokenUpdate, current
                 detail="User not found"
             )
         
+        push_tokens.directory.set_token(user_id, token, result.data[0].get("department"))
         print(f"[PUSH-TOKEN] Saved for user {user_id}: {token[:40]}...")
         return {
             "message": "Push token updated successfully", 
@@ -637,7 +640,7 @@ async def set_push_token_simple(user_id: int, push_token: str, current_user: Tok
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to update this push token"
         )
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     print(f"[PUSH-TOKEN] POST received for user {user_id}: {push_token}")
     
@@ -648,7 +651,7 @@ async def set_push_token_simple(user_id: int, push_token: str, current_user: Tok
         )
     
     try:
-        result = supabase.table("users")\
+        result = await supabase.table("users")\
             .update({"push_token": push_token})\
             .eq("id", user_id)\
             .execute()
@@ -659,6 +662,7 @@ async def set_push_token_simple(user_id: int, push_token: str, current_user: Tok
                 detail="User not found"
             )
         
+        push_tokens.directory.set_token(user_id, push_token, result.data[0].get("department"))
         print(f"[PUSH-TOKEN] Saved for user {user_id}: {push_token[:40]}...")
         return {
             "message": "Push token updated successfully", 
@@ -689,10 +693,10 @@ async def get_push_token_status(user_id: int, current_user: TokenData = Depends(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to view this status"
         )
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
 
     try:
-        result = supabase.table("users")\
+        result = await supabase.table("users")\
             .select("id, name, push_token")\
             .eq("id", user_id)\
             .execute()
@@ -754,7 +758,7 @@ async def upload_class_schedule(
             detail="Not authorized to upload this schedule"
         )
 
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     upload_file = schedule_file or file
 
     if upload_file is None:
@@ -764,7 +768,7 @@ async def upload_class_schedule(
         )
 
     try:
-        user_exists = supabase.table("users")\
+        user_exists = await supabase.table("users")\
             .select("id")\
             .eq("id", user_id)\
             .execute()
@@ -789,9 +793,12 @@ async def upload_class_schedule(
         ]
 
         try:
-            supabase.table("teacher_class_schedules").delete().eq("teacher_id", user_id).execute()
-            supabase.table("teacher_class_schedules").insert(payload).execute()
+            await supabase.table("teacher_class_schedules").delete().eq("teacher_id", user_id).execute()
+            await supabase.table("teacher_class_schedules").insert(payload).execute()
+            availability.index.replace_teacher_schedule(user_id, payload)
         except Exception as db_error:
+            # The delete may have gone through without the insert; reload from the database
+            availability.index.invalidate()
             error_text = str(db_error).lower()
             if "teacher_class_schedules" in error_text and ("subject" in error_text or "classroom" in error_text):
                 raise HTTPException(
@@ -823,6 +830,54 @@ async def upload_class_schedule(
         )
 
 
+async def _get_class_schedule_postgrest(user_id: int) -> list[dict] | None:
+    """Schedule rows for a teacher via PostgREST, or None if the user does not exist."""
+    supabase = await get_async_supabase()
+
+    user_exists = await supabase.table("users")\
+        .select("id")\
+        .eq("id", user_id)\
+        .execute()
+
+    if not user_exists.data:
+        return None
+
+    select_variants = [
+        "id, teacher_id, day_of_week, start_time, end_time, slot_date, subject, classroom, substitute_request_id",
+        "id, teacher_id, day_of_week, start_time, end_time, slot_date, subject, classroom",
+        "id, teacher_id, day_of_week, start_time, end_time, subject, classroom, substitute_request_id",
+        "id, teacher_id, day_of_week, start_time, end_time, subject, classroom",
+    ]
+
+    last_schedule_error = None
+    for select_fields in select_variants:
+        try:
+            schedule_result = await supabase.table("teacher_class_schedules")\
+                .select(select_fields)\
+                .eq("teacher_id", user_id)\
+                .order("day_of_week", desc=False)\
+                .order("start_time", desc=False)\
+                .execute()
+            return schedule_result.data or []
+        except Exception as schedule_error:
+            last_schedule_error = schedule_error
+
+    raise last_schedule_error
+
+
+async def _get_class_schedule_pg(user_id: int) -> list[dict] | None:
+    """Schedule rows for a teacher via the direct Postgres pool, or None if the user does not exist."""
+    user_exists = await pg_fetch("SELECT id FROM users WHERE id = $1", user_id)
+    if not user_exists:
+        return None
+
+    # SELECT * keeps working on older databases without slot_date/substitute_request_id
+    return await pg_fetch(
+        "SELECT * FROM teacher_class_schedules WHERE teacher_id = $1 ORDER BY day_of_week, start_time",
+        user_id,
+    )
+
+
 @router.get("/{user_id}/class-schedule", response_model=List[ClassScheduleItem])
 async def get_class_schedule(
     user_id: int,
@@ -838,50 +893,21 @@ async def get_class_schedule(
             detail="Not authorized to view this schedule"
         )
 
-    supabase = get_supabase()
-
     try:
-        user_exists = supabase.table("users")\
-            .select("id")\
-            .eq("id", user_id)\
-            .execute()
+        if await get_pg_pool() is not None:
+            schedule_items = await _get_class_schedule_pg(user_id)
+        else:
+            schedule_items = await _get_class_schedule_postgrest(user_id)
 
-        if not user_exists.data:
+        if schedule_items is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
 
-        try:
-            select_variants = [
-                "id, teacher_id, day_of_week, start_time, end_time, slot_date, subject, classroom, substitute_request_id",
-                "id, teacher_id, day_of_week, start_time, end_time, slot_date, subject, classroom",
-                "id, teacher_id, day_of_week, start_time, end_time, subject, classroom, substitute_request_id",
-                "id, teacher_id, day_of_week, start_time, end_time, subject, classroom",
-            ]
-
-            schedule_result = None
-            last_schedule_error = None
-            for select_fields in select_variants:
-                try:
-                    schedule_result = supabase.table("teacher_class_schedules")\
-                        .select(select_fields)\
-                        .eq("teacher_id", user_id)\
-                        .order("day_of_week", desc=False)\
-                        .order("start_time", desc=False)\
-                        .execute()
-                    break
-                except Exception as schedule_error:
-                    last_schedule_error = schedule_error
-
-            if schedule_result is None:
-                raise last_schedule_error
-        except Exception:
-            raise
-
         today = datetime.utcnow().date()
         filtered_items = []
-        for item in (schedule_result.data or []):
+        for item in schedule_items:
             slot_date_raw = item.get("slot_date")
             if slot_date_raw:
                 try:
@@ -925,11 +951,11 @@ async def delete_user(user_id: int, current_admin: TokenData = Depends(get_super
     Delete a user account.
     Super admin only.
     """
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     try:
-        check_result = supabase.table("users")\
-            .select("id")\
+        check_result = await supabase.table("users")\
+            .select("id, email")\
             .eq("id", user_id)\
             .execute()
         
@@ -939,7 +965,20 @@ async def delete_user(user_id: int, current_admin: TokenData = Depends(get_super
                 detail="User not found"
             )
         
-        supabase.table("users").delete().eq("id", user_id).execute()
+        own_requests = await supabase.table("substitute_requests")\
+            .select("id")\
+            .eq("teacher_id", user_id)\
+            .execute()
+
+        await supabase.table("users").delete().eq("id", user_id).execute()
+        invalidate_principal(check_result.data[0].get("email"))
+        availability.index.remove_user(user_id)
+        # Other faculty's slots for requests they accepted from this user cascade away too
+        for request in own_requests.data or []:
+            availability.index.remove_request_slots(request["id"])
+        push_tokens.directory.remove_user(user_id)
+        # Their requests are removed by ON DELETE CASCADE
+        pending_feed.mark_changed()
         
         return {"message": "User deleted successfully"}
         
@@ -1,2 +1,2 @@
 # Services package
-from . import push_notifications
+from . import push_notifications, cache, pending_feed, live_feed, availability, dispatch, outbox, push_tokens
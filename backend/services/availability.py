@@ -0,0 +1,155 @@
+import asyncio
+import bisect
+import os
+import time
+from datetime import date, time as time_type
+
+# In-process index of when each faculty member is busy, used to pick who to notify
+# about a new or updated request without querying users and teacher_class_schedules.
+# It is loaded on first use and kept current by the routes that write schedules
+# (upload_class_schedule, accept_request, cancel_request, delete_request) or
+# add/remove users.
+# It is reloaded after AVAILABILITY_INDEX_TTL_SECONDS to pick up writes made
+# outside this process.
+AVAILABILITY_INDEX_ENABLED = os.getenv("AVAILABILITY_INDEX", "true").lower() in ("1", "true", "yes")
+AVAILABILITY_INDEX_TTL_SECONDS = float(os.getenv("AVAILABILITY_INDEX_TTL_SECONDS", "300"))
+
+# A load that races with this many writes in a row is used as-is and retried on the next call
+_MAX_LOAD_ATTEMPTS = 3
+
+
+def _to_time(value) -> time_type:
+    if isinstance(value, time_type):
+        return value
+    return time_type.fromisoformat(str(value))
+
+
+def _slot_start(slot: tuple) -> time_type:
+    return slot[0]
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._faculty: set[int] = set()
+        # Per weekday (0=Monday), busy slots as (start, end, teacher_id, substitute_request_id, slot_date)
+        # sorted by start; slot_date is set for one-off slots, which only block that date
+        self._days: list[list[tuple]] = [[] for _ in range(7)]
+        self._loaded_at: float | None = None
+        # Bumped on every write so a load that overlapped one can be detected
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self.loads = 0
+        self.lookups = 0
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < AVAILABILITY_INDEX_TTL_SECONDS
+
+    async def ensure_loaded(self, loader):
+        """
+        Load the index if it is missing or expired. `loader` is a zero-arg coroutine
+        factory returning (faculty_ids, schedule_rows); concurrent callers share one load.
+        """
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            for _ in range(_MAX_LOAD_ATTEMPTS):
+                generation = self._generation
+                faculty_ids, schedule_rows = await loader()
+                self._faculty = set(faculty_ids)
+                self._days = [[] for _ in range(7)]
+                for row in schedule_rows:
+                    self._insert(row.get("teacher_id"), row)
+                for slots in self._days:
+                    slots.sort(key=_slot_start)
+                self.loads += 1
+                if generation == self._generation:
+                    self._loaded_at = time.monotonic()
+                    return
+            # Kept writing while we loaded: serve this snapshot once, reload next time
+            self._loaded_at = None
+
+    def free_faculty(self, on_date: date, start: time_type, end: time_type, exclude_user_id: int | None = None) -> list[int]:
+        """Faculty with no slot on `on_date` overlapping [start, end)."""
+        self.lookups += 1
+        slots = self._days[on_date.weekday()]
+        # Only slots starting before the window ends can overlap it
+        candidates = slots[:bisect.bisect_left(slots, end, key=_slot_start)]
+        busy = {
+            teacher_id
+            for _, slot_end, teacher_id, _, slot_date in candidates
+            if slot_end > start and (slot_date is None or slot_date == on_date)
+        }
+        busy.add(exclude_user_id)
+        return sorted(self._faculty - busy)
+
+    def _insert(self, teacher_id: int | None, row: dict):
+        day = row.get("day_of_week")
+        if teacher_id is None or day is None or not 0 <= int(day) <= 6:
+            return
+        slot_date = row.get("slot_date")
+        if slot_date is not None and not isinstance(slot_date, date):
+            slot_date = date.fromisoformat(str(slot_date)[:10])
+        slot = (
+            _to_time(row["start_time"]),
+            _to_time(row["end_time"]),
+            teacher_id,
+            row.get("substitute_request_id"),
+            slot_date,
+        )
+        bisect.insort(self._days[int(day)], slot, key=_slot_start)
+
+    def _remove(self, predicate):
+        for day, slots in enumerate(self._days):
+            self._days[day] = [slot for slot in slots if not predicate(slot)]
+
+    def replace_teacher_schedule(self, teacher_id: int, rows: list[dict]):
+        """Mirror an uploaded schedule, which replaces all of the teacher's slots."""
+        self._generation += 1
+        self._remove(lambda slot: slot[2] == teacher_id)
+        for row in rows:
+            self._insert(teacher_id, row)
+
+    def add_slot(self, teacher_id: int, row: dict):
+        self._generation += 1
+        self._insert(teacher_id, row)
+
+    def remove_request_slots(self, substitute_request_id: int):
+        self._generation += 1
+        self._remove(lambda slot: slot[3] == substitute_request_id)
+
+    def remove_slot(self, teacher_id: int, weekday: int, start: time_type, end: time_type):
+        self._generation += 1
+        self._days[weekday] = [
+            slot for slot in self._days[weekday]
+            if not (slot[2] == teacher_id and slot[0] == start and slot[1] == end)
+        ]
+
+    def add_user(self, user_id: int):
+        self._generation += 1
+        self._faculty.add(user_id)
+
+    def remove_user(self, user_id: int):
+        self._generation += 1
+        self._faculty.discard(user_id)
+        self._remove(lambda slot: slot[2] == user_id)
+
+    def invalidate(self):
+        """Drop the loaded snapshot after a write that may have partly failed."""
+        self._generation += 1
+        self._loaded_at = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": AVAILABILITY_INDEX_ENABLED,
+            "loaded": self._loaded_at is not None,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "faculty": len(self._faculty),
+            "slots": sum(len(slots) for slots in self._days),
+            "loads": self.loads,
+            "lookups": self.lookups,
+        }
+
+
+index = AvailabilityIndex()
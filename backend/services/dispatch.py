@@ -0,0 +1,101 @@
+import asyncio
+import collections
+import os
+import time
+
+# Background stage for work that should not hold up the response, such as picking
+# the faculty to notify and calling the push API. Routes submit jobs to a bounded
+# queue served by a few worker tasks; on shutdown the queue is drained (for up to
+# NOTIFY_DRAIN_TIMEOUT_SECONDS) before the process exits.
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_DRAIN_TIMEOUT_SECONDS = float(os.getenv("NOTIFY_DRAIN_TIMEOUT_SECONDS", "10"))
+
+# Outcomes of the most recent jobs, for GET /api/admin/notifications/stats
+_RECENT_OUTCOMES = 50
+
+
+class Dispatcher:
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.workers = workers
+        self._queue: asyncio.Queue | None = None
+        self._queue_size = queue_size
+        self._tasks: list[asyncio.Task] = []
+        self._accepting = True
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._recent = collections.deque(maxlen=_RECENT_OUTCOMES)
+
+    def start(self):
+        """Start the workers on the running loop (also done lazily by the first submit)."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._accepting = True
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-worker-{index}")
+            for index in range(self.workers)
+        ]
+
+    def submit(self, job_name: str, func, *args, **kwargs) -> bool:
+        """
+        Queue `await func(*args, **kwargs)` to run in the background. Never blocks;
+        returns False (and logs) if the queue is full or shutting down.
+        """
+        if not self._accepting:
+            print(f"[DISPATCH] {self.name} is shutting down, dropped {job_name}")
+            self._stats["rejected"] += 1
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((job_name, func, args, kwargs))
+        except asyncio.QueueFull:
+            print(f"[DISPATCH] {self.name} queue full ({self._queue_size}), dropped {job_name}")
+            self._stats["rejected"] += 1
+            return False
+        self._stats["submitted"] += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            job_name, func, args, kwargs = await self._queue.get()
+            started = time.perf_counter()
+            outcome = {"job": job_name, "at": time.time()}
+            try:
+                await func(*args, **kwargs)
+                self._stats["completed"] += 1
+                outcome["ok"] = True
+            except Exception as e:
+                self._stats["failed"] += 1
+                outcome.update(ok=False, error=str(e))
+                print(f"[DISPATCH] {job_name} failed: {e}")
+            finally:
+                outcome["seconds"] = round(time.perf_counter() - started, 3)
+                self._recent.append(outcome)
+                self._queue.task_done()
+
+    async def drain(self, timeout: float = NOTIFY_DRAIN_TIMEOUT_SECONDS):
+        """Stop taking jobs, wait for queued ones to finish, then stop the workers."""
+        self._accepting = False
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"[DISPATCH] {self.name} drain timed out with {self._queue.qsize()} jobs left")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self._queue_size,
+            "recent": list(self._recent),
+        }
+
+
+notifications = Dispatcher("notifications", NOTIFY_WORKERS, NOTIFY_QUEUE_SIZE)
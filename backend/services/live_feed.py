@@ -0,0 +1,106 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+
+# Fan-out hub for the live request feed (GET /api/requests/stream).
+# Each connection is just a bounded queue plus its filter, so idle subscribers
+# cost a few hundred bytes; publishing is a put_nowait per matching subscriber.
+# The hub is per process: run a single worker (as in the Procfile) or put a
+# shared broker in front before scaling out.
+LIVE_FEED_MAX_SUBSCRIBERS = int(os.getenv("LIVE_FEED_MAX_SUBSCRIBERS", "5000"))
+LIVE_FEED_QUEUE_SIZE = int(os.getenv("LIVE_FEED_QUEUE_SIZE", "100"))
+LIVE_FEED_HEARTBEAT_SECONDS = float(os.getenv("LIVE_FEED_HEARTBEAT_SECONDS", "15"))
+# Streams end after this long and the client reconnects; keeps graceful shutdowns bounded
+LIVE_FEED_MAX_STREAM_SECONDS = float(os.getenv("LIVE_FEED_MAX_STREAM_SECONDS", "300"))
+
+
+class Subscriber:
+    def __init__(self, user_id: int | None, accepts=None):
+        self.user_id = user_id
+        self.accepts = accepts
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_FEED_QUEUE_SIZE)
+        # Set when the queue overflowed; the client is told to refetch instead
+        self.lagged = False
+
+
+class LiveFeedHub:
+    def __init__(self):
+        self._subscribers: set[Subscriber] = set()
+        self._sequence = itertools.count(1)
+        self.published = 0
+        self.dropped = 0
+
+    def is_full(self) -> bool:
+        return len(self._subscribers) >= LIVE_FEED_MAX_SUBSCRIBERS
+
+    def subscribe(self, user_id: int | None, accepts=None) -> Subscriber | None:
+        """Register a connection; returns None when the hub is full."""
+        if self.is_full():
+            return None
+        subscriber = Subscriber(user_id, accepts)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event: str, request: dict):
+        """Queue an event for every subscriber whose filter accepts it. Never blocks."""
+        message = (next(self._sequence), event, request)
+        self.published += 1
+        for subscriber in list(self._subscribers):
+            if subscriber.lagged:
+                continue
+            if subscriber.accepts is not None and not subscriber.accepts(event, request):
+                continue
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                subscriber.lagged = True
+                self.dropped += 1
+
+    async def stream(self, user_id: int | None, accepts=None):
+        """
+        Server-Sent Events for one connection, with heartbeats while idle. The connection
+        is registered here rather than by the caller, so it is only held while the
+        response is actually streaming and is always released.
+        """
+        subscriber = self.subscribe(user_id, accepts)
+        if subscriber is None:
+            # Filled up since the route checked; the client keeps polling
+            yield "event: full\ndata: {}\n\n"
+            return
+        deadline = time.monotonic() + LIVE_FEED_MAX_STREAM_SECONDS
+        try:
+            yield "retry: 5000\n\n"
+            while time.monotonic() < deadline:
+                if subscriber.lagged:
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.lagged = False
+                    yield "event: resync\ndata: {}\n\n"
+                    continue
+                try:
+                    sequence, event, request = await asyncio.wait_for(
+                        subscriber.queue.get(),
+                        timeout=min(LIVE_FEED_HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0)),
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {sequence}\nevent: {event}\ndata: {json.dumps(request, default=str)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "max_subscribers": LIVE_FEED_MAX_SUBSCRIBERS,
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+hub = LiveFeedHub()
@@ -0,0 +1,569 @@
+import json
+import re
+import sqlite3
+import threading
+from datetime import date, time, datetime, timedelta, timezone
+
+# SQLite stand-in for the Supabase tables, used when DATA_BACKEND=local.
+# It speaks the subset of the PostgREST query builder the routes use
+# (select/insert/update/delete, eq/neq/in_/lt/gt/lte/gte, or_, order, limit and
+# foreign-key embeds such as "teacher:users!substitute_requests_teacher_id_fkey(name)"),
+# so every endpoint can be benchmarked and profiled without a Supabase project.
+
+_NOW = "(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS admins (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_id TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    name TEXT NOT NULL,
+    role TEXT NOT NULL DEFAULT 'manager' CHECK (role IN ('super_admin', 'manager')),
+    is_active BOOLEAN DEFAULT 1,
+    created_at TIMESTAMP DEFAULT {_NOW},
+    last_login TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    auth_id TEXT UNIQUE,
+    name TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password TEXT,
+    department TEXT,
+    phone TEXT,
+    email_verified BOOLEAN DEFAULT 0,
+    push_token TEXT,
+    created_at TIMESTAMP DEFAULT {_NOW}
+);
+
+CREATE TABLE IF NOT EXISTS substitute_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    teacher_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    request_type TEXT DEFAULT 'class',
+    subject TEXT,
+    date DATE NOT NULL,
+    time TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    classroom TEXT,
+    campus TEXT,
+    notes TEXT,
+    status TEXT DEFAULT 'pending',
+    accepted_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    start_time TEXT,
+    end_time TEXT,
+    created_at TIMESTAMP DEFAULT {_NOW},
+    updated_at TIMESTAMP DEFAULT {_NOW}
+);
+
+CREATE TABLE IF NOT EXISTS teacher_class_schedules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day_of_week INTEGER NOT NULL CHECK (day_of_week BETWEEN 0 AND 6),
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    slot_date DATE,
+    subject TEXT,
+    classroom TEXT,
+    source_file TEXT,
+    substitute_request_id INTEGER REFERENCES substitute_requests(id) ON DELETE CASCADE,
+    created_at TIMESTAMP DEFAULT {_NOW},
+    updated_at TIMESTAMP DEFAULT {_NOW},
+    CHECK (start_time < end_time)
+);
+
+CREATE TABLE IF NOT EXISTS pending_invites (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    department TEXT,
+    phone TEXT,
+    invite_token TEXT UNIQUE NOT NULL,
+    invited_by INTEGER REFERENCES admins(id) ON DELETE SET NULL,
+    status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'accepted', 'expired')),
+    created_at TIMESTAMP DEFAULT {_NOW},
+    expires_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now', '+7 days'))
+);
+
+CREATE TABLE IF NOT EXISTS allowed_emails (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE NOT NULL,
+    name TEXT,
+    department TEXT,
+    added_at TIMESTAMP DEFAULT {_NOW}
+);
+
+CREATE TABLE IF NOT EXISTS substitute_request_tombstones (
+    request_id INTEGER PRIMARY KEY,
+    teacher_id INTEGER,
+    accepted_by INTEGER,
+    deleted_at TIMESTAMP DEFAULT {_NOW}
+);
+
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL DEFAULT 'push',
+    audience JSONB,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    push_token TEXT,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    data JSONB,
+    parent_id INTEGER REFERENCES notification_outbox(id) ON DELETE CASCADE,
+    coalesce_key TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT {_NOW},
+    last_error TEXT,
+    ticket_id TEXT,
+    receipt_status TEXT,
+    created_at TIMESTAMP DEFAULT {_NOW},
+    sent_at TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS record_substitute_request_tombstone
+AFTER DELETE ON substitute_requests
+BEGIN
+    INSERT OR REPLACE INTO substitute_request_tombstones (request_id, teacher_id, accepted_by, deleted_at)
+    VALUES (OLD.id, OLD.teacher_id, OLD.accepted_by, {_NOW});
+END;
+
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_requests_status ON substitute_requests(status);
+CREATE INDEX IF NOT EXISTS idx_requests_teacher ON substitute_requests(teacher_id);
+CREATE INDEX IF NOT EXISTS idx_requests_updated_at ON substitute_requests(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_requests_accepted_window ON substitute_requests(accepted_by, date, start_time, end_time) WHERE status = 'accepted';
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox(next_attempt_at) WHERE status IN ('pending', 'sending');
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_coalesce ON notification_outbox(coalesce_key) WHERE status = 'pending';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notification_outbox_parent ON notification_outbox(parent_id, user_id);
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_receipts ON notification_outbox(sent_at) WHERE receipt_status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_dead ON notification_outbox(id) WHERE status = 'dead';
+CREATE INDEX IF NOT EXISTS idx_request_tombstones_deleted_at ON substitute_request_tombstones(deleted_at, request_id);
+CREATE INDEX IF NOT EXISTS idx_teacher_schedule_teacher ON teacher_class_schedules(teacher_id);
+CREATE INDEX IF NOT EXISTS idx_teacher_schedule_day ON teacher_class_schedules(day_of_week);
+"""
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_EMBED = re.compile(r"^(?:(\w+):)?(\w+)(?:!(\w+))?\((.*)\)$")
+
+_OPERATORS = {
+    "eq": "=",
+    "neq": "<>",
+    "lt": "<",
+    "gt": ">",
+    "lte": "<=",
+    "gte": ">=",
+}
+
+
+def _quote(name: str) -> str:
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column name: {name}")
+    return f'"{name}"'
+
+
+def _split_columns(columns: str) -> list[str]:
+    """Split a select string on top-level commas (commas inside embeds are kept)."""
+    parts, depth, current = [], 0, ""
+    for char in columns:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _split_logic(expression: str) -> list[str]:
+    """Split a PostgREST logic tree on top-level commas, respecting double-quoted values."""
+    parts, depth, current, quoted, escaped = [], 0, "", False, False
+    for char in expression:
+        if escaped:
+            escaped = False
+        elif char == "\\" and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _time_window(value, duration) -> tuple[str | None, str | None]:
+    for fmt in ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p"):
+        try:
+            start = datetime.strptime(str(value).strip(), fmt)
+            break
+        except ValueError:
+            continue
+    else:
+        return None, None
+    end = start + timedelta(minutes=int(duration or 0))
+    return start.strftime("%H:%M:%S"), end.strftime("%H:%M:%S")
+
+
+def _to_sql(value):
+    if isinstance(value, bool):
+        return int(value)
+    if value == "now()":
+        return _now_iso()
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+class LocalResponse:
+    """Mirrors the `.data` / `.count` shape of a postgrest APIResponse."""
+
+    def __init__(self, data: list[dict], count: int = None):
+        self.data = data
+        self.count = count
+
+
+class LocalQuery:
+    def __init__(self, store: "LocalStore", table: str):
+        self._store = store
+        self._table = table
+        self._operation = "select"
+        self._columns = "*"
+        self._payload = None
+        self._filters: list[tuple[str, str, object]] = []
+        self._order: list[tuple[str, bool]] = []
+        self._limit = None
+
+    def select(self, columns: str = "*", count: str = None):
+        self._operation = "select"
+        self._columns = columns
+        return self
+
+    def insert(self, payload):
+        self._operation = "insert"
+        self._payload = payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "id", ignore_duplicates: bool = False):
+        self._operation = "upsert"
+        self._payload = payload
+        self._on_conflict = on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, payload: dict):
+        self._operation = "update"
+        self._payload = payload
+        return self
+
+    def delete(self):
+        self._operation = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self._filters.append((column, "eq", value))
+        return self
+
+    def neq(self, column: str, value):
+        self._filters.append((column, "neq", value))
+        return self
+
+    def lt(self, column: str, value):
+        self._filters.append((column, "lt", value))
+        return self
+
+    def gt(self, column: str, value):
+        self._filters.append((column, "gt", value))
+        return self
+
+    def lte(self, column: str, value):
+        self._filters.append((column, "lte", value))
+        return self
+
+    def gte(self, column: str, value):
+        self._filters.append((column, "gte", value))
+        return self
+
+    def or_(self, filters: str):
+        self._filters.append(("", "or", filters))
+        return self
+
+    def in_(self, column: str, values):
+        self._filters.append((column, "in", list(values)))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int):
+        self._limit = size
+        return self
+
+    async def execute(self) -> LocalResponse:
+        # In-memory SQLite answers in microseconds, so this runs inline on the loop
+        return LocalResponse(self._store.run(self))
+
+
+class LocalStore:
+    """
+    SQLite-backed stand-in for the async Supabase client (`.table(name)`).
+    Defaults to a private in-memory database; pass a file path to keep data between runs.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(SCHEMA)
+        self._columns = {}
+        self._foreign_keys = {}
+        for (table,) in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"):
+            self._columns[table] = {
+                row["name"]: (row["type"] or "").upper()
+                for row in self._conn.execute(f"PRAGMA table_info({_quote(table)})")
+            }
+            self._foreign_keys[table] = {
+                row["from"]: row["table"]
+                for row in self._conn.execute(f"PRAGMA foreign_key_list({_quote(table)})")
+            }
+
+    def table(self, name: str) -> LocalQuery:
+        if name not in self._columns:
+            raise ValueError(f"Unknown table: {name}")
+        return LocalQuery(self, name)
+
+    def load_fixtures(self, path: str):
+        """Seed tables from a JSON file shaped like {"users": [{...}], "admins": [...]}."""
+        with open(path) as fixture_file:
+            fixtures = json.load(fixture_file)
+        for table in ["admins", "users", "substitute_requests", "teacher_class_schedules", "pending_invites", "allowed_emails"]:
+            rows = fixtures.get(table)
+            if rows:
+                self.run(self.table(table).insert(rows))
+
+    def run(self, query: LocalQuery) -> list[dict]:
+        with self._lock:
+            try:
+                rows = getattr(self, f"_run_{query._operation}")(query)
+                self._conn.commit()
+                return rows
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _logic(self, expression: str, joiner: str) -> tuple[str, list]:
+        """Translate a PostgREST logic tree such as "date.gt.x,and(date.eq.x,id.gt.1)" into SQL."""
+        clauses, params = [], []
+        for part in _split_logic(expression):
+            group = re.match(r"^(and|or)\((.*)\)$", part, re.DOTALL)
+            if group:
+                clause, group_params = self._logic(group.group(2), group.group(1).upper())
+                clauses.append(f"({clause})")
+                params.extend(group_params)
+                continue
+            column, operator, value = part.split(".", 2)
+            value = _unquote(value)
+            if operator == "is" and value == "null":
+                clauses.append(f"{_quote(column)} IS NULL")
+            else:
+                clauses.append(f"{_quote(column)} {_OPERATORS[operator]} ?")
+                params.append(value)
+        return f" {joiner} ".join(clauses), params
+
+    def _where(self, query: LocalQuery) -> tuple[str, list]:
+        clauses, params = [], []
+        for column, operator, value in query._filters:
+            if operator == "or":
+                clause, logic_params = self._logic(value, "OR")
+                clauses.append(f"({clause})")
+                params.extend(logic_params)
+            elif operator == "in":
+                if not value:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{_quote(column)} IN ({', '.join('?' for _ in value)})")
+                params.extend(_to_sql(item) for item in value)
+            elif value is None and operator in ("eq", "neq"):
+                clauses.append(f"{_quote(column)} IS {'NOT ' if operator == 'neq' else ''}NULL")
+            else:
+                clauses.append(f"{_quote(column)} {_OPERATORS[operator]} ?")
+                params.append(_to_sql(value))
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def _row(self, table: str, row: sqlite3.Row) -> dict:
+        types = self._columns[table]
+        result = {}
+        for key in row.keys():
+            value = row[key]
+            if value is not None and types.get(key) == "BOOLEAN":
+                value = bool(value)
+            elif value is not None and types.get(key) == "JSONB":
+                value = json.loads(value)
+            result[key] = value
+        return result
+
+    def _run_select(self, query: LocalQuery) -> list[dict]:
+        table = query._table
+        plain, embeds = [], []
+        for part in _split_columns(query._columns or "*"):
+            match = _EMBED.match(part)
+            if match:
+                embeds.append(match.groups())
+            else:
+                plain.append(part)
+
+        columns = ["*"] if "*" in plain else list(plain)
+        hidden = []
+        resolved_embeds = []
+        for alias, related, hint, related_columns in embeds:
+            fk_column = self._resolve_foreign_key(table, related, hint)
+            if "*" not in columns and fk_column not in columns:
+                columns.append(fk_column)
+                hidden.append(fk_column)
+            resolved_embeds.append((alias or related, related, fk_column, related_columns))
+
+        select_list = ", ".join("*" if column == "*" else _quote(column) for column in columns) or "*"
+        where, params = self._where(query)
+        sql = f"SELECT {select_list} FROM {_quote(table)}{where}"
+        if query._order:
+            # Match Postgres: NULLs sort last ascending and first descending
+            sql += " ORDER BY " + ", ".join(
+                f"{_quote(column)} {'DESC NULLS FIRST' if desc else 'ASC NULLS LAST'}" for column, desc in query._order
+            )
+        if query._limit is not None:
+            sql += f" LIMIT {int(query._limit)}"
+
+        rows = [self._row(table, row) for row in self._conn.execute(sql, params)]
+
+        for key, related, fk_column, related_columns in resolved_embeds:
+            ids = {row.get(fk_column) for row in rows if row.get(fk_column) is not None}
+            related_rows = {}
+            if ids:
+                wanted = [column.strip() for column in related_columns.split(",") if column.strip()]
+                if "*" in wanted:
+                    related_select = "*"
+                else:
+                    related_select = ", ".join(_quote(column) for column in dict.fromkeys(["id", *wanted]))
+                placeholders = ", ".join("?" for _ in ids)
+                for related_row in self._conn.execute(
+                    f"SELECT {related_select} FROM {_quote(related)} WHERE id IN ({placeholders})", list(ids)
+                ):
+                    data = self._row(related, related_row)
+                    if "*" not in wanted and "id" not in wanted:
+                        related_id = data.pop("id")
+                    else:
+                        related_id = data["id"]
+                    related_rows[related_id] = data
+            for row in rows:
+                row[key] = related_rows.get(row.get(fk_column))
+
+        for row in rows:
+            for column in hidden:
+                row.pop(column, None)
+        return rows
+
+    def _resolve_foreign_key(self, table: str, related: str, hint: str | None) -> str:
+        # PostgREST hints look like "<table>_<column>_fkey"
+        if hint and hint.startswith(f"{table}_") and hint.endswith("_fkey"):
+            column = hint[len(table) + 1:-len("_fkey")]
+            if self._foreign_keys[table].get(column) == related:
+                return column
+        candidates = [column for column, target in self._foreign_keys[table].items() if target == related]
+        if len(candidates) != 1:
+            raise ValueError(f"Could not resolve relationship between {table} and {related}")
+        return candidates[0]
+
+    def _run_insert(self, query: LocalQuery) -> list[dict]:
+        table = query._table
+        payload = query._payload if isinstance(query._payload, list) else [query._payload]
+        inserted = []
+        for record in payload:
+            columns = list(record.keys())
+            sql = (
+                f"INSERT INTO {_quote(table)} ({', '.join(_quote(column) for column in columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)}) RETURNING *"
+            )
+            inserted.extend(
+                self._row(table, row) for row in self._conn.execute(sql, [_to_sql(record[column]) for column in columns])
+            )
+        return self._set_time_window(table, inserted)
+
+    def _run_upsert(self, query: LocalQuery) -> list[dict]:
+        table = query._table
+        payload = query._payload if isinstance(query._payload, list) else [query._payload]
+        upserted = []
+        conflict_columns = [column.strip() for column in query._on_conflict.split(",")]
+        for record in payload:
+            columns = list(record.keys())
+            updates = ", ".join(
+                f"{_quote(column)} = excluded.{_quote(column)}" for column in columns if column not in conflict_columns
+            )
+            # Like PostgREST, only newly inserted rows come back when duplicates are ignored
+            action = "NOTHING" if query._ignore_duplicates else f"UPDATE SET {updates}"
+            sql = (
+                f"INSERT INTO {_quote(table)} ({', '.join(_quote(column) for column in columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT ({', '.join(_quote(column) for column in conflict_columns)}) DO {action} RETURNING *"
+            )
+            upserted.extend(
+                self._row(table, row) for row in self._conn.execute(sql, [_to_sql(record[column]) for column in columns])
+            )
+        return self._set_time_window(table, upserted)
+
+    def _set_time_window(self, table: str, rows: list[dict]) -> list[dict]:
+        # Stands in for the set_request_time_window trigger in schema.sql
+        if table != "substitute_requests":
+            return rows
+        for row in rows:
+            start, end = _time_window(row.get("time"), row.get("duration"))
+            if (start, end) != (row.get("start_time"), row.get("end_time")):
+                self._conn.execute(
+                    "UPDATE substitute_requests SET start_time = ?, end_time = ? WHERE id = ?",
+                    [start, end, row["id"]],
+                )
+                row.update(start_time=start, end_time=end)
+        return rows
+
+    def _run_update(self, query: LocalQuery) -> list[dict]:
+        table = query._table
+        values = dict(query._payload)
+        # Stands in for the update_updated_at_column trigger in schema.sql
+        if "updated_at" in self._columns[table] and "updated_at" not in values:
+            values["updated_at"] = _now_iso()
+        assignments = ", ".join(f"{_quote(column)} = ?" for column in values)
+        where, params = self._where(query)
+        sql = f"UPDATE {_quote(table)} SET {assignments}{where} RETURNING *"
+        rows = self._conn.execute(sql, [_to_sql(value) for value in values.values()] + params)
+        return self._set_time_window(table, [self._row(table, row) for row in rows])
+
+    def _run_delete(self, query: LocalQuery) -> list[dict]:
+        table = query._table
+        where, params = self._where(query)
+        rows = self._conn.execute(f"DELETE FROM {_quote(table)}{where} RETURNING *", params)
+        return [self._row(table, row) for row in rows]
@@ -0,0 +1,446 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from database import get_async_supabase
+from services import dispatch, push_tokens
+from services.push_notifications import (
+    EXPO_BATCH_SIZE,
+    PUSH_MAX_PARALLEL_CHUNKS,
+    _build_message,
+    fetch_push_receipts,
+    prune_push_tokens,
+    send_push_messages,
+)
+
+# Durable notification outbox (notification_outbox table). Routes write one row per
+# notification right after their state change commits; background workers expand it
+# into one row per device, send those in Expo batches and record the outcome of each.
+# Failed sends are retried with exponential backoff and dead-lettered after
+# OUTBOX_MAX_ATTEMPTS; rows left over by a crash or restart are picked up by the poller.
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+# A claimed row that is not settled within this long (worker crashed) is claimed again
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "10"))
+# Expo receipts (the real delivery outcome) are checked once they are this old;
+# Expo suggests waiting about 15 minutes and keeps them for about a day
+OUTBOX_RECEIPT_DELAY_SECONDS = float(os.getenv("OUTBOX_RECEIPT_DELAY_SECONDS", "900"))
+OUTBOX_RECEIPT_POLL_SECONDS = float(os.getenv("OUTBOX_RECEIPT_POLL_SECONDS", "300"))
+# Notifications sharing a coalesce key (e.g. "request:42") and audience replace each
+# other while still waiting, so a burst of edits sends only the latest. Held
+# notifications wait this long after the first of the burst before going out.
+OUTBOX_COALESCE_WINDOW_SECONDS = float(os.getenv("OUTBOX_COALESCE_WINDOW_SECONDS", "60"))
+_RECEIPT_TTL = timedelta(hours=24)
+_RECEIPT_BATCH_SIZE = 1000
+
+# Expo errors that will fail the same way on every retry
+_PERMANENT_ERRORS = {"DeviceNotRegistered", "MessageTooBig"}
+
+# audience type -> async resolver(audience) returning the user ids to notify
+_resolvers = {}
+
+_run_lock = asyncio.Lock()
+_rerun = False
+_poller: asyncio.Task | None = None
+_stats = {
+    "enqueued": 0, "expanded": 0, "sent": 0, "retried": 0, "dead": 0, "runs": 0, "unqueued": 0,
+    "receipts_ok": 0, "receipt_errors": 0, "receipts_expired": 0, "superseded": 0,
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _backoff_seconds(attempts: int) -> float:
+    return min(OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX_SECONDS)
+
+
+def register_audience(audience_type: str, resolver):
+    """Teach the outbox a new kind of audience (e.g. faculty free during a request)."""
+    _resolvers[audience_type] = resolver
+
+
+async def _users_with_tokens(audience: dict) -> list[dict]:
+    audience_type = audience.get("type")
+    if audience_type == "user":
+        return await push_tokens.lookup(user_ids=[audience["user_id"]])
+    if audience_type == "users":
+        return await push_tokens.lookup(user_ids=audience["user_ids"])
+    if audience_type == "department":
+        return await push_tokens.lookup(department=audience["department"])
+    if audience_type in _resolvers:
+        return await push_tokens.lookup(user_ids=await _resolvers[audience_type](audience))
+    if audience_type == "all":
+        return await push_tokens.lookup()
+    raise ValueError(f"Unknown notification audience: {audience_type}")
+
+
+def _audience_key(audience: dict) -> str:
+    """Who a notification goes to, ignoring resolver inputs such as the request it describes."""
+    audience_type = audience.get("type")
+    if audience_type == "user":
+        return f"user:{audience['user_id']}"
+    if audience_type == "users":
+        return "users:" + ",".join(str(user_id) for user_id in sorted(audience["user_ids"]))
+    if audience_type == "department":
+        return f"department:{audience['department']}"
+    return str(audience_type)
+
+
+async def enqueue(audience: dict, title: str, body: str, data: dict = None, coalesce_key: str | None = None, hold: bool = False):
+    """
+    Record a notification for `audience` (e.g. {"type": "user", "user_id": 3}) and
+    wake a worker to deliver it. Recipients are worked out by the worker.
+
+    A notification with a `coalesce_key` replaces any still waiting with the same key
+    and audience; with `hold` it waits out the coalescing window so later ones can
+    replace it too.
+    """
+    send_at = _now() + timedelta(seconds=OUTBOX_COALESCE_WINDOW_SECONDS if hold else 0)
+    if coalesce_key is not None:
+        # A notification for someone else (e.g. the requester vs free faculty) must not replace this one
+        coalesce_key = f"{coalesce_key}|{_audience_key(audience)}"
+        superseded = await _supersede(coalesce_key)
+        # The window runs from the first notification of a burst, so edits can't postpone it forever
+        send_at = min([send_at, *(datetime.fromisoformat(row["next_attempt_at"]) for row in superseded)])
+    await _insert([{
+        "kind": "fanout",
+        "audience": audience,
+        "title": title,
+        "body": body,
+        "data": data or {},
+        "coalesce_key": coalesce_key,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": send_at.isoformat(),
+    }])
+
+
+async def _supersede(coalesce_key: str, user_ids: list[int] | None = None) -> list[dict]:
+    """Retire waiting notifications with this key: fanouts, or the pushes to `user_ids`."""
+    supabase = await get_async_supabase()
+    query = supabase.table("notification_outbox")\
+        .update({"status": "superseded"})\
+        .eq("coalesce_key", coalesce_key)\
+        .eq("status", "pending")
+    if user_ids is None:
+        query = query.eq("kind", "fanout")
+    else:
+        query = query.eq("kind", "push").in_("user_id", user_ids)
+    try:
+        result = await query.execute()
+    except Exception as e:
+        print(f"[OUTBOX] Could not coalesce {coalesce_key}: {e}")
+        return []
+    _stats["superseded"] += len(result.data or [])
+    return result.data or []
+
+
+async def _insert(rows: list[dict]):
+    supabase = await get_async_supabase()
+    try:
+        await supabase.table("notification_outbox").insert(rows).execute()
+    except Exception as e:
+        # e.g. the notification_outbox migration has not been run yet
+        print(f"[OUTBOX] Could not record {len(rows)} notifications, sending without retries: {e}")
+        dispatch.notifications.submit("notify_unrecorded", _send_unrecorded, rows)
+        return
+    _stats["enqueued"] += len(rows)
+    kick()
+
+
+async def _send_unrecorded(rows: list[dict]):
+    messages = []
+    for row in rows:
+        if row["kind"] == "fanout":
+            recipients = await _users_with_tokens(row["audience"])
+        else:
+            recipients = [{"push_token": row["push_token"]}]
+        messages.extend(_build_message(user["push_token"], row["title"], row["body"], row["data"]) for user in recipients)
+    tickets = await send_push_messages(messages)
+    failed = sum(1 for ticket in tickets if ticket.get("status") != "ok")
+    if failed:
+        # Raising lets the dispatch worker record the job as failed
+        raise RuntimeError(f"notify_unrecorded: {failed} of {len(messages)} pushes were not accepted")
+
+
+def kick():
+    """Ask a background worker to process due rows now rather than at the next poll."""
+    if not dispatch.notifications.submit("outbox", process_due):
+        # The poller will still find the rows
+        _stats["unqueued"] += 1
+
+
+async def process_due():
+    """Deliver due rows until none are left; concurrent calls fold into the running one."""
+    global _rerun
+    if _run_lock.locked():
+        _rerun = True
+        return
+    async with _run_lock:
+        while True:
+            _rerun = False
+            claimed = await _process_batch()
+            if claimed < OUTBOX_BATCH_SIZE and not _rerun:
+                return
+
+
+async def _claim(supabase, now: datetime) -> list[dict]:
+    # 'sending' rows come back once their lease (stored in next_attempt_at) runs out
+    due = await supabase.table("notification_outbox")\
+        .select("id")\
+        .in_("status", ["pending", "sending"])\
+        .lte("next_attempt_at", now.isoformat())\
+        .order("next_attempt_at")\
+        .limit(OUTBOX_BATCH_SIZE)\
+        .execute()
+    ids = [row["id"] for row in (due.data or [])]
+    if not ids:
+        return []
+    # Only rows still due are taken, so another process claiming the same ids gets none of them
+    claimed = await supabase.table("notification_outbox")\
+        .update({"status": "sending", "next_attempt_at": (now + timedelta(seconds=OUTBOX_LEASE_SECONDS)).isoformat()})\
+        .in_("id", ids)\
+        .in_("status", ["pending", "sending"])\
+        .lte("next_attempt_at", now.isoformat())\
+        .execute()
+    return claimed.data or []
+
+
+async def _expand(supabase, row: dict, now: datetime) -> list[dict]:
+    """Turn a fanout row into claimed per-device rows."""
+    recipients = await _users_with_tokens(row["audience"] or {})
+    if not recipients:
+        return []
+    if row.get("coalesce_key"):
+        # Older pushes for the same thing still waiting on a retry are replaced by this one
+        await _supersede(row["coalesce_key"], [user["id"] for user in recipients])
+    # A fanout claimed again after a crash mid-expansion only adds the pushes it is still missing
+    result = await supabase.table("notification_outbox")\
+        .upsert([
+            {
+                "kind": "push",
+                "parent_id": row["id"],
+                "user_id": user["id"],
+                "push_token": user["push_token"],
+                "title": row["title"],
+                "body": row["body"],
+                "data": row["data"],
+                "coalesce_key": row.get("coalesce_key"),
+                "status": "sending",
+                "attempts": 0,
+                "next_attempt_at": (now + timedelta(seconds=OUTBOX_LEASE_SECONDS)).isoformat(),
+            }
+            for user in recipients
+        ], on_conflict="parent_id,user_id", ignore_duplicates=True)\
+        .execute()
+    _stats["expanded"] += 1
+    return result.data or []
+
+
+def _settle(row: dict, error: str | None, now: datetime, ticket_id: str | None = None, permanent: bool = False) -> dict:
+    row = dict(row)
+    if error is None:
+        row.update(
+            status="sent",
+            sent_at=now.isoformat(),
+            last_error=None,
+            ticket_id=ticket_id,
+            receipt_status="pending" if ticket_id else None,
+        )
+        if row.get("kind") != "fanout":
+            _stats["sent"] += 1
+        return row
+    row["attempts"] = (row.get("attempts") or 0) + 1
+    row["last_error"] = error[:500]
+    if permanent or row["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+        row["status"] = "dead"
+        _stats["dead"] += 1
+        print(f"[OUTBOX] Notification {row['id']} dead-lettered after {row['attempts']} attempts: {error}")
+    else:
+        row["status"] = "pending"
+        row["next_attempt_at"] = (now + timedelta(seconds=_backoff_seconds(row["attempts"]))).isoformat()
+        _stats["retried"] += 1
+    return row
+
+
+def _coalesce(rows: list[dict], settled: list[dict]) -> list[dict]:
+    """Within one batch, keep only the newest row per coalesce key (and recipient)."""
+    latest = {}
+    for row in rows:
+        if row.get("coalesce_key"):
+            key = (row["coalesce_key"], row.get("kind"), row.get("user_id"))
+            latest[key] = max(latest.get(key, 0), row["id"])
+    kept = []
+    for row in rows:
+        key = (row.get("coalesce_key"), row.get("kind"), row.get("user_id"))
+        if row.get("coalesce_key") and latest[key] != row["id"]:
+            settled.append({**row, "status": "superseded"})
+            _stats["superseded"] += 1
+        else:
+            kept.append(row)
+    return kept
+
+
+async def _process_batch() -> int:
+    supabase = await get_async_supabase()
+    now = _now()
+    claimed = await _claim(supabase, now)
+    if not claimed:
+        return 0
+    _stats["runs"] += 1
+
+    settled = []
+    claimed = _coalesce(claimed, settled)
+    pushes = [row for row in claimed if row.get("kind") != "fanout"]
+    for row in claimed:
+        if row.get("kind") != "fanout":
+            continue
+        try:
+            pushes.extend(await _expand(supabase, row, now))
+        except Exception as e:
+            settled.append(_settle(row, f"Could not resolve recipients: {e}", now))
+            continue
+        settled.append(_settle(row, None, now))
+
+    pushes = _coalesce(pushes, settled)
+    if settled:
+        # Expanded fanouts are recorded before sending, so they are not expanded again
+        await supabase.table("notification_outbox").upsert(settled).execute()
+
+    semaphore = asyncio.Semaphore(PUSH_MAX_PARALLEL_CHUNKS)
+
+    async def send(chunk: list[dict]):
+        async with semaphore:
+            tickets = await send_push_messages([
+                _build_message(row["push_token"], row["title"], row["body"], row["data"]) for row in chunk
+            ])
+        outcomes = []
+        for row, ticket in zip(chunk, tickets):
+            if ticket.get("status") == "ok":
+                outcomes.append(_settle(row, None, now, ticket_id=ticket.get("id")))
+                continue
+            error = (ticket.get("details") or {}).get("error")
+            outcomes.append(_settle(row, error or ticket.get("message") or "Unknown error", now, permanent=error in _PERMANENT_ERRORS))
+        # Recorded as soon as Expo answers, so a later failure in the batch cannot resend these
+        await supabase.table("notification_outbox").upsert(outcomes).execute()
+
+    results = await asyncio.gather(
+        *(send(pushes[index:index + EXPO_BATCH_SIZE]) for index in range(0, len(pushes), EXPO_BATCH_SIZE)),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    print(f"[OUTBOX] Processed {len(claimed)} rows, sent {len(pushes)} pushes")
+    return len(claimed)
+
+
+async def check_receipts() -> int:
+    """
+    Fetch the receipts of pushes sent a while ago. Devices that turned out to be
+    unregistered lose their token; other delivery errors are retried like send errors.
+    Returns how many rows got a final receipt status.
+    """
+    supabase = await get_async_supabase()
+    now = _now()
+    result = await supabase.table("notification_outbox")\
+        .select("*")\
+        .eq("receipt_status", "pending")\
+        .lte("sent_at", (now - timedelta(seconds=OUTBOX_RECEIPT_DELAY_SECONDS)).isoformat())\
+        .order("sent_at")\
+        .limit(_RECEIPT_BATCH_SIZE)\
+        .execute()
+    rows = result.data or []
+    if not rows:
+        return 0
+    receipts = await fetch_push_receipts([row["ticket_id"] for row in rows])
+
+    checked, unregistered = [], []
+    for row in rows:
+        receipt = receipts.get(row["ticket_id"])
+        if receipt is None:
+            # Not ready yet, or already gone from Expo
+            if datetime.fromisoformat(row["sent_at"]) < now - _RECEIPT_TTL:
+                checked.append({**row, "receipt_status": "expired"})
+                _stats["receipts_expired"] += 1
+            continue
+        if receipt.get("status") == "ok":
+            checked.append({**row, "receipt_status": "ok"})
+            _stats["receipts_ok"] += 1
+            continue
+        error = (receipt.get("details") or {}).get("error")
+        _stats["receipt_errors"] += 1
+        if error == "DeviceNotRegistered":
+            unregistered.append(row["push_token"])
+        checked.append(_settle(
+            {**row, "receipt_status": "error"},
+            error or receipt.get("message") or "Unknown error",
+            now,
+            permanent=error in _PERMANENT_ERRORS,
+        ))
+
+    if unregistered:
+        await prune_push_tokens(unregistered)
+    if checked:
+        await supabase.table("notification_outbox").upsert(checked).execute()
+    if any(row["status"] == "pending" for row in checked):
+        kick()
+    print(f"[OUTBOX] Checked {len(checked)} of {len(rows)} receipts, {len(unregistered)} devices unregistered")
+    return len(checked)
+
+
+async def _poll():
+    receipts_due = 0.0
+    while True:
+        try:
+            await process_due()
+        except Exception as e:
+            print(f"[OUTBOX] Poll failed: {e}")
+        if time.monotonic() >= receipts_due:
+            try:
+                while await check_receipts() >= _RECEIPT_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                print(f"[OUTBOX] Receipt check failed: {e}")
+            receipts_due = time.monotonic() + OUTBOX_RECEIPT_POLL_SECONDS
+        await asyncio.sleep(OUTBOX_POLL_SECONDS)
+
+
+def start():
+    """Start the poller that picks up retries and rows left by a previous process."""
+    global _poller
+    if _poller is None:
+        _poller = asyncio.create_task(_poll(), name="outbox-poller")
+
+
+async def stop():
+    global _poller
+    if _poller is not None:
+        _poller.cancel()
+        await asyncio.gather(_poller, return_exceptions=True)
+    _poller = None
+
+
+async def dead_letters(limit: int = 50) -> list[dict]:
+    supabase = await get_async_supabase()
+    result = await supabase.table("notification_outbox")\
+        .select("*")\
+        .eq("status", "dead")\
+        .order("id", desc=True)\
+        .limit(limit)\
+        .execute()
+    return result.data or []
+
+
+def stats() -> dict:
+    return {
+        **_stats,
+        "poller_running": _poller is not None and not _poller.done(),
+        "max_attempts": OUTBOX_MAX_ATTEMPTS,
+    }
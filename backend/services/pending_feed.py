@@ -0,0 +1,77 @@
+import hashlib
+import os
+import time
+import uuid
+
+from services.cache import TTLCache, SingleFlight
+
+# Version of the pending request feed (GET /api/requests/). Every route that can
+# change what the feed shows calls mark_changed(), so polls can be answered with
+# 304 Not Modified while the version (and therefore the ETag) is unchanged.
+# The version is also bumped after PENDING_FEED_VERSION_TTL_SECONDS so that writes
+# made outside this process (e.g. in the Supabase dashboard) show up eventually.
+PENDING_FEED_VERSION_TTL_SECONDS = float(os.getenv("PENDING_FEED_VERSION_TTL_SECONDS", "300"))
+# Pre-serialized pages of the feed for the current version, shared by all users
+PENDING_FEED_CACHE_SIZE = int(os.getenv("PENDING_FEED_CACHE_SIZE", "64"))
+
+# Distinguishes versions across restarts, when the counter starts over
+_instance_id = uuid.uuid4().hex[:8]
+_version = 0
+_changed_at = time.monotonic()
+
+_pages = TTLCache(maxsize=PENDING_FEED_CACHE_SIZE, ttl=PENDING_FEED_VERSION_TTL_SECONDS)
+_page_flight = SingleFlight()
+
+
+def mark_changed():
+    """Record a write that may change the pending feed (drops the cached pages)."""
+    global _version, _changed_at
+    _version += 1
+    _changed_at = time.monotonic()
+    _pages.clear()
+
+
+def current_version() -> int:
+    if time.monotonic() - _changed_at > PENDING_FEED_VERSION_TTL_SECONDS:
+        mark_changed()
+    return _version
+
+
+def etag(*variant) -> str:
+    """ETag for the current feed version; `variant` covers query parameters such as limit/cursor."""
+    digest = hashlib.sha1(repr(variant).encode()).hexdigest()[:12]
+    return f'"{_instance_id}-{current_version()}-{digest}"'
+
+
+def matches(if_none_match: str | None, tag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return "*" in candidates or tag in candidates or f"W/{tag}" in candidates
+
+
+async def get_page(variant: tuple, loader):
+    """
+    Cached page of the feed for the current version. `loader` is a zero-arg coroutine
+    factory that reads the page from the database; concurrent misses share one read.
+    """
+    key = (current_version(), *variant)
+    page = _pages.get(key)
+    if page is not None:
+        return page
+
+    async def load():
+        page = await loader()
+        _pages.set(key, page)
+        return page
+
+    return await _page_flight.do(key, load)
+
+
+def stats() -> dict:
+    return {
+        "version": _version,
+        "pages": _pages.stats(),
+        "single_flight": _page_flight.stats(),
+    }
@@ -1,239 +1,155 @@
-from exponent_server_sdk import (
-    DeviceNotRegisteredError,
-    PushClient,
-    PushMessage,
-    PushServerError,
-)
-from database import get_supabase
+import asyncio
+import gzip
+import json
 import os
 
-# Initialize PushClient once
-push_client = PushClient()
+import httpx
+
+from database import get_async_supabase
+from metrics import track_call
+from services import push_tokens
+
+# Expo push API, called directly with a pooled async HTTP client so sends never block
+# the event loop. Messages are split into Expo's 100-per-request batches, which are
+# sent gzip-compressed, at most PUSH_MAX_PARALLEL_CHUNKS at a time.
+EXPO_PUSH_URL = os.getenv("EXPO_PUSH_URL", "https://exp.host/--/api/v2/push/send")
+EXPO_RECEIPTS_URL = os.getenv("EXPO_RECEIPTS_URL", "https://exp.host/--/api/v2/push/getReceipts")
+EXPO_ACCESS_TOKEN = os.getenv("EXPO_ACCESS_TOKEN")  # Only if push security is enabled for the project
+EXPO_BATCH_SIZE = 100
+# Expo accepts up to 1000 ticket ids per receipt request
+EXPO_RECEIPT_BATCH_SIZE = 1000
+PUSH_MAX_PARALLEL_CHUNKS = int(os.getenv("PUSH_MAX_PARALLEL_CHUNKS", "6"))
+PUSH_HTTP_TIMEOUT_SECONDS = float(os.getenv("PUSH_HTTP_TIMEOUT_SECONDS", "15"))
+
+_push_http_client: httpx.AsyncClient | None = None
+_stats = {"pruned_tokens": 0, "receipt_requests": 0}
+
+
+def _get_push_http_client() -> httpx.AsyncClient:
+    global _push_http_client
+    if _push_http_client is None:
+        headers = {
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        }
+        if EXPO_ACCESS_TOKEN:
+            headers["Authorization"] = f"Bearer {EXPO_ACCESS_TOKEN}"
+        _push_http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=PUSH_HTTP_TIMEOUT_SECONDS,
+            headers=headers,
+            limits=httpx.Limits(max_connections=PUSH_MAX_PARALLEL_CHUNKS, max_keepalive_connections=PUSH_MAX_PARALLEL_CHUNKS),
+        )
+    return _push_http_client
 
 
-def _is_valid_expo_push_token(token: str) -> bool:
-    if not token:
-        return False
-    return token.startswith("ExponentPushToken[") or token.startswith("ExpoPushToken[")
+async def close_push_client():
+    """Close the Expo connection pool (called on app shutdown)."""
+    global _push_http_client
+    if _push_http_client is not None:
+        await _push_http_client.aclose()
+    _push_http_client = None
 
 
-def send_push_notification(push_token: str, title: str, body: str, data: dict = None):
-    """
-    Send a push notification to a single device.
-    """
-    if not _is_valid_expo_push_token(push_token):
-        print(f"[PUSH] Invalid or missing Expo push token: {push_token}")
-        return None
-    
-    try:
-        print(f"[PUSH] Sending to token: {push_token[:40]}...")
-        print(f"[PUSH] Title: {title}")
-        
-        response = push_client.publish(
-            PushMessage(
-                to=push_token,
-                title=title,
-                body=body,
-                data=data or {},
-                sound="default",
-                badge=1,
-                channel_id="substitute-requests",
-            )
-        )
-        print(f"[PUSH] Response: {response}")
-        return response
-    except DeviceNotRegisteredError:
-        print(f"[PUSH] Device not registered - token may be expired: {push_token[:30]}...")
-        return None
-    except PushServerError as e:
-        print(f"[PUSH] Server error: {e}")
-        return None
-    except Exception as e:
-        print(f"[PUSH] Error sending notification: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+def _build_message(push_token: str, title: str, body: str, data: dict = None) -> dict:
+    return {
+        "to": push_token,
+        "title": title,
+        "body": body,
+        "data": data or {},
+        "sound": "default",
+        "badge": 1,
+        "channelId": "substitute-requests",
+    }
 
 
-def send_push_to_multiple(push_tokens: list, title: str, body: str, data: dict = None):
-    """Send push notification to multiple devices."""
-    if not push_tokens:
-        return []
-    
-    # Filter non-empty tokens
-    valid_tokens = [t for t in push_tokens if _is_valid_expo_push_token(t)]
-    
-    if not valid_tokens:
-        print(f"[PUSH] No valid tokens in list of {len(push_tokens)}")
-        return []
-    
-    messages = [
-        PushMessage(
-            to=token,
-            title=title,
-            body=body,
-            data=data or {},
-            sound="default",
-            badge=1,
-            channel_id="substitute-requests",
-        )
-        for token in valid_tokens
-    ]
-    
+async def _send_chunk(messages: list[dict]) -> list[dict]:
+    """POST one batch; returns one ticket per message ({"status": "ok" | "error", ...})."""
+    payload = gzip.compress(json.dumps(messages).encode())
     try:
-        print(f"[PUSH] Sending to {len(messages)} devices")
-        print(f"[PUSH] Title: {title}")
-        responses = push_client.publish_multiple(messages)
-        print(f"[PUSH] Sent {len(responses)} notifications successfully")
-        return responses
-    except Exception as e:
-        print(f"[PUSH] Batch send error: {e}")
-        import traceback
-        traceback.print_exc()
+        with track_call("push"):
+            response = await _get_push_http_client().post(EXPO_PUSH_URL, content=payload)
+        body = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"[PUSH] Batch of {len(messages)} failed: {e}")
+        return [{"status": "error", "message": str(e)} for _ in messages]
+
+    tickets = body.get("data") if isinstance(body, dict) else None
+    if response.status_code != 200 or not isinstance(tickets, list) or len(tickets) != len(messages):
+        errors = body.get("errors") if isinstance(body, dict) else body
+        print(f"[PUSH] Batch of {len(messages)} rejected ({response.status_code}): {errors}")
+        return [{"status": "error", "message": f"HTTP {response.status_code}: {errors}"} for _ in messages]
+    return tickets
+
+
+async def send_push_messages(messages: list[dict]) -> list[dict]:
+    """Send messages in Expo-sized batches, a few batches in parallel; tickets come back in order."""
+    if not messages:
         return []
-
-
-async def notify_all_faculty_except(exclude_user_id: int, title: str, body: str, data: dict = None):
+    chunks = [messages[index:index + EXPO_BATCH_SIZE] for index in range(0, len(messages), EXPO_BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(PUSH_MAX_PARALLEL_CHUNKS)
+
+    async def send(chunk):
+        async with semaphore:
+            return await _send_chunk(chunk)
+
+    results = await asyncio.gather(*(send(chunk) for chunk in chunks))
+    tickets = [ticket for chunk_tickets in results for ticket in chunk_tickets]
+    unregistered = []
+    for message, ticket in zip(messages, tickets):
+        if ticket.get("status") != "ok":
+            error = (ticket.get("details") or {}).get("error") or ticket.get("message")
+            print(f"[PUSH] Not delivered to {str(message['to'])[:30]}...: {error}")
+            if error == "DeviceNotRegistered":
+                unregistered.append(message["to"])
+    if unregistered:
+        await prune_push_tokens(unregistered)
+    return tickets
+
+
+async def fetch_push_receipts(ticket_ids: list[str]) -> dict[str, dict]:
     """
-    Send notification to all faculty EXCEPT the specified user.
-    Used when a new request is created.
+    Look up the receipts of earlier sends, keyed by ticket id. Receipts appear a few
+    minutes after sending and are kept for about a day; ids without one yet are left out.
     """
-    supabase = get_supabase()
-    
-    try:
-        # Get all users except the creator
-        result = supabase.table("users")\
-            .select("id, name, push_token")\
-            .neq("id", exclude_user_id)\
-            .execute()
-        
-        print(f"[PUSH] Checking {len(result.data)} users for push tokens...")
-        
-        # Collect tokens from users who have them
-        tokens = []
-        for user in result.data:
-            token = user.get("push_token")
-            if _is_valid_expo_push_token(token):
-                tokens.append(token)
-                print(f"[PUSH] Will notify: {user['name']} (ID: {user['id']}) - Token: {token[:30]}...")
-            else:
-                print(f"[PUSH] Skipping: {user['name']} (ID: {user['id']}) - No token")
-        
-        if tokens:
-            print(f"[PUSH] Sending to {len(tokens)} faculty members")
-            send_push_to_multiple(tokens, title, body, data)
-        else:
-            print(f"[PUSH] No faculty with push tokens to notify")
-            
-    except Exception as e:
-        print(f"[PUSH] Error in notify_all_faculty_except: {e}")
-        import traceback
-        traceback.print_exc()
-
-
-async def notify_faculty_by_ids(user_ids: list[int], title: str, body: str, data: dict = None):
+    receipts = {}
+    for index in range(0, len(ticket_ids), EXPO_RECEIPT_BATCH_SIZE):
+        chunk = ticket_ids[index:index + EXPO_RECEIPT_BATCH_SIZE]
+        payload = gzip.compress(json.dumps({"ids": chunk}).encode())
+        _stats["receipt_requests"] += 1
+        with track_call("push"):
+            response = await _get_push_http_client().post(EXPO_RECEIPTS_URL, content=payload)
+        body = response.json()
+        if response.status_code != 200 or not isinstance(body.get("data"), dict):
+            raise RuntimeError(f"Receipt request failed ({response.status_code}): {body.get('errors')}")
+        receipts.update(body["data"])
+    return receipts
+
+
+async def prune_push_tokens(unregistered_tokens: list[str]) -> int:
     """
-    Send notification to a specific list of faculty user IDs.
-    Used for availability-filtered request notifications.
+    Forget tokens Expo reports as DeviceNotRegistered (app uninstalled or token
+    rotated), so later fan-outs skip them. The app registers a fresh token on next login.
     """
-    if not user_ids:
-        print("[PUSH] No recipient user IDs provided")
-        return
-
-    supabase = get_supabase()
-
+    supabase = await get_async_supabase()
+    # Stop using them right away, even if the database write below fails
+    push_tokens.directory.forget_tokens(unregistered_tokens)
     try:
-        result = supabase.table("users")\
-            .select("id, name, push_token")\
-            .in_("id", user_ids)\
+        result = await supabase.table("users")\
+            .update({"push_token": None})\
+            .in_("push_token", list(set(unregistered_tokens)))\
             .execute()
-
-        print(f"[PUSH] Checking {len(result.data)} targeted users for push tokens...")
-
-        tokens = []
-        for user in result.data:
-            token = user.get("push_token")
-            if _is_valid_expo_push_token(token):
-                tokens.append(token)
-                print(f"[PUSH] Will notify: {user['name']} (ID: {user['id']}) - Token: {token[:30]}...")
-            else:
-                print(f"[PUSH] Skipping: {user['name']} (ID: {user['id']}) - No token")
-
-        if tokens:
-            print(f"[PUSH] Sending to {len(tokens)} targeted faculty members")
-            send_push_to_multiple(tokens, title, body, data)
-        else:
-            print("[PUSH] No targeted faculty with valid push tokens")
-
-    except Exception as e:
-        print(f"[PUSH] Error in notify_faculty_by_ids: {e}")
-        import traceback
-        traceback.print_exc()
-
-
-async def notify_user(user_id: int, title: str, body: str, data: dict = None):
-    """
-    Send notification to a specific user.
-    Used when someone accepts/cancels a request.
-    """
-    supabase = get_supabase()
-    
-    try:
-        result = supabase.table("users")\
-            .select("name, push_token")\
-            .eq("id", user_id)\
-            .execute()
-        
-        if not result.data:
-            print(f"[PUSH] User {user_id} not found")
-            return
-        
-        user = result.data[0]
-        token = user.get("push_token")
-        
-        if _is_valid_expo_push_token(token):
-            print(f"[PUSH] Notifying user: {user['name']} (ID: {user_id})")
-            print(f"[PUSH] Token: {token[:30]}...")
-            send_push_notification(token, title, body, data)
-        else:
-            print(f"[PUSH] User {user['name']} (ID: {user_id}) has no push token")
-            
     except Exception as e:
-        print(f"[PUSH] Error in notify_user: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"[PUSH] Could not prune {len(unregistered_tokens)} unregistered tokens: {e}")
+        return 0
+    pruned = len(result.data or [])
+    _stats["pruned_tokens"] += pruned
+    if pruned:
+        print(f"[PUSH] Pruned {pruned} unregistered push tokens")
+    return pruned
 
 
-async def notify_faculty_by_ids(user_ids: list[int], title: str, body: str, data: dict = None):
-    """
-    Send notification to specific faculty ids.
-    """
-    if not user_ids:
-        print("[PUSH] No faculty ids provided for targeted notification")
-        return
-
-    supabase = get_supabase()
-
-    try:
-        result = (
-            supabase.table("users")
-            .select("id, name, push_token")
-            .in_("id", user_ids)
-            .execute()
-        )
-
-        tokens = []
-        for user in result.data:
-            token = user.get("push_token")
-            if _is_valid_expo_push_token(token):
-                tokens.append(token)
-                print(f"[PUSH] Target notify: {user['name']} (ID: {user['id']})")
-
-        if tokens:
-            send_push_to_multiple(tokens, title, body, data)
-        else:
-            print("[PUSH] No valid push tokens found for targeted faculty list")
-    except Exception as e:
-        print(f"[PUSH] Error in notify_faculty_by_ids: {e}")
-        import traceback
-        traceback.print_exc()
+def stats() -> dict:
+    return dict(_stats)
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import time
+
+from database import get_async_supabase
+
+# In-process directory of the Expo push token of every faculty member who has one,
+# with a department index, so notification fan-out resolves recipients without
+# querying users. It is loaded on first use (and at startup) and kept current by the
+# push token routes, profile updates, user deletion and the pruning of tokens Expo
+# reports as unregistered. It is reloaded after PUSH_TOKEN_DIRECTORY_TTL_SECONDS to
+# pick up writes made outside this process.
+PUSH_TOKEN_DIRECTORY_ENABLED = os.getenv("PUSH_TOKEN_DIRECTORY", "true").lower() in ("1", "true", "yes")
+PUSH_TOKEN_DIRECTORY_TTL_SECONDS = float(os.getenv("PUSH_TOKEN_DIRECTORY_TTL_SECONDS", "600"))
+
+_PAGE_SIZE = 1000
+# A load that races with this many writes in a row is used as-is and retried on the next call
+_MAX_LOAD_ATTEMPTS = 3
+
+
+def _is_valid_expo_push_token(token: str) -> bool:
+    if not token:
+        return False
+    return token.startswith("ExponentPushToken[") or token.startswith("ExpoPushToken[")
+
+
+class PushTokenDirectory:
+    def __init__(self):
+        self._tokens: dict[int, str] = {}
+        self._departments: dict[int, str | None] = {}
+        self._by_department: dict[str, set[int]] = {}
+        self._loaded_at: float | None = None
+        # Bumped on every write so a load that overlapped one can be detected
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self.loads = 0
+        self.lookups = 0
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < PUSH_TOKEN_DIRECTORY_TTL_SECONDS
+
+    async def ensure_loaded(self, loader):
+        """
+        Load the directory if it is missing or expired. `loader` is a zero-arg coroutine
+        factory returning user rows (id, department, push_token); concurrent callers share one load.
+        """
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            for _ in range(_MAX_LOAD_ATTEMPTS):
+                generation = self._generation
+                rows = await loader()
+                self._tokens, self._departments, self._by_department = {}, {}, {}
+                for row in rows:
+                    self._put(row["id"], row.get("push_token"), row.get("department"))
+                self.loads += 1
+                if generation == self._generation:
+                    self._loaded_at = time.monotonic()
+                    return
+            # Kept writing while we loaded: serve this snapshot once, reload next time
+            self._loaded_at = None
+
+    def _put(self, user_id: int, token: str | None, department: str | None):
+        self._drop(user_id)
+        if not _is_valid_expo_push_token(token):
+            return
+        self._tokens[user_id] = token
+        self._departments[user_id] = department
+        if department is not None:
+            self._by_department.setdefault(department, set()).add(user_id)
+
+    def _drop(self, user_id: int):
+        self._tokens.pop(user_id, None)
+        department = self._departments.pop(user_id, None)
+        if department is not None:
+            members = self._by_department.get(department)
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del self._by_department[department]
+
+    def recipients(self, user_ids=None, department: str | None = None, exclude_user_id: int | None = None) -> list[dict]:
+        """Users with a valid token among `user_ids` / in `department` (everyone if neither is given)."""
+        self.lookups += 1
+        if user_ids is not None:
+            candidates = [user_id for user_id in user_ids if user_id in self._tokens]
+        elif department is not None:
+            candidates = sorted(self._by_department.get(department, ()))
+        else:
+            candidates = sorted(self._tokens)
+        if department is not None and user_ids is not None:
+            candidates = [user_id for user_id in candidates if self._departments.get(user_id) == department]
+        return [
+            {"id": user_id, "push_token": self._tokens[user_id]}
+            for user_id in candidates
+            if user_id != exclude_user_id
+        ]
+
+    def set_token(self, user_id: int, token: str | None, department: str | None):
+        self._generation += 1
+        self._put(user_id, token, department)
+
+    def set_department(self, user_id: int, department: str | None):
+        self._generation += 1
+        if user_id in self._tokens:
+            self._put(user_id, self._tokens[user_id], department)
+
+    def remove_user(self, user_id: int):
+        self._generation += 1
+        self._drop(user_id)
+
+    def forget_tokens(self, tokens: list[str]):
+        self._generation += 1
+        tokens = set(tokens)
+        for user_id in [user_id for user_id, token in self._tokens.items() if token in tokens]:
+            self._drop(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": PUSH_TOKEN_DIRECTORY_ENABLED,
+            "loaded": self._loaded_at is not None,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "tokens": len(self._tokens),
+            "departments": len(self._by_department),
+            "loads": self.loads,
+            "lookups": self.lookups,
+        }
+
+
+directory = PushTokenDirectory()
+
+
+async def load_users() -> list[dict]:
+    """Every user's id, department and push token, read in id-ordered pages."""
+    supabase = await get_async_supabase()
+    rows, last_id = [], 0
+    while True:
+        result = await supabase.table("users")\
+            .select("id, department, push_token")\
+            .gt("id", last_id)\
+            .order("id")\
+            .limit(_PAGE_SIZE)\
+            .execute()
+        page = result.data or []
+        rows.extend(page)
+        if len(page) < _PAGE_SIZE:
+            return rows
+        last_id = page[-1]["id"]
+
+
+async def lookup(user_ids=None, department: str | None = None, exclude_user_id: int | None = None) -> list[dict]:
+    """Recipients ({"id", "push_token"}) from the directory, or from users when it is turned off."""
+    if user_ids is not None and not user_ids:
+        return []
+    if PUSH_TOKEN_DIRECTORY_ENABLED:
+        await directory.ensure_loaded(load_users)
+        return directory.recipients(user_ids, department, exclude_user_id)
+
+    supabase = await get_async_supabase()
+    query = supabase.table("users").select("id, push_token")
+    if user_ids is not None:
+        query = query.in_("id", list(user_ids))
+    if department is not None:
+        query = query.eq("department", department)
+    if exclude_user_id is not None:
+        query = query.neq("id", exclude_user_id)
+    result = await query.execute()
+    return [
+        {"id": user["id"], "push_token": user["push_token"]}
+        for user in (result.data or [])
+        if _is_valid_expo_push_token(user.get("push_token"))
+    ]
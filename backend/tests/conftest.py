@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+# Run against the SQLite stand-in with locally verified HS256 user tokens
+os.environ["DATA_BACKEND"] = "local"
+os.environ["LOCAL_DB_PATH"] = ":memory:"
+os.environ["SUPABASE_URL"] = ""
+os.environ["SUPABASE_JWT_SECRET"] = "test-secret-with-at-least-32-bytes!!"
+os.environ["SUPABASE_TOKEN_VERIFY_MODE"] = "local"
+os.environ["SUPABASE_TOKEN_REMOTE_FALLBACK"] = "false"
+os.environ.pop("LOCAL_DB_FIXTURES", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+import pytest
+
+import database
+from middleware import auth
+from services import availability, pending_feed, push_tokens
+
+
+def make_user_token(email: str) -> str:
+    return jwt.encode(
+        {"sub": email, "email": email, "aud": "authenticated", "exp": int(time.time()) + 3600},
+        os.environ["SUPABASE_JWT_SECRET"],
+        algorithm="HS256",
+    )
+
+
+def make_admin_token(admin_id: int = 1, role: str = "super_admin") -> str:
+    return jwt.encode(
+        {"id": admin_id, "admin_id": "root", "role": role, "type": "admin", "exp": int(time.time()) + 3600},
+        os.environ["SUPABASE_JWT_SECRET"],
+        algorithm="HS256",
+    )
+
+
+@pytest.fixture
+def store():
+    """A fresh in-memory store, with the in-process caches and indexes reset."""
+    database.local_store = None
+    auth._principal_cache.clear()
+    auth._token_cache.clear()
+    availability.index = availability.AvailabilityIndex()
+    push_tokens.directory = push_tokens.PushTokenDirectory()
+    pending_feed.mark_changed()
+    return database.get_local_store()
+
+
+@pytest.fixture
+def client(store):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,134 @@
+import asyncio
+from datetime import date, time
+
+import pytest
+
+from routes import requests as request_routes
+from routes import users as user_routes
+from services import availability
+from tests.conftest import make_admin_token, make_user_token
+
+# A Monday, so weekly slots on day 0 also block it
+REQUEST_DATE = date(2026, 11, 2)
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _free_at_ten() -> list[int]:
+    return availability.index.free_faculty(REQUEST_DATE, time(10, 0), time(11, 0))
+
+
+@pytest.fixture
+def faculty(store):
+    asyncio.run(store.table("users").insert([
+        {"name": "Owner", "email": "owner@kiit.ac.in"},
+        {"name": "Sub", "email": "sub@kiit.ac.in"},
+        {"name": "Other", "email": "other@kiit.ac.in"},
+    ]).execute())
+    asyncio.run(availability.index.ensure_loaded(request_routes._load_availability_index))
+    return {"owner": 1, "sub": 2, "other": 3}
+
+
+def _create(client) -> int:
+    response = client.post(
+        "/api/requests/",
+        json={
+            "teacher_id": 1,
+            "subject": "Maths",
+            "classroom": "C1",
+            "date": REQUEST_DATE.isoformat(),
+            "time": "10:00",
+            "duration": 60,
+        },
+        headers=_auth(make_user_token("owner@kiit.ac.in")),
+    )
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def _accept(client, request_id: int):
+    response = client.put(
+        f"/api/requests/{request_id}/accept",
+        json={"teacher_id": 2},
+        headers=_auth(make_user_token("sub@kiit.ac.in")),
+    )
+    assert response.status_code == 200
+
+
+def test_create_leaves_everyone_free(client, faculty):
+    _create(client)
+    assert _free_at_ten() == [1, 2, 3]
+
+
+def test_accept_marks_substitute_busy(client, faculty):
+    _accept(client, _create(client))
+    assert _free_at_ten() == [1, 3]
+    # One-off slot only blocks the request's date
+    assert availability.index.free_faculty(date(2026, 11, 9), time(10, 0), time(11, 0)) == [1, 2, 3]
+
+
+def test_cancel_frees_substitute(client, faculty):
+    request_id = _create(client)
+    _accept(client, request_id)
+    response = client.put(
+        f"/api/requests/{request_id}/cancel",
+        json={"teacher_id": 1},
+        headers=_auth(make_user_token("owner@kiit.ac.in")),
+    )
+    assert response.status_code == 200
+    assert _free_at_ten() == [1, 2, 3]
+
+
+@pytest.mark.parametrize("as_admin", [False, True])
+def test_delete_frees_substitute(client, faculty, as_admin):
+    request_id = _create(client)
+    _accept(client, request_id)
+    if as_admin:
+        response = client.delete(f"/api/requests/{request_id}", headers=_auth(make_admin_token()))
+    else:
+        response = client.delete(
+            f"/api/requests/{request_id}",
+            params={"teacher_id": 1},
+            headers=_auth(make_user_token("owner@kiit.ac.in")),
+        )
+    assert response.status_code == 200
+    assert _free_at_ten() == [1, 2, 3]
+
+
+def test_table_lookup_without_index(client, faculty, monkeypatch):
+    monkeypatch.setattr(availability, "AVAILABILITY_INDEX_ENABLED", False)
+    _accept(client, _create(client))
+    request = {"date": REQUEST_DATE.isoformat(), "time": "10:30", "duration": 60}
+    assert asyncio.run(request_routes._get_available_faculty_ids(1, request)) == [3]
+    # The local store has no database functions; that is not a missing install
+    assert request_routes._free_faculty_rpc_missing is False
+
+
+def test_deleting_owner_frees_substitute(client, faculty):
+    _accept(client, _create(client))
+    response = client.delete("/api/users/1", headers=_auth(make_admin_token()))
+    assert response.status_code == 200
+    assert _free_at_ten() == [2, 3]
+
+
+def test_failed_schedule_upload_reloads_index(client, store, faculty, monkeypatch):
+    asyncio.run(store.table("teacher_class_schedules").insert(
+        {"teacher_id": 2, "day_of_week": 0, "start_time": "10:00", "end_time": "11:00"}
+    ).execute())
+    availability.index.add_slot(2, {"day_of_week": 0, "start_time": "10:00", "end_time": "11:00"})
+    # The old schedule is deleted, then the insert trips the start_time < end_time check
+    monkeypatch.setattr(user_routes, "_extract_schedule_rows", lambda upload_file: [
+        {"day_of_week": 0, "start_time": "12:00", "end_time": "11:00"},
+    ])
+    response = client.post(
+        "/api/users/2/class-schedule/upload",
+        files={"schedule_file": ("schedule.xlsx", b"", "application/octet-stream")},
+        headers=_auth(make_user_token("sub@kiit.ac.in")),
+    )
+    assert response.status_code == 400
+    assert availability.index.stats()["loaded"] is False
+
+    asyncio.run(availability.index.ensure_loaded(request_routes._load_availability_index))
+    assert _free_at_ten() == [1, 2, 3]
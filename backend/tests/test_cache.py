@@ -0,0 +1,75 @@
+import asyncio
+
+from services.cache import SingleFlight, TTLCache
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+    cache.set("d", 4, ttl=0)
+    assert cache.get("d") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["value"] * 5
+    assert len(calls) == 1
+
+
+def test_single_flight_leader_cancellation_does_not_fail_followers():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        leader = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.do("key", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(leader, *followers, return_exceptions=True)
+
+    leader_result, *follower_results = asyncio.run(run())
+    assert isinstance(leader_result, asyncio.CancelledError)
+    # One follower took over and the others shared its result
+    assert follower_results == [2, 2, 2]
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_single_flight_cancelled_follower_leaves_leader_running():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def run():
+        leader = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    leader_result, follower_result = asyncio.run(run())
+    assert leader_result == "value"
+    assert isinstance(follower_result, asyncio.CancelledError)
@@ -0,0 +1,115 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from routes import requests as request_routes
+from tests.conftest import make_admin_token, make_user_token
+
+
+def _insert(store, table: str, rows: list[dict]) -> list[dict]:
+    return asyncio.run(store.table(table).insert(rows).execute()).data
+
+
+def _cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+@pytest.fixture
+def seeded(store):
+    _insert(store, "users", [
+        {"name": "A", "email": "a@kiit.ac.in"},
+        {"name": "B", "email": "b@kiit.ac.in"},
+    ])
+    rows = [
+        {"teacher_id": 1, "subject": "Maths", "classroom": "C1", "date": date, "time": time, "duration": 60, "status": status}
+        for date, time, status in [
+            ("2026-11-03", "10:00", "pending"),
+            ("2026-11-02", "09:00", "pending"),
+            ("2026-11-02", "09:00", "pending"),
+            ("2026-11-02", "11:00", "accepted"),
+            ("2026-11-04", "08:00", "pending"),
+            ("2026-11-01", "14:00", "pending"),
+            ("2026-11-02", "13:00", "pending"),
+        ]
+    ]
+    return _insert(store, "substitute_requests", rows)
+
+
+def _walk(client, path: str, token: str, limit: int) -> list[int]:
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(path, params=params, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        ids.extend(row["id"] for row in response.json())
+        cursor = response.headers.get(request_routes.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return ids
+
+
+def test_pending_feed_cursor_round_trip(client, seeded):
+    ids = _walk(client, "/api/requests/", make_user_token("b@kiit.ac.in"), limit=2)
+    expected = sorted(
+        (row for row in seeded if row["status"] == "pending"),
+        key=lambda row: (row["date"], row["time"], row["id"]),
+    )
+    assert ids == [row["id"] for row in expected]
+
+
+def test_all_requests_cursor_round_trip(client, seeded):
+    ids = _walk(client, "/api/requests/all", make_admin_token(), limit=3)
+    assert sorted(ids) == sorted(row["id"] for row in seeded)
+    assert len(ids) == len(set(ids))
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    _cursor(["2026-11-02", "09:00"]),
+    _cursor(["2026-11-02", "09:00", "3"]),
+    _cursor(["02/11/2026", "09:00", 3]),
+    _cursor(["2026-11-02", "09:00", True]),
+    _cursor([None, "09:00", 3]),
+    _cursor({"date": "2026-11-02"}),
+])
+def test_tampered_pending_cursor_is_rejected(client, seeded, cursor):
+    response = client.get(
+        "/api/requests/",
+        params={"cursor": cursor},
+        headers={"Authorization": f"Bearer {make_user_token('b@kiit.ac.in')}"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_tampered_changes_cursor_is_rejected(client, seeded):
+    response = client.get(
+        "/api/requests/changes",
+        params={"since": _cursor(["yesterday", 1, "2026-11-01T00:00:00+00:00", 0])},
+        headers={"Authorization": f"Bearer {make_user_token('b@kiit.ac.in')}"},
+    )
+    assert response.status_code == 400
+
+
+def test_changes_cursor_round_trip_reports_deletions(client, store, seeded, monkeypatch):
+    monkeypatch.setattr(request_routes, "CHANGES_SETTLE_SECONDS", 0)
+    headers = {"Authorization": f"Bearer {make_user_token('b@kiit.ac.in')}"}
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"since": cursor} if cursor else {})}
+        body = client.get("/api/requests/changes", params=params, headers=headers).json()
+        seen.extend(change["id"] for change in body["changes"])
+        cursor = body["cursor"]
+        if not body["has_more"]:
+            break
+    assert sorted(seen) == sorted(row["id"] for row in seeded)
+
+    deleted_id = seeded[0]["id"]
+    asyncio.run(store.table("substitute_requests").delete().eq("id", deleted_id).execute())
+    body = client.get("/api/requests/changes", params={"since": cursor}, headers=headers).json()
+    assert [tombstone["id"] for tombstone in body["deleted"]] == [deleted_id]
+    assert body["changes"] == []
@@ -0,0 +1,44 @@
+import asyncio
+from datetime import date, datetime, time, timezone
+
+from database import _pg_value, get_pg_pool
+from routes import requests as request_routes
+from tests.conftest import make_user_token
+
+
+def test_local_backend_has_no_pg_pool(store):
+    assert asyncio.run(get_pg_pool()) is None
+
+
+def test_pg_values_match_postgrest_json():
+    assert _pg_value(datetime(2026, 11, 2, 10, 0, tzinfo=timezone.utc)) == "2026-11-02T10:00:00+00:00"
+    assert _pg_value(date(2026, 11, 2)) == "2026-11-02"
+    assert _pg_value(time(10, 30)) == "10:30:00"
+    assert _pg_value(7) == 7
+
+
+def test_accept_conflict_checks_fall_back_to_postgrest(client, store):
+    asyncio.run(store.table("users").insert([
+        {"name": "Owner", "email": "owner@kiit.ac.in"},
+        {"name": "Sub", "email": "sub@kiit.ac.in"},
+    ]).execute())
+    owner = {"Authorization": f"Bearer {make_user_token('owner@kiit.ac.in')}"}
+    sub = {"Authorization": f"Bearer {make_user_token('sub@kiit.ac.in')}"}
+    request_ids = [
+        client.post(
+            "/api/requests/",
+            json={"teacher_id": 1, "subject": subject, "classroom": "C1", "date": "2026-11-02", "time": start, "duration": 60},
+            headers=owner,
+        ).json()["id"]
+        for subject, start in [("Maths", "10:00"), ("Physics", "10:30")]
+    ]
+
+    assert client.put(f"/api/requests/{request_ids[0]}/accept", json={"teacher_id": 2}, headers=sub).status_code == 200
+    response = client.put(f"/api/requests/{request_ids[1]}/accept", json={"teacher_id": 2}, headers=sub)
+    assert response.status_code == 409
+
+    # Served by the separate queries, not by treating the local store as a missing install
+    assert request_routes._accept_rpc_missing is False
+
+    schedule = client.get("/api/users/2/class-schedule", headers=sub).json()
+    assert [(slot["start_time"], slot["substitute_request_id"]) for slot in schedule] == [("10:00:00", request_ids[0])]
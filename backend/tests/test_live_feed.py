@@ -0,0 +1,44 @@
+import asyncio
+
+from services import live_feed
+from services.live_feed import LiveFeedHub
+from tests.conftest import make_user_token
+
+
+def test_unstarted_stream_holds_no_slot():
+    hub = LiveFeedHub()
+    hub.stream(1)
+    assert hub.stats()["subscribers"] == 0
+
+
+def test_stream_registers_while_running_and_releases_on_close():
+    hub = LiveFeedHub()
+
+    async def scenario():
+        stream = hub.stream(1, accepts=lambda event, request: request["id"] != 2)
+        assert await anext(stream) == "retry: 5000\n\n"
+        assert hub.stats()["subscribers"] == 1
+        hub.publish("request_created", {"id": 2})
+        hub.publish("request_created", {"id": 3})
+        message = await anext(stream)
+        await stream.aclose()
+        return message
+
+    assert asyncio.run(scenario()) == 'id: 2\nevent: request_created\ndata: {"id": 3}\n\n'
+    assert hub.stats()["subscribers"] == 0
+
+
+def test_full_hub_ends_the_stream(monkeypatch):
+    monkeypatch.setattr(live_feed, "LIVE_FEED_MAX_SUBSCRIBERS", 0)
+
+    async def scenario():
+        return [chunk async for chunk in LiveFeedHub().stream(1)]
+
+    assert asyncio.run(scenario()) == ["event: full\ndata: {}\n\n"]
+
+
+def test_full_hub_answers_503(client, store, monkeypatch):
+    asyncio.run(store.table("users").insert({"name": "A", "email": "a@kiit.ac.in"}).execute())
+    monkeypatch.setattr(live_feed, "LIVE_FEED_MAX_SUBSCRIBERS", 0)
+    response = client.get("/api/requests/stream", headers={"Authorization": f"Bearer {make_user_token('a@kiit.ac.in')}"})
+    assert response.status_code == 503
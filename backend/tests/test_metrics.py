@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+import metrics
+from tests.conftest import make_user_token
+
+HEADERS = {"Authorization": f"Bearer {make_user_token('owner@kiit.ac.in')}"}
+
+
+@pytest.fixture
+def strict_budget(store, monkeypatch):
+    asyncio.run(store.table("users").insert({"name": "Owner", "email": "owner@kiit.ac.in"}).execute())
+    monkeypatch.setattr(metrics, "QUERY_BUDGET_MODE", "raise")
+    monkeypatch.setattr(metrics, "QUERY_BUDGET_DEFAULT", 0)
+
+
+def test_over_budget_read_fails(client, strict_budget):
+    response = client.get("/api/requests/", headers=HEADERS)
+    assert response.status_code == 500
+    assert response.json()["detail"].startswith("Query budget exceeded")
+    assert response.headers["Server-Timing"].startswith("db;")
+
+
+def test_over_budget_write_is_only_logged(client, strict_budget):
+    response = client.post(
+        "/api/requests/",
+        json={"teacher_id": 1, "subject": "Maths", "classroom": "C1", "date": "2026-11-02", "time": "10:00", "duration": 60},
+        headers=HEADERS,
+    )
+    assert response.status_code == 201
@@ -0,0 +1,165 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+import pytest
+
+from services import outbox, push_notifications, push_tokens
+from tests.conftest import make_admin_token
+
+
+@pytest.fixture
+def expo(store, monkeypatch):
+    """Fake Expo push endpoint; set `expo.error` to have it reject every message with that error."""
+    class Expo:
+        sent: list[dict] = []
+        error: str | None = None
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        messages = json.loads(gzip.decompress(request.content))
+        Expo.sent.extend(messages)
+        if Expo.error:
+            tickets = [{"status": "error", "message": Expo.error, "details": {"error": Expo.error}} for _ in messages]
+        else:
+            tickets = [{"status": "ok", "id": f"ticket-{len(Expo.sent)}-{index}"} for index, _ in enumerate(messages)]
+        return httpx.Response(200, json={"data": tickets})
+
+    monkeypatch.setattr(push_notifications, "_push_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handle)))
+    # Tests drive the worker themselves
+    monkeypatch.setattr(outbox, "kick", lambda: None)
+    monkeypatch.setattr(outbox, "OUTBOX_COALESCE_WINDOW_SECONDS", 0)
+    asyncio.run(store.table("users").insert([
+        {"name": "Owner", "email": "owner@kiit.ac.in", "push_token": "ExponentPushToken[owner]"},
+        {"name": "Sub", "email": "sub@kiit.ac.in", "push_token": "ExponentPushToken[sub]"},
+        {"name": "Other", "email": "other@kiit.ac.in", "push_token": "ExponentPushToken[other]"},
+    ]).execute())
+    yield Expo
+    push_notifications._push_http_client = None
+
+
+def _rows(store, **filters) -> list[dict]:
+    query = store.table("notification_outbox").select("*").order("id")
+    for column, value in filters.items():
+        query = query.eq(column, value)
+    return asyncio.run(query.execute()).data
+
+
+def test_newer_notification_supersedes_waiting_one(store, expo):
+    async def scenario():
+        await outbox.enqueue({"type": "user", "user_id": 1}, "First", "body", coalesce_key="request:1", hold=True)
+        await outbox.enqueue({"type": "user", "user_id": 1}, "Second", "body", coalesce_key="request:1", hold=True)
+        await outbox.process_due()
+
+    asyncio.run(scenario())
+    assert [message["title"] for message in expo.sent] == ["Second"]
+    fanouts = _rows(store, kind="fanout")
+    assert [row["status"] for row in fanouts] == ["superseded", "sent"]
+
+
+def test_different_audiences_for_one_request_both_deliver(store, expo):
+    async def scenario():
+        await outbox.enqueue({"type": "users", "user_ids": [3, 2]}, "Updated", "body", coalesce_key="request:1", hold=True)
+        await outbox.enqueue({"type": "user", "user_id": 1}, "Accepted", "body", coalesce_key="request:1")
+        await outbox.process_due()
+
+    asyncio.run(scenario())
+    delivered = sorted((message["to"], message["title"]) for message in expo.sent)
+    assert delivered == [
+        ("ExponentPushToken[other]", "Updated"),
+        ("ExponentPushToken[owner]", "Accepted"),
+        ("ExponentPushToken[sub]", "Updated"),
+    ]
+    assert not _rows(store, status="superseded")
+
+
+def test_failed_push_is_retried_then_dead_lettered(store, expo, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    expo.error = "MessageRateExceeded"
+
+    async def first_attempt():
+        await outbox.enqueue({"type": "user", "user_id": 2}, "Title", "body")
+        await outbox.process_due()
+
+    asyncio.run(first_attempt())
+    [push] = _rows(store, kind="push")
+    assert (push["status"], push["attempts"], push["last_error"]) == ("pending", 1, "MessageRateExceeded")
+
+    async def retry():
+        # Skip the backoff
+        await store.table("notification_outbox").update({"next_attempt_at": outbox._now().isoformat()}).eq("id", push["id"]).execute()
+        await outbox.process_due()
+        return await outbox.dead_letters()
+
+    dead = asyncio.run(retry())
+    assert [(row["kind"], row["status"], row["attempts"]) for row in dead] == [("push", "dead", 2)]
+    assert len(expo.sent) == 2
+
+
+def test_unregistered_device_is_dead_lettered_at_once(store, expo):
+    expo.error = "DeviceNotRegistered"
+
+    async def scenario():
+        await outbox.enqueue({"type": "user", "user_id": 2}, "Title", "body")
+        await outbox.process_due()
+
+    asyncio.run(scenario())
+    [push] = _rows(store, kind="push")
+    assert (push["status"], push["attempts"]) == ("dead", 1)
+    [user] = asyncio.run(store.table("users").select("push_token").eq("id", 2).execute()).data
+    assert user["push_token"] is None
+
+
+def test_admin_notification_resolves_recipients_from_directory(client, store, expo):
+    asyncio.run(store.table("users").insert(
+        {"name": "Cse", "email": "cse@kiit.ac.in", "department": "CSE", "push_token": "ExponentPushToken[cse]"}
+    ).execute())
+    # Reload, as the app warmed the directory before this user existed
+    push_tokens.directory = push_tokens.PushTokenDirectory()
+    asyncio.run(push_tokens.directory.ensure_loaded(push_tokens.load_users))
+
+    response = client.post(
+        "/api/admin/notifications/send",
+        json={"title": "Meeting", "body": "body", "target_type": "department", "department": "CSE"},
+        headers={"Authorization": f"Bearer {make_admin_token()}"},
+    )
+    assert response.json()["sent_count"] == 1
+    # Only the outbox insert; no users query
+    assert response.headers["Server-Timing"].startswith('db;desc="1 calls"')
+
+    asyncio.run(outbox.process_due())
+    assert [message["to"] for message in expo.sent] == ["ExponentPushToken[cse]"]
+
+
+def test_fanout_expanded_again_adds_no_duplicate_pushes(store, expo):
+    async def scenario():
+        await outbox.enqueue({"type": "users", "user_ids": [2, 3]}, "Title", "body")
+        [fanout] = await outbox._claim(store, outbox._now())
+        # As if the worker died after expanding and the fanout's lease ran out
+        first = await outbox._expand(store, fanout, outbox._now())
+        second = await outbox._expand(store, fanout, outbox._now())
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert (len(first), second) == (2, [])
+    assert len(_rows(store, kind="push")) == 2
+
+
+def test_each_chunk_is_settled_when_it_is_sent(store, expo, monkeypatch):
+    monkeypatch.setattr(outbox, "EXPO_BATCH_SIZE", 1)
+
+    async def send_push_messages(messages):
+        if messages[0]["to"] == "ExponentPushToken[other]":
+            raise RuntimeError("worker lost")
+        return [{"status": "ok", "id": "ticket"}]
+
+    monkeypatch.setattr(outbox, "send_push_messages", send_push_messages)
+
+    async def scenario():
+        await outbox.enqueue({"type": "users", "user_ids": [2, 3]}, "Title", "body")
+        with pytest.raises(RuntimeError):
+            await outbox.process_due()
+
+    asyncio.run(scenario())
+    assert [row["status"] for row in _rows(store, kind="fanout")] == ["sent"]
+    assert [(row["user_id"], row["status"]) for row in _rows(store, kind="push")] == [(2, "sent"), (3, "sending")]
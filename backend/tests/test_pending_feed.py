@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from services import pending_feed
+from tests.conftest import make_user_token
+
+OWNER = {"Authorization": f"Bearer {make_user_token('owner@kiit.ac.in')}"}
+SUB = {"Authorization": f"Bearer {make_user_token('sub@kiit.ac.in')}"}
+
+
+@pytest.fixture
+def faculty(store):
+    asyncio.run(store.table("users").insert([
+        {"name": "Owner", "email": "owner@kiit.ac.in"},
+        {"name": "Sub", "email": "sub@kiit.ac.in"},
+    ]).execute())
+
+
+def _create(client, subject: str = "Maths") -> int:
+    response = client.post(
+        "/api/requests/",
+        json={"teacher_id": 1, "subject": subject, "classroom": "C1", "date": "2026-11-02", "time": "10:00", "duration": 60},
+        headers=OWNER,
+    )
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def _feed(client, etag: str | None = None):
+    headers = {**SUB, **({"If-None-Match": etag} if etag else {})}
+    return client.get("/api/requests/", headers=headers)
+
+
+def test_unchanged_feed_is_not_modified(client, faculty):
+    _create(client)
+    first = _feed(client)
+    assert first.status_code == 200
+    second = _feed(client, first.headers["ETag"])
+    assert second.status_code == 304
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_cached_page_is_shared_and_served_from_memory(client, faculty):
+    _create(client)
+    _feed(client)
+    hits = pending_feed.stats()["pages"]["hits"]
+    assert [row["subject"] for row in _feed(client).json()] == ["Maths"]
+    assert pending_feed.stats()["pages"]["hits"] == hits + 1
+
+
+def test_writes_invalidate_the_feed(client, faculty):
+    etag = _feed(client).headers["ETag"]
+
+    request_id = _create(client)
+    response = _feed(client, etag)
+    assert response.status_code == 200
+    assert [row["id"] for row in response.json()] == [request_id]
+
+    etag = response.headers["ETag"]
+    response = client.put(f"/api/requests/{request_id}", params={"teacher_id": 1}, json={"subject": "Physics"}, headers=OWNER)
+    assert response.status_code == 200
+    response = _feed(client, etag)
+    assert [row["subject"] for row in response.json()] == ["Physics"]
+
+    etag = response.headers["ETag"]
+    assert client.put(f"/api/requests/{request_id}/accept", json={"teacher_id": 2}, headers=SUB).status_code == 200
+    response = _feed(client, etag)
+    assert response.status_code == 200
+    assert response.json() == []
+
+    other_id = _create(client, "Chemistry")
+    assert [row["id"] for row in _feed(client).json()] == [other_id]
+    etag = _feed(client).headers["ETag"]
+    assert client.put(f"/api/requests/{other_id}/cancel", json={"teacher_id": 1}, headers=OWNER).status_code == 200
+    response = _feed(client, etag)
+    assert response.status_code == 200
+    assert response.json() == []
+
+    third_id = _create(client, "Biology")
+    assert [row["id"] for row in _feed(client).json()] == [third_id]
+    etag = _feed(client).headers["ETag"]
+    assert client.delete(f"/api/requests/{third_id}", params={"teacher_id": 1}, headers=OWNER).status_code == 200
+    response = _feed(client, etag)
+    assert response.status_code == 200
+    assert response.json() == []